@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Agent 上下文管理
+- 稳定前缀: 系统提示词 + 工具 schema + SOP 摘录，标记为可缓存 (provider 侧 prompt caching)
+- 滚动窗口: 按 token 预算保留最近的轮次，被挤出的轮次压缩进摘要
+- 用量统计: 每轮缓存命中 / 未命中的输入 token
+"""
+
+import json
+import hashlib
+from typing import Callable, Dict, List, Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数: 中日韩字符约 1 token/字，其余约 4 字符/token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if '　' <= ch <= '鿿' or '가' <= ch <= '힯')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def extractive_summary(messages: List[Dict], previous: str = "", max_chars: int = 200) -> str:
+    """默认摘要: 每条被挤出的消息保留开头一行，追加到已有摘要后"""
+    lines = [previous] if previous else []
+    for msg in messages:
+        first = " ".join(msg["content"].split())[:max_chars]
+        lines.append(f"- {msg['role']}: {first}")
+    return "\n".join(lines)
+
+
+class ContextManager:
+    """
+    Agent 对话上下文
+
+    build() 输出的消息:
+        [system 前缀 (cache=True)] + [system 早前摘要] + [首条任务] + [最近若干轮 (末条 cache=True)]
+    首条用户任务始终保留；超出预算时从最早的轮次开始挤出并写入摘要。
+    """
+
+    def __init__(self, token_budget: int = 60000, summary_budget: int = 2000,
+                 summarizer: Optional[Callable[[List[Dict], str], str]] = None, evict_to: float = 0.6):
+        self.token_budget = token_budget
+        self.evict_to = evict_to
+        self.summary_budget = summary_budget
+        self.summarizer = summarizer or extractive_summary
+        self.system_prompt = ""
+        self.tools = None
+        self.excerpts = []
+        self.task = None
+        self.turns = []
+        self.summary = ""
+        self.evicted = 0
+        self._prefix = None
+
+    # ========== 稳定前缀 ==========
+    def set_prefix(self, system_prompt: str = None, tools: List[Dict] = None, excerpts: List[str] = None):
+        """更新可缓存前缀，未传入的部分保持不变"""
+        if system_prompt is not None:
+            self.system_prompt = system_prompt
+        if tools is not None:
+            self.tools = tools
+        if excerpts is not None:
+            self.excerpts = list(excerpts)
+        self._prefix = None
+
+    @property
+    def prefix(self) -> str:
+        """系统提示词 + SOP 摘录 (工具 schema 单独随请求发送，但计入前缀 token)"""
+        if self._prefix is None:
+            parts = [self.system_prompt]
+            if self.excerpts:
+                parts.append("## 相关 SOP\n" + "\n\n".join(self.excerpts))
+            self._prefix = "\n\n".join(p for p in parts if p)
+        return self._prefix
+
+    @property
+    def prefix_hash(self) -> str:
+        tools = json.dumps(self.tools, sort_keys=True, ensure_ascii=False) if self.tools else ""
+        return hashlib.sha1((self.prefix + tools).encode('utf-8')).hexdigest()
+
+    def prefix_tokens(self) -> int:
+        tools = json.dumps(self.tools, ensure_ascii=False) if self.tools else ""
+        return estimate_tokens(self.prefix) + estimate_tokens(tools)
+
+    # ========== 滚动窗口 ==========
+    def reset(self, task: str):
+        """开始新任务"""
+        self.task = {"role": "user", "content": task}
+        self.turns = []
+        self.summary = ""
+        self.evicted = 0
+
+    def add(self, role: str, content: str):
+        """追加一条消息，相同角色的连续消息合并 (保持 user/assistant 交替)"""
+        if self.turns and self.turns[-1]["role"] == role:
+            self.turns[-1] = {"role": role, "content": self.turns[-1]["content"] + "\n\n" + content}
+        elif not self.turns and self.task and role == "user":
+            self.task = {"role": "user", "content": self.task["content"] + "\n\n" + content}
+        else:
+            self.turns.append({"role": role, "content": content})
+        self._enforce_budget()
+
+    def window_tokens(self) -> int:
+        return sum(estimate_tokens(m["content"]) for m in self.turns)
+
+    def _enforce_budget(self):
+        budget = self.token_budget - self.prefix_tokens() - estimate_tokens(self.summary)
+        if self.task:
+            budget -= estimate_tokens(self.task["content"])
+        if self.window_tokens() <= budget:
+            return
+        # 超出预算时一次挤到 evict_to 水位，减少摘要变化导致的缓存失效
+        # 至少保留最后一轮；成对挤出 assistant + user，保证窗口仍以 assistant 开头
+        evicted = []
+        while len(self.turns) > 2 and self.window_tokens() > budget * self.evict_to:
+            evicted.extend(self.turns[:2])
+            del self.turns[:2]
+        if not evicted:
+            return
+        self.evicted += len(evicted)
+        summary = self.summarizer(evicted, self.summary)
+        # 摘要本身也有上限，超出时丢掉最早的行
+        lines = summary.split("\n")
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_budget:
+            lines.pop(0)
+        self.summary = "\n".join(lines)
+
+    def build(self) -> List[Dict]:
+        """生成发给 LLM 的消息列表"""
+        messages = [{"role": "system", "content": self.prefix, "cache": True}]
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": f"[早前对话摘要 (已省略 {self.evicted} 条消息)]\n{self.summary}"
+            })
+        if self.task:
+            messages.append(dict(self.task))
+        messages.extend(dict(m) for m in self.turns)
+        # 对话尾部也打缓存断点，下一轮可以复用到这里为止的前缀
+        if len(messages) > 1:
+            messages[-1]["cache"] = True
+        return messages
+
+
+class UsageMeter:
+    """每轮输入 token 统计 (优先用 provider 返回的 usage，缺失时按缓存断点估算)"""
+
+    def __init__(self):
+        self.turns = []
+        self._last_key = None
+        self._last_messages = []
+        self._last_total = 0
+
+    def record(self, turn: int, messages: List[Dict], context: ContextManager,
+               usage: Optional[Dict] = None, latency_ms: float = None) -> Dict:
+        key = context.prefix_hash
+        current = [(m["role"], m["content"]) for m in messages]
+        total = context.prefix_tokens() + sum(estimate_tokens(c) for _, c in current[1:])
+
+        if usage and "input_tokens" in usage:
+            cached = usage.get("cache_read_input_tokens", 0) or 0
+            written = usage.get("cache_creation_input_tokens", 0) or 0
+            uncached = usage["input_tokens"] + written
+            source = "provider"
+        else:
+            # 断点在前缀和上一轮末尾: 上一轮整体是本轮的前缀则全部命中，否则只命中稳定前缀
+            if key != self._last_key:
+                cached = 0
+            elif current[:len(self._last_messages)] == self._last_messages:
+                cached = self._last_total
+            else:
+                cached = context.prefix_tokens()
+            written = total - cached
+            uncached = total - cached
+            source = "estimate"
+        self._last_key, self._last_messages, self._last_total = key, current, total
+
+        entry = {
+            "turn": turn,
+            "cached_input_tokens": cached,
+            "cache_write_tokens": written,
+            "uncached_input_tokens": uncached,
+            "output_tokens": (usage or {}).get("output_tokens"),
+            "latency_ms": latency_ms,
+            "source": source
+        }
+        self.turns.append(entry)
+        return entry
+
+    def totals(self) -> Dict:
+        cached = sum(t["cached_input_tokens"] for t in self.turns)
+        uncached = sum(t["uncached_input_tokens"] for t in self.turns)
+        total = cached + uncached
+        return {
+            "turns": len(self.turns),
+            "cached_input_tokens": cached,
+            "uncached_input_tokens": uncached,
+            "cache_hit_rate": round(cached / total, 3) if total else 0.0
+        }
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+价格预警规则引擎 - 按币种维护有序阈值索引
+每次价格更新用二分查找定位被触发的规则，耗时 O(log n + k)，与规则总数无关。
+
+规则为 dict (与 watches.json 中的监控项同构):
+    symbol      标的
+    direction   'above' / 'below'
+    target      目标价
+    pct         百分比规则: 相对 ref (缺省为首个价格) 涨/跌 pct% 触发，换算成目标价
+    trailing    跟踪规则: 从最高点回落 (below) / 从最低点反弹 (above) trailing% 触发
+    hysteresis  回差百分比: 触发后价格需回到 target 另一侧 hysteresis% 才重新布防 (缺省0，即再次穿越才触发)
+    cooldown    冷却秒数: 两次触发之间的最短间隔
+"""
+
+import time
+import heapq
+import bisect
+import itertools
+from collections import defaultdict
+
+
+class _ThresholdIndex:
+    """有序 (key, rule_id) 列表，只在两端批量弹出"""
+
+    def __init__(self):
+        self.keys = []
+        self.ids = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, rule_id):
+        i = bisect.bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.ids.insert(i, rule_id)
+
+    def remove(self, key, rule_id):
+        i = bisect.bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            if self.ids[i] == rule_id:
+                del self.keys[i], self.ids[i]
+                return True
+            i += 1
+        return False
+
+    def pop_below(self, value):
+        """弹出 key < value 的全部规则"""
+        i = bisect.bisect_left(self.keys, value)
+        ids = self.ids[:i]
+        del self.keys[:i], self.ids[:i]
+        return ids
+
+    def pop_above(self, value):
+        """弹出 key > value 的全部规则"""
+        i = bisect.bisect_right(self.keys, value)
+        ids = self.ids[i:]
+        del self.keys[i:], self.ids[i:]
+        return ids
+
+
+class _TrailingGroup:
+    """同一币种、同一方向、同一回撤比例的跟踪规则
+
+    统一换算成 x = price (below) / -price (above)，极值 ext = 布防以来 x 的最大值，
+    x <= ext * factor 时触发。新极值出现时所有 ext 更小的桶合并成一个桶，
+    因此每条规则被合并的次数有限，均摊 O(log n)。
+    """
+
+    def __init__(self, direction, trailing):
+        self.sign = 1 if direction == 'below' else -1
+        self.factor = 1 - trailing / 100 if direction == 'below' else 1 + trailing / 100
+        self.exts = []      # 升序
+        self.buckets = []   # 与 exts 对应的规则ID列表
+
+    def __len__(self):
+        return sum(len(b) for b in self.buckets)
+
+    def add(self, price, rule_id):
+        x = self.sign * price
+        i = bisect.bisect_left(self.exts, x)
+        if i < len(self.exts) and self.exts[i] == x:
+            self.buckets[i].append(rule_id)
+        else:
+            self.exts.insert(i, x)
+            self.buckets.insert(i, [rule_id])
+
+    def remove(self, rule_id):
+        for i, bucket in enumerate(self.buckets):
+            if rule_id in bucket:
+                bucket.remove(rule_id)
+                if not bucket:
+                    del self.exts[i], self.buckets[i]
+                return True
+        return False
+
+    def update(self, price):
+        """推进极值并返回触发的规则ID"""
+        x = self.sign * price
+        # 极值低于当前值的桶合并到当前值
+        i = bisect.bisect_left(self.exts, x)
+        if i:
+            merged = [rid for bucket in self.buckets[:i] for rid in bucket]
+            del self.exts[:i], self.buckets[:i]
+            if self.exts and self.exts[0] == x:
+                self.buckets[0].extend(merged)
+            else:
+                self.exts.insert(0, x)
+                self.buckets.insert(0, merged)
+        # ext * factor >= x 的桶触发
+        j = bisect.bisect_left(self.exts, x / self.factor)
+        fired = [rid for bucket in self.buckets[j:] for rid in bucket]
+        del self.exts[j:], self.buckets[j:]
+        return fired
+
+
+class AlertEngine:
+    """预警规则引擎"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.rules = {}
+        self.last_price = {}
+        self._above = defaultdict(_ThresholdIndex)     # 布防中: key = target，价格 > key 触发
+        self._below = defaultdict(_ThresholdIndex)     # 布防中: key = target，价格 < key 触发
+        self._rearm_above = defaultdict(_ThresholdIndex)  # 已触发的 above 规则: 价格 < key 重新布防
+        self._rearm_below = defaultdict(_ThresholdIndex)  # 已触发的 below 规则: 价格 > key 重新布防
+        self._trailing = defaultdict(dict)             # symbol -> {(direction, trailing): _TrailingGroup}
+        self._pending = defaultdict(list)              # symbol -> 等待引用价的百分比规则
+        self._cooling = []                             # (可布防时间, 序号, rule_id) 小顶堆
+        self._cooling_seq = itertools.count()          # 同一时间到期时按入堆顺序，不比较 rule_id
+        self._state = {}                               # rule_id -> 'armed' / 'fired' / 'cooling' / 'pending'
+        self._next_id = 0
+
+    # ========== 规则管理 ==========
+    def add(self, rule, rule_id=None):
+        """添加规则，返回规则ID"""
+        if rule_id is None:
+            rule_id = rule.get('id')
+        if rule_id is None:
+            rule_id = self._next_id
+            self._next_id += 1
+        rule = dict(rule, symbol=rule['symbol'].upper())
+        self.rules[rule_id] = rule
+        symbol = rule['symbol']
+        if 'pct' in rule and 'target' not in rule:
+            ref = rule.get('ref', self.last_price.get(symbol))
+            if ref is None:
+                self._pending[symbol].append(rule_id)
+                self._state[rule_id] = 'pending'
+                return rule_id
+            self._set_pct_target(rule, ref)
+        self._arm(rule_id)
+        return rule_id
+
+    def load(self, rules):
+        """用一组规则重建引擎 (保留最新价格)"""
+        for rule_id in list(self.rules):
+            self.remove(rule_id)
+        return [self.add(r, rule_id=r.get('id', i)) for i, r in enumerate(rules)]
+
+    def remove(self, rule_id):
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return False
+        state = self._state.pop(rule_id, None)
+        symbol = rule['symbol']
+        if state == 'pending':
+            self._pending[symbol].remove(rule_id)
+        elif state == 'armed':
+            if 'trailing' in rule:
+                self._trailing[symbol][(rule['direction'], rule['trailing'])].remove(rule_id)
+            else:
+                index = self._above if rule['direction'] == 'above' else self._below
+                index[symbol].remove(rule['target'], rule_id)
+        elif state == 'fired':
+            index = self._rearm_above if rule['direction'] == 'above' else self._rearm_below
+            index[symbol].remove(self._rearm_level(rule), rule_id)
+        # cooling 状态的规则在出堆时发现已删除会被丢弃
+        return True
+
+    def __len__(self):
+        return len(self.rules)
+
+    # ========== 价格更新 ==========
+    def update(self, symbol, price, now=None):
+        """推入一个价格，返回本次触发的规则列表 [(rule_id, rule), ...]"""
+        symbol = symbol.upper()
+        now = self.clock() if now is None else now
+        self.last_price[symbol] = price
+
+        for rule_id in self._pending.pop(symbol, []):
+            rule = self.rules[rule_id]
+            if 'pct' in rule and 'target' not in rule:
+                self._set_pct_target(rule, price)
+            self._arm(rule_id, price)
+        self._release_cooled(now, price)
+
+        # 回差: 价格回到阈值另一侧，重新布防
+        if symbol in self._rearm_above:
+            for rule_id in self._rearm_above[symbol].pop_above(price):
+                self._after_fire(rule_id, now, price)
+        if symbol in self._rearm_below:
+            for rule_id in self._rearm_below[symbol].pop_below(price):
+                self._after_fire(rule_id, now, price)
+
+        fired = []
+        if symbol in self._above:
+            # 目标价 < 当前价的 above 规则
+            fired += self._above[symbol].pop_below(price)
+        if symbol in self._below:
+            fired += self._below[symbol].pop_above(price)
+        for group in self._trailing.get(symbol, {}).values():
+            fired += group.update(price)
+
+        for rule_id in fired:
+            rule = self.rules[rule_id]
+            rule['last_fired'] = now
+            rule['fired_price'] = price
+            if 'trailing' in rule:
+                self._after_fire(rule_id, now, price)
+            else:
+                index = self._rearm_above if rule['direction'] == 'above' else self._rearm_below
+                index[symbol].add(self._rearm_level(rule), rule_id)
+                self._state[rule_id] = 'fired'
+        return [(rule_id, self.rules[rule_id]) for rule_id in fired]
+
+    def update_many(self, prices, now=None):
+        """批量推入 {symbol: price}"""
+        fired = []
+        for symbol, price in prices.items():
+            if price is not None:
+                fired += self.update(symbol, price, now)
+        return fired
+
+    # ========== 内部 ==========
+    @staticmethod
+    def _set_pct_target(rule, ref):
+        rule['ref'] = ref
+        sign = 1 if rule['direction'] == 'above' else -1
+        rule['target'] = ref * (1 + sign * rule['pct'] / 100)
+
+    @staticmethod
+    def _rearm_level(rule):
+        h = rule.get('hysteresis', 0) / 100
+        return rule['target'] * (1 - h if rule['direction'] == 'above' else 1 + h)
+
+    def _arm(self, rule_id, price=None):
+        rule = self.rules[rule_id]
+        symbol = rule['symbol']
+        self._state[rule_id] = 'armed'
+        if 'trailing' in rule:
+            price = self.last_price.get(symbol) if price is None else price
+            if price is None:
+                self._pending[symbol].append(rule_id)
+                self._state[rule_id] = 'pending'
+                return
+            key = (rule['direction'], rule['trailing'])
+            groups = self._trailing[symbol]
+            if key not in groups:
+                groups[key] = _TrailingGroup(*key)
+            groups[key].add(price, rule_id)
+        else:
+            index = self._above if rule['direction'] == 'above' else self._below
+            index[symbol].add(rule['target'], rule_id)
+
+    def _after_fire(self, rule_id, now, price):
+        """触发(且已满足回差)后: 冷却期内进入冷却堆，否则立即重新布防"""
+        rule = self.rules[rule_id]
+        ready = rule.get('last_fired', 0) + rule.get('cooldown', 0)
+        if ready > now:
+            heapq.heappush(self._cooling, (ready, next(self._cooling_seq), rule_id))
+            self._state[rule_id] = 'cooling'
+        else:
+            self._arm(rule_id, price if 'trailing' in rule else None)
+
+    def _release_cooled(self, now, price):
+        while self._cooling and self._cooling[0][0] <= now:
+            ready, _, rule_id = heapq.heappop(self._cooling)
+            # 规则删除后同一ID又被添加时，旧的堆条目与新规则的冷却到期时间对不上，直接丢弃
+            if self._state.get(rule_id) == 'cooling':
+                rule = self.rules[rule_id]
+                if rule.get('last_fired', 0) + rule.get('cooldown', 0) == ready:
+                    self._arm(rule_id, self.last_price.get(rule['symbol']))
+
+
+if __name__ == "__main__":
+    import random
+
+    engine = AlertEngine()
+    engine.add({'symbol': 'btc', 'direction': 'above', 'target': 100, 'hysteresis': 2})
+    engine.add({'symbol': 'BTC', 'direction': 'below', 'target': 90, 'cooldown': 60})
+    engine.add({'symbol': 'BTC', 'direction': 'above', 'pct': 5})
+    engine.add({'symbol': 'BTC', 'direction': 'below', 'trailing': 3})
+    for t, p in enumerate([95, 101, 99, 101, 97, 101, 103, 98, 89, 91, 89]):
+        fired = engine.update('BTC', p, now=t * 10)
+        print(f"t={t * 10:3d} 价格={p}: " + ", ".join(
+            f"{r['direction']} {r.get('target', r.get('trailing'))}" for _, r in fired))
+
+    # 与线性扫描对比 + 性能
+    n = 100000
+    rules = [{'symbol': 'BTC', 'direction': random.choice(['above', 'below']),
+              'target': random.uniform(50000, 70000)} for _ in range(n)]
+    engine = AlertEngine()
+    engine.load(rules)
+    engine.update('BTC', 60000, now=0)
+    prices, p = [], 60000
+    for _ in range(10000):
+        p += random.gauss(0, 5)
+        prices.append(p)
+    start = time.perf_counter()
+    total = sum(len(engine.update('BTC', p, now=0)) for p in prices)
+    elapsed = time.perf_counter() - start
+    print(f"{n}条规则, {len(prices)}次更新: {elapsed * 1e6 / len(prices):.1f}µs/次, 触发 {total}")
+
+    start = time.perf_counter()
+    for p in prices[:100]:
+        [r for r in rules if (r['direction'] == 'above' and p > r['target']) or
+         (r['direction'] == 'below' and p < r['target'])]
+    print(f"线性扫描: {(time.perf_counter() - start) * 1e6 / 100:.1f}µs/次")
@@ -0,0 +1,649 @@
+#!/usr/bin/env python3
+"""
+事件驱动回测引擎 - 直接复用实盘策略代码
+- ProTradingBot (trading_bot_pro.py): analyze_symbol / generate_signal / manage_positions / open_position
+- SafeTradingBot (safe_trading_bot_v2.py): TrendFollowStrategy.analyze + PositionManager 风控
+
+策略代码不做修改，回测时把模块里的下单/行情/时间函数换成模拟交易所和模拟时钟。
+
+用法:
+    python3 backtester.py --strategy pro --data trading_data/prices_BTCUSDT.csv
+    python3 backtester.py --strategy pro --data data/*.parquet \\
+        --sweep take_profit_pct=0.03,0.04,0.05 --sweep stop_loss_pct=0.01,0.02 --processes 8
+"""
+
+import os
+import csv
+import json
+import glob
+import time
+import argparse
+import itertools
+from contextlib import contextmanager
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from market_data import INTERVAL_MS
+
+
+# ========== 数据加载 ==========
+def _parse_time_ms(value):
+    """毫秒时间戳 / 秒时间戳 / 'YYYY-mm-dd HH:MM:SS' -> 毫秒"""
+    value = str(value).strip()
+    if value.replace(".", "", 1).isdigit():
+        ts = float(value)
+        return int(ts if ts > 1e11 else ts * 1000)
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+def resample_ticks(ticks, interval="1m"):
+    """逐笔价格 [(time_ms, price, volume)] 聚合为K线"""
+    step = INTERVAL_MS[interval]
+    candles = []
+    for t, price, volume in ticks:
+        open_time = t // step * step
+        if candles and candles[-1][0] == open_time:
+            c = candles[-1]
+            c[2] = max(c[2], price)
+            c[3] = min(c[3], price)
+            c[4] = price
+            c[5] += volume
+        else:
+            candles.append([open_time, price, price, price, price, volume, open_time + step - 1])
+    return candles
+
+def load_candles(path, interval="1m"):
+    """加载K线: 支持K线CSV / 价格记录CSV (prices_*.csv) / Parquet
+
+    返回 [open_time, open, high, low, close, volume, close_time] 列表 (浮点)
+    """
+    step = INTERVAL_MS[interval]
+    if path.endswith(".parquet"):
+        import pandas as pd
+        df = pd.read_parquet(path)
+        if "price" in df.columns and "close" not in df.columns:
+            times = df["timestamp"].map(_parse_time_ms) if df["timestamp"].dtype == object \
+                else df["timestamp"].astype("int64")
+            vols = df["volume"] if "volume" in df.columns else [0.0] * len(df)
+            return resample_ticks(zip(times, df["price"].astype(float), vols), interval)
+        df = df.sort_values("open_time")
+        return [[int(r.open_time), float(r.open), float(r.high), float(r.low), float(r.close),
+                 float(getattr(r, "volume", 0.0)), int(r.open_time) + step - 1]
+                for r in df.itertuples(index=False)]
+
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        fields = set(reader.fieldnames or [])
+        if {"open", "high", "low", "close"} <= fields:
+            time_key = "open_time" if "open_time" in fields else "timestamp"
+            candles = []
+            for row in reader:
+                t = _parse_time_ms(row[time_key])
+                candles.append([t, float(row["open"]), float(row["high"]), float(row["low"]),
+                                float(row["close"]), float(row.get("volume") or 0), t + step - 1])
+            return candles
+        # 价格记录格式: timestamp,price,...
+        ticks = [(_parse_time_ms(row["timestamp"]), float(row["price"]), float(row.get("volume") or 0))
+                 for row in reader]
+    return resample_ticks(ticks, interval)
+
+def symbol_from_path(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name.split("_", 1)[1].upper() if name.startswith("prices_") else name.upper()
+
+def load_dataset(paths, interval="1m"):
+    """{symbol: candles}"""
+    return {symbol_from_path(p): load_candles(p, interval) for p in paths}
+
+def load_store_dataset(root, interval="1m", symbols=None, start_ms=0, end_ms=None):
+    """从时序存储加载: 优先 candles_<interval>，否则把 prices 序列聚合为K线"""
+    from timeseries_store import TimeSeriesStore, downsample_ticks
+    store = TimeSeriesStore(root)
+    end_ms = end_ms or int(time.time() * 1000)
+    step = INTERVAL_MS[interval]
+    if os.path.isdir(os.path.join(store.root, f"candles_{interval}")):
+        series = store.candles(interval)
+        return {s: series.klines(s, start_ms, end_ms) for s in (symbols or series.symbols())}
+    with open(os.path.join(store.root, "prices", "_schema.json")) as f:
+        fields = json.load(f)["fields"]
+    series = store.series("prices", fields)
+    dataset = {}
+    for s in symbols or series.symbols():
+        candles = downsample_ticks(series.range(s, start_ms, end_ms), interval)
+        dataset[s] = [list(c) + [c[0] + step - 1] for c in candles]
+    return dataset
+
+
+# ========== 模拟时钟 / 费用模型 ==========
+class SimClock:
+    """替换策略模块里的 time 模块 (time() / sleep())"""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def perf_counter(self):
+        return time.perf_counter()
+
+
+class FeeModel:
+    """手续费 + 滑点 (按成交价比例)"""
+
+    def __init__(self, fee_rate=0.0004, slippage=0.0002):
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+
+    def fill_price(self, side, price):
+        return price * (1 + self.slippage) if side == "BUY" else price * (1 - self.slippage)
+
+    def fee(self, notional):
+        return abs(notional) * self.fee_rate
+
+
+# ========== 模拟交易所 ==========
+class SimExchange:
+    """模拟U本位合约 (单向持仓) + 现货账户，按最新K线收盘价撮合市价单"""
+
+    def __init__(self, balance, fee_model=None, leverage=1):
+        self.initial_balance = balance
+        self.wallet = balance           # 合约钱包余额
+        self.fee_model = fee_model or FeeModel()
+        self.leverage = leverage
+        self.positions = {}             # symbol -> {"amt", "entry"}
+        self.marks = {}                 # symbol -> 最新价
+        self.history = {}               # symbol -> 基础周期K线
+        self.interval_ms = INTERVAL_MS["1m"]
+        self.aggregates = {}            # (symbol, interval) -> 聚合K线
+        self.spot = {"USDT": balance}   # 现货余额
+        self.spot_cost = {}             # 现货持仓均价
+        self.trades = []
+        self.fees_paid = 0.0
+        self.order_id = 0
+        self.now_ms = 0
+
+    # ----- 行情 -----
+    def on_candle(self, symbol, candle):
+        self.history.setdefault(symbol, []).append(candle)
+        self.marks[symbol] = candle[4]
+        self.now_ms = candle[6]
+        for (sym, interval), agg in self.aggregates.items():
+            if sym == symbol:
+                self._aggregate(agg, candle, INTERVAL_MS[interval])
+
+    @staticmethod
+    def _aggregate(agg, c, step):
+        open_time = c[0] // step * step
+        if agg and agg[-1][0] == open_time:
+            a = agg[-1]
+            a[2] = max(a[2], c[2])
+            a[3] = min(a[3], c[3])
+            a[4] = c[4]
+            a[5] += c[5]
+        else:
+            agg.append([open_time, c[1], c[2], c[3], c[4], c[5], open_time + step - 1])
+
+    def klines(self, symbol, interval, limit):
+        """最近 limit 根K线，其他周期从基础K线增量聚合 (首次请求时补算历史)"""
+        base = self.history.get(symbol, [])
+        if INTERVAL_MS[interval] == self.interval_ms:
+            return base[-limit:]
+        key = (symbol, interval)
+        if key not in self.aggregates:
+            agg = []
+            for c in base:
+                self._aggregate(agg, c, INTERVAL_MS[interval])
+            self.aggregates[key] = agg
+        return self.aggregates[key][-limit:]
+
+    # ----- 合约账户 -----
+    def unrealized(self, symbol=None):
+        symbols = [symbol] if symbol else list(self.positions)
+        return sum((self.marks[s] - self.positions[s]["entry"]) * self.positions[s]["amt"]
+                   for s in symbols if s in self.positions)
+
+    def equity(self):
+        """合约权益 + 现货盈亏 (两个账户初始都是 initial_balance，只有一个会被策略使用)"""
+        spot_value = sum(qty * self.marks.get(f"{asset}USDT", 0)
+                         for asset, qty in self.spot.items() if asset != "USDT")
+        return self.wallet + self.unrealized() + (self.spot["USDT"] - self.initial_balance) + spot_value
+
+    def account(self):
+        margin = sum(abs(p["amt"]) * self.marks[s] / self.leverage for s, p in self.positions.items())
+        unrealized = self.unrealized()
+        return {
+            "totalWalletBalance": f"{self.wallet:.8f}",
+            "availableBalance": f"{max(0.0, self.wallet + unrealized - margin):.8f}",
+            "totalUnrealizedProfit": f"{unrealized:.8f}",
+        }
+
+    def position_risk(self, symbol):
+        pos = self.positions.get(symbol)
+        if not pos:
+            return [{"symbol": symbol, "positionAmt": "0", "entryPrice": "0",
+                     "markPrice": f"{self.marks.get(symbol, 0)}", "unRealizedProfit": "0"}]
+        return [{"symbol": symbol, "positionAmt": f"{pos['amt']}", "entryPrice": f"{pos['entry']}",
+                 "markPrice": f"{self.marks[symbol]}", "unRealizedProfit": f"{self.unrealized(symbol)}"}]
+
+    def futures_order(self, symbol, side, quantity):
+        qty = float(quantity)
+        if qty <= 0 or symbol not in self.marks:
+            return {"code": -1013, "msg": "Invalid quantity"}
+        price = self.fee_model.fill_price(side, self.marks[symbol])
+        signed = qty if side == "BUY" else -qty
+        fee = self.fee_model.fee(qty * price)
+        self.wallet -= fee
+        self.fees_paid += fee
+
+        pos = self.positions.get(symbol, {"amt": 0.0, "entry": 0.0})
+        realized = 0.0
+        if pos["amt"] == 0 or (pos["amt"] > 0) == (signed > 0):
+            new_amt = pos["amt"] + signed
+            pos["entry"] = (pos["entry"] * abs(pos["amt"]) + price * qty) / abs(new_amt)
+            pos["amt"] = new_amt
+        else:
+            closed = min(abs(signed), abs(pos["amt"]))
+            direction = 1 if pos["amt"] > 0 else -1
+            realized = (price - pos["entry"]) * closed * direction
+            pos["amt"] += signed
+            if abs(pos["amt"]) < 1e-12:
+                pos["amt"] = 0.0
+            elif (pos["amt"] > 0) != (direction > 0):
+                pos["entry"] = price  # 反手
+        self.wallet += realized
+        if pos["amt"] == 0:
+            self.positions.pop(symbol, None)
+        else:
+            self.positions[symbol] = pos
+
+        self.order_id += 1
+        self.trades.append({"time": self.now_ms, "symbol": symbol, "side": side, "qty": qty,
+                            "price": price, "fee": fee, "realized": realized})
+        return {"orderId": self.order_id, "symbol": symbol, "avgPrice": f"{price}",
+                "executedQty": f"{qty}", "status": "FILLED"}
+
+    def handle(self, method, endpoint, params):
+        """模拟币安合约REST接口"""
+        params = params or {}
+        if endpoint == "/fapi/v2/account":
+            return self.account()
+        if endpoint == "/fapi/v2/positionRisk":
+            return self.position_risk(params["symbol"])
+        if endpoint == "/fapi/v1/order" and method == "POST":
+            return self.futures_order(params["symbol"], params["side"], params["quantity"])
+        if endpoint == "/fapi/v1/klines":
+            return self.klines(params["symbol"], params.get("interval", "1m"), int(params.get("limit", 500)))
+        if endpoint == "/fapi/v1/ticker/price":
+            return {"symbol": params["symbol"], "price": f"{self.marks[params['symbol']]}"}
+        if endpoint == "/fapi/v1/leverage":
+            return {"leverage": params.get("leverage")}
+        return {"code": -1, "msg": f"unsupported endpoint {endpoint}"}
+
+    # ----- 现货 -----
+    def spot_order(self, symbol, side, quantity):
+        qty = float(quantity)
+        asset = symbol[:-4]
+        price = self.fee_model.fill_price(side, self.marks[symbol])
+        cost = qty * price
+        fee = self.fee_model.fee(cost)
+        held = self.spot.get(asset, 0.0)
+        realized = 0.0
+        if side == "BUY":
+            if self.spot["USDT"] < cost + fee:
+                return None
+            self.spot["USDT"] -= cost + fee
+            self.spot_cost[asset] = (self.spot_cost.get(asset, 0.0) * held + cost) / (held + qty)
+            self.spot[asset] = held + qty
+        else:
+            if held < qty - 1e-12:
+                return None
+            realized = (price - self.spot_cost.get(asset, price)) * qty
+            self.spot[asset] = held - qty
+            self.spot["USDT"] += cost - fee
+        self.fees_paid += fee
+        self.order_id += 1
+        self.trades.append({"time": self.now_ms, "symbol": symbol, "side": side, "qty": qty,
+                            "price": price, "fee": fee, "realized": realized})
+        return {"orderId": self.order_id, "symbol": symbol, "status": "FILLED"}
+
+
+class SimSpotAPI:
+    """safe_trading_bot_v2.BinanceAPI 的模拟实现"""
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+
+    def get_account(self):
+        return {"balances": [{"asset": a, "free": f"{q}", "locked": "0"} for a, q in self.exchange.spot.items()]}
+
+    def get_balance(self, asset):
+        return self.exchange.spot.get(asset, 0.0)
+
+    def get_klines(self, symbol, interval, limit=100):
+        data = self.exchange.klines(symbol, interval, limit)
+        if not data:
+            return None
+        return {
+            'timestamp': [k[0] for k in data],
+            'open': [k[1] for k in data],
+            'high': [k[2] for k in data],
+            'low': [k[3] for k in data],
+            'close': [k[4] for k in data],
+            'volume': [k[5] for k in data],
+        }
+
+    def get_ticker(self, symbol):
+        return self.exchange.marks.get(symbol)
+
+    def place_order(self, symbol, side, quantity, order_type="MARKET"):
+        return self.exchange.spot_order(symbol, side, quantity)
+
+
+# ========== 替换模块属性 ==========
+@contextmanager
+def patched(module, **attrs):
+    saved = {k: getattr(module, k) for k in attrs}
+    for k, v in attrs.items():
+        setattr(module, k, v)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            setattr(module, k, v)
+
+def _quiet_log(msg, level="INFO"):
+    pass
+
+def _print_log(msg, level="INFO"):
+    print(f"[{level}] {msg}")
+
+
+# ========== 策略驱动 ==========
+class ProStrategyRunner:
+    """按 ProTradingBot.run() 的顺序驱动实盘代码"""
+
+    name = "pro"
+
+    def __init__(self, exchange, clock, symbols, config_overrides=None, verbose=False):
+        import trading_bot_pro
+        self.module = trading_bot_pro
+        self.exchange = exchange
+        self.clock = clock
+        self.symbols = symbols
+        self.config = dict(trading_bot_pro.CONFIG, symbols=list(symbols), **(config_overrides or {}))
+        self.log = _print_log if verbose else _quiet_log
+        self.step_ms = self.config["check_interval"] * 1000
+        self.next_step = 0
+        self.paused_until = 0
+        # 实盘每轮取100根K线，回测同样等每个币种攒够100根再开始
+        self.warmup = 100
+        self.candle_counts = {s: 0 for s in symbols}
+
+    def session(self):
+        m = self.module
+        return patched(
+            m, CONFIG=self.config, log=self.log, time=self.clock,
+            make_request=lambda endpoint, params=None, base_url=None: self.exchange.handle("GET", endpoint, params),
+            make_post_request=lambda endpoint, params, base_url=None: self.exchange.handle("POST", endpoint, params),
+        )
+
+    def setup(self):
+        self.bot = self.module.ProTradingBot()
+
+    def on_candle(self, symbol, candle):
+        data = self.bot.price_data[symbol]
+        data["prices"].append(candle[4])
+        data["highs"].append(candle[2])
+        data["lows"].append(candle[3])
+        data["volumes"].append(candle[5])
+        if len(data["prices"]) > 200:
+            for key in data:
+                del data[key][:-100]
+        self.bot.indicators.update(symbol, candle[0], candle[2], candle[3], candle[4], candle[5])
+        self.candle_counts[symbol] += 1
+
+    def step(self, now_ms):
+        """一轮主循环 (按 check_interval 节流)"""
+        if now_ms < self.next_step or min(self.candle_counts.values()) < self.warmup:
+            return
+        self.next_step = now_ms + self.step_ms
+        bot = self.bot
+        now = now_ms / 1000
+        if now < bot.cooldown_until or now < self.paused_until:
+            return
+
+        bot.manage_positions()
+        if not bot.check_risk_limits():
+            self.paused_until = now + 3600
+            return
+
+        active = len([p for p in bot.positions.values() if p])
+        if active >= self.config["max_positions"]:
+            return
+
+        best_signal, best_confidence = None, 0
+        for symbol in self.symbols:
+            analysis = bot.analyze_symbol(symbol)
+            if analysis:
+                signal = bot.generate_signal(analysis)
+                if signal and signal["confidence"] > best_confidence:
+                    best_signal, best_confidence = signal, signal["confidence"]
+        if best_signal and best_confidence >= 1:
+            bot.open_position(best_signal)
+
+
+class SafeStrategyRunner:
+    """按 SafeTradingBot.run() 的顺序驱动实盘代码 (现货，每5分钟一轮)"""
+
+    name = "safe"
+
+    def __init__(self, exchange, clock, symbols, config_overrides=None, verbose=False, step_seconds=300):
+        import safe_trading_bot_v2
+        self.module = safe_trading_bot_v2
+        self.exchange = exchange
+        self.clock = clock
+        self.symbols = symbols
+        self.config = dict(safe_trading_bot_v2.CONFIG, symbols=list(symbols), **(config_overrides or {}))
+        self.log = _print_log if verbose else _quiet_log
+        self.step_ms = step_seconds * 1000
+        self.next_step = 0
+        self.api = SimSpotAPI(exchange)
+
+    def session(self):
+        m = self.module
+        runner = self
+
+        class SimPositionManager(m.PositionManager):
+            """内存版 PositionManager，按模拟日期重置日统计"""
+
+            def load_positions(self):
+                return {}
+
+            def save_positions(self):
+                pass
+
+            def load_daily_stats(self):
+                return {'date': runner.sim_date(), 'trades': 0, 'wins': 0, 'losses': 0,
+                        'pnl': 0, 'max_drawdown': 0}
+
+            def save_daily_stats(self):
+                pass
+
+        return patched(m, CONFIG=self.config, log=self.log, time=self.clock,
+                       send_alert=lambda *a, **k: None,
+                       BinanceAPI=lambda: self.api, PositionManager=SimPositionManager)
+
+    def sim_date(self):
+        return datetime.fromtimestamp(self.clock.time()).strftime('%Y-%m-%d')
+
+    def setup(self):
+        self.bot = self.module.SafeTradingBot()
+
+    def on_candle(self, symbol, candle):
+        pass
+
+    def step(self, now_ms):
+        if now_ms < self.next_step:
+            return
+        self.next_step = now_ms + self.step_ms
+        pm = self.bot.position_mgr
+        if pm.daily_stats['date'] != self.sim_date():
+            pm.daily_stats = pm.load_daily_stats()
+        self.bot.monitor_positions()
+        self.bot.scan_signals()
+
+
+RUNNERS = {"pro": ProStrategyRunner, "safe": SafeStrategyRunner}
+
+
+# ========== 回测主循环 ==========
+def merge_candles(dataset):
+    """按收盘时间合并多个币种的K线流"""
+    events = []
+    for symbol, candles in dataset.items():
+        events.extend((c[6], symbol, c) for c in candles)
+    events.sort(key=lambda e: (e[0], e[1]))
+    return events
+
+def run_backtest(dataset, strategy="pro", balance=None, config_overrides=None,
+                 fee_rate=0.0004, slippage=0.0002, verbose=False, equity_every=60):
+    """回测一组K线，返回统计结果"""
+    runner_cls = RUNNERS[strategy]
+    symbols = sorted(dataset)
+    clock = SimClock()
+    exchange = SimExchange(0, FeeModel(fee_rate, slippage))
+    runner = runner_cls(exchange, clock, symbols, config_overrides, verbose)
+    balance = balance if balance is not None else runner.config["initial_balance"]
+    exchange.initial_balance = exchange.wallet = balance
+    exchange.spot = {"USDT": balance}
+    exchange.leverage = runner.config.get("leverage", 1)
+
+    events = merge_candles(dataset)
+    equity_curve = []
+    peak, max_dd = balance, 0.0
+    start = time.perf_counter()
+    if events:
+        clock.now = events[0][0] / 1000
+
+    with runner.session():
+        runner.setup()
+        i = 0
+        while i < len(events):
+            now_ms = events[i][0]
+            clock.now = now_ms / 1000
+            # 同一时刻收盘的K线一起推送，再跑一轮策略
+            while i < len(events) and events[i][0] == now_ms:
+                _, symbol, candle = events[i]
+                exchange.on_candle(symbol, candle)
+                runner.on_candle(symbol, candle)
+                i += 1
+            runner.step(now_ms)
+
+            equity = exchange.equity()
+            peak = max(peak, equity)
+            if peak > 0:
+                max_dd = max(max_dd, (peak - equity) / peak)
+            if len(equity_curve) == 0 or i % equity_every == 0:
+                equity_curve.append((now_ms, equity))
+
+    elapsed = time.perf_counter() - start
+    final = exchange.equity()
+    closes = [t for t in exchange.trades if t["realized"] != 0]
+    return {
+        "strategy": strategy,
+        "symbols": symbols,
+        "config": config_overrides or {},
+        "candles": len(events),
+        "elapsed": elapsed,
+        "initial_balance": balance,
+        "final_balance": final,
+        "return_pct": (final - balance) / balance * 100 if balance else 0,
+        "max_drawdown_pct": max_dd * 100,
+        "orders": len(exchange.trades),
+        "wins": sum(1 for t in closes if t["realized"] > 0),
+        "losses": sum(1 for t in closes if t["realized"] < 0),
+        "fees": exchange.fees_paid,
+        "equity_curve": equity_curve,
+    }
+
+
+# ========== 参数扫描 (进程池) ==========
+_WORKER_DATA = {}
+
+def _init_worker(paths, interval, store=None):
+    _WORKER_DATA["dataset"] = load_store_dataset(store, interval) if store else load_dataset(paths, interval)
+
+def _run_job(args):
+    strategy, overrides, kwargs = args
+    result = run_backtest(_WORKER_DATA["dataset"], strategy, config_overrides=overrides, **kwargs)
+    result.pop("equity_curve", None)
+    return result
+
+def param_grid(spec):
+    """{"take_profit_pct": [0.03, 0.04], ...} -> [{...}, ...]"""
+    keys = list(spec)
+    return [dict(zip(keys, values)) for values in itertools.product(*(spec[k] for k in keys))]
+
+def run_sweep(paths, strategy, grid, interval="1m", processes=None, store=None, **kwargs):
+    """每个进程只加载一次数据，参数组合分发到进程池"""
+    jobs = [(strategy, overrides, kwargs) for overrides in grid]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                             initargs=(paths, interval, store)) as pool:
+        return list(pool.map(_run_job, jobs))
+
+
+def _parse_sweep(items):
+    spec = {}
+    for item in items or []:
+        key, values = item.split("=", 1)
+        spec[key] = [float(v) if v.replace(".", "", 1).lstrip("-").isdigit() else v for v in values.split(",")]
+    return spec
+
+def _print_result(r):
+    print(f"  {r['strategy']} {r['config']}: 收益 {r['return_pct']:+.2f}% | 回撤 {r['max_drawdown_pct']:.2f}% | "
+          f"订单 {r['orders']} (胜{r['wins']}/负{r['losses']}) | 手续费 ${r['fees']:.2f} | "
+          f"{r['candles']}根K线 {r['elapsed']:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="事件驱动回测")
+    parser.add_argument("--strategy", choices=sorted(RUNNERS), default="pro")
+    parser.add_argument("--data", nargs="+", default=[os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                 "trading_data", "prices_*.csv")])
+    parser.add_argument("--store", help="时序存储目录 (替代 --data)")
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--balance", type=float)
+    parser.add_argument("--fee", type=float, default=0.0004)
+    parser.add_argument("--slippage", type=float, default=0.0002)
+    parser.add_argument("--sweep", action="append", help="参数扫描, 如 take_profit_pct=0.03,0.04")
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    paths = [] if args.store else sorted(p for pattern in args.data for p in glob.glob(pattern))
+    if not paths and not args.store:
+        print("❌ 没有找到数据文件")
+        raise SystemExit(1)
+
+    print("=" * 60)
+    source = args.store or ', '.join(symbol_from_path(p) for p in paths)
+    print(f"📈 回测 {args.strategy}: {source}")
+    print("=" * 60)
+    kwargs = dict(balance=args.balance, fee_rate=args.fee, slippage=args.slippage)
+    spec = _parse_sweep(args.sweep)
+    if spec:
+        grid = param_grid(spec)
+        start = time.perf_counter()
+        results = run_sweep(paths, args.strategy, grid, args.interval, args.processes,
+                            store=args.store, **kwargs)
+        for r in sorted(results, key=lambda r: r["return_pct"], reverse=True):
+            _print_result(r)
+        print(f"⏱️  {len(grid)}组参数, 总耗时 {time.perf_counter() - start:.2f}s")
+    else:
+        dataset = load_store_dataset(args.store, args.interval) if args.store \
+            else load_dataset(paths, args.interval)
+        result = run_backtest(dataset, args.strategy, verbose=args.verbose, **kwargs)
+        _print_result(result)
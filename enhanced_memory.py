@@ -8,6 +8,7 @@
 
 运行：
 python3 enhanced_memory.py沉积   # 从每日日志沉淀到长期记忆
+python3 enhanced_memory.py 定时 [秒]   # 周期性沉淀 (默认 600 秒)，只处理变化的段落
 python3 enhanced_memory.py 搜索 <关键词>   # 搜索记忆
 python3 enhanced_memory.py 状态   # 查看记忆状态
 """
@@ -15,14 +16,30 @@ python3 enhanced_memory.py 状态   # 查看记忆状态
 import os
 import re
 import json
+import hashlib
 from datetime import datetime, timedelta
 from pathlib import Path
 
+from memory_store import MemoryStore, matching_lines, split_sections
+
 # 配置
 WORKSPACE = os.path.expanduser('~/.openclaw/workspace')
 MEMORY_DIR = os.path.join(WORKSPACE, 'memory')
 LONG_TERM_FILE = os.path.join(WORKSPACE, 'MEMORY.md')
 ALIGN_FILE = os.path.join(WORKSPACE, '.memory_alignment.json')
+INDEX_DB = os.path.join(WORKSPACE, '.memory_index.db')
+CONSOLIDATION_FILE = os.path.join(WORKSPACE, '.memory_consolidation.json')
+
+
+def fact_hash(fact):
+    """事实去重用的归一化哈希: 去掉列表符号/状态图标/空白/标点，忽略大小写"""
+    text = re.sub(r'^[\s\-*+✅❌🔴]+', '', fact)
+    text = re.sub(r'[\s\W_]+', '', text.lower())
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def section_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
 
 
 class EnhancedMemory:
@@ -34,6 +51,8 @@ class EnhancedMemory:
         self.long_term_file = LONG_TERM_FILE
         self.alignment_file = ALIGN_FILE
         self.alignment = self.load_alignment()
+        self.store = MemoryStore(INDEX_DB)
+        self.consolidation_file = CONSOLIDATION_FILE
         
     def load_alignment(self):
         """加载对齐状态"""
@@ -64,101 +83,184 @@ class EnhancedMemory:
         files.sort(reverse=True)
         return files[:days]
     
-    def extract_key_info(self, content):
-        """从日志中提取关键信息"""
+    def extract_key_info(self, content, seen=()):
+        """从日志中提取关键信息 (seen: 已沉淀事实的哈希，先跳过这些再按条数上限截取)"""
         key_info = []
+        unseen = lambda items: [item for item in items if fact_hash(item) not in seen]
         
         # 提取任务完成情况
         task_pattern = r'[✅❌🔴].*'
-        tasks = re.findall(task_pattern, content)
+        tasks = unseen(re.findall(task_pattern, content))
         key_info.extend(tasks[:5])  # 最多5条
         
         # 提取决策类内容
         decision_pattern = r'.*决定.*|.*规划.*|.*目标.*'
-        decisions = re.findall(decision_pattern, content)
+        decisions = unseen(re.findall(decision_pattern, content))
         key_info.extend(decisions[:3])
         
         return key_info
     
+    def load_consolidation(self):
+        """沉淀进度: 每个日志文件的 stat、各段落哈希、最后一段偏移，以及已沉淀事实的哈希"""
+        if os.path.exists(self.consolidation_file):
+            with open(self.consolidation_file) as f:
+                return json.load(f)
+        # 首次运行: 把长期记忆里已有的条目记为已沉淀，避免重复
+        facts = set()
+        if os.path.exists(self.long_term_file):
+            with open(self.long_term_file, encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('- '):
+                        facts.add(fact_hash(line))
+        # 旧版按天沉淀过的日志、以及旧版 7 天窗口之外的日志: 只记录当前进度，不再提取
+        # (之后这些文件有新增/修改的段落仍会被处理)
+        files = {}
+        if os.path.exists(self.memory_dir):
+            done_days = set(self.alignment.get('consolidated_days', []))
+            recent = set(self.get_recent_logs(days=7))
+            for name in os.listdir(self.memory_dir):
+                if not name.endswith('.md') or name == 'README.md':
+                    continue
+                if name.replace('.md', '') in done_days or name not in recent:
+                    path = os.path.join(self.memory_dir, name)
+                    _, files[name] = self._changed_sections(path, os.stat(path), None)
+        return {'files': files, 'facts': sorted(facts)}
+    
+    def save_consolidation(self, state):
+        tmp = self.consolidation_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.consolidation_file)
+    
+    def _changed_sections(self, path, st, prev):
+        """
+        返回需要重新解析的段落 [(偏移, 文本)] 和该文件的新进度
+        上次最后一段之前的字节没变 (只在末尾追加) 时只切分末尾；否则全文重切，按段落哈希跳过没变的段
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        start = 0
+        if prev and prev['ino'] == st.st_ino and len(data) >= prev['tail']:
+            if hashlib.sha1(data[:prev['tail']]).hexdigest() == prev['prefix']:
+                start = prev['tail']
+        sections = split_sections(data[start:], start)
+        
+        old_hashes = prev['sections'] if prev else {}
+        hashes = {k: v for k, v in old_hashes.items() if int(k) < start}
+        known = set(old_hashes.values())
+        changed = []
+        for offset, _, text in sections:
+            h = section_hash(text)
+            hashes[str(offset)] = h
+            if h not in known:
+                changed.append((offset, text))
+        tail = sections[-1][0] if sections else start
+        progress = {
+            'ino': st.st_ino, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+            'tail': tail, 'prefix': hashlib.sha1(data[:tail]).hexdigest(), 'sections': hashes
+        }
+        return changed, progress
+    
     def consolidate(self):
-        """沉淀：将近期日志关键信息存入长期记忆"""
+        """
+        沉淀：将日志中新增/修改的段落提取关键信息存入长期记忆
+        未变化的文件只做一次 stat；事实按归一化哈希去重
+        """
         print("🔄 开始沉淀...")
         
-        # 读取现有长期记忆
-        long_term_content = ""
-        if os.path.exists(self.long_term_file):
-            with open(self.long_term_file) as f:
-                long_term_content = f.read()
-        
-        # 获取未沉淀的日志
-        consolidated = set(self.alignment.get('consolidated_days', []))
-        recent_logs = self.get_recent_logs(days=7)
+        fresh = not os.path.exists(self.consolidation_file)
+        state = self.load_consolidation()
+        files = state['files']
+        facts = set(state['facts'])
         
         new_info = []
-        for log_file in recent_logs:
-            day = log_file.replace('.md', '')
-            if day in consolidated:
-                continue
-            
-            log_path = os.path.join(self.memory_dir, log_file)
-            with open(log_path) as f:
-                content = f.read()
+        processed_days = []
+        sections_parsed = 0
+        if os.path.exists(self.memory_dir):
+            entries = sorted(
+                (e for e in os.scandir(self.memory_dir) if e.name.endswith('.md') and e.name != 'README.md'),
+                key=lambda e: e.name
+            )
+            for entry in entries:
+                st = entry.stat()
+                prev = files.get(entry.name)
+                if prev and (prev['ino'], prev['size'], prev['mtime_ns']) == (st.st_ino, st.st_size, st.st_mtime_ns):
+                    continue
+                
+                changed, files[entry.name] = self._changed_sections(entry.path, st, prev)
+                sections_parsed += len(changed)
+                day = entry.name.replace('.md', '')
+                processed_days.append(day)
+                
+                # 同一文件的变化段落合并后提取；已沉淀的事实先去掉，条数上限 (任务 5 / 决策 3) 只算新事实
+                day_facts = []
+                if changed:
+                    for info in self.extract_key_info(''.join(text for _, text in changed), facts):
+                        h = fact_hash(info)
+                        if h not in facts:
+                            facts.add(h)
+                            day_facts.append(info)
+                if day_facts:
+                    new_info.append(f"\n### {day}\n")
+                    new_info.extend([f"- {info}" for info in day_facts])
+        
+        # 删除的日志不再跟踪
+        if os.path.exists(self.memory_dir):
+            for name in [n for n in files if not os.path.exists(os.path.join(self.memory_dir, n))]:
+                del files[name]
+        
+        if new_info:
+            # 追加到长期记忆
+            with open(self.long_term_file, 'a') as f:
+                f.write("\n\n## 最近沉淀\n")
+                f.write('\n'.join(new_info))
+        
+        if fresh or processed_days or new_info:
+            state['facts'] = sorted(facts)
+            self.save_consolidation(state)
             
-            key_info = self.extract_key_info(content)
-            if key_info:
-                new_info.append(f"\n### {day}\n")
-                new_info.extend([f"- {info}" for info in key_info])
+            # 更新对齐状态
+            consolidated = set(self.alignment.get('consolidated_days', []))
+            self.alignment['consolidated_days'] = sorted(consolidated | set(processed_days))
+            self.alignment['last_consolidation'] = datetime.now().isoformat()
+            self.save_alignment()
         
         if not new_info:
-            print("✅ 无新信息需要沉淀")
-            return
-        
-        # 追加到长期记忆
-        with open(self.long_term_file, 'a') as f:
-            f.write("\n\n## 最近沉淀\n")
-            f.write('\n'.join(new_info))
-        
-        # 更新对齐状态
-        self.alignment['consolidated_days'].extend(
-            [log_file.replace('.md', '') for log_file in recent_logs]
-        )
-        self.alignment['last_consolidation'] = datetime.now().isoformat()
-        self.save_alignment()
+            print(f"✅ 无新信息需要沉淀 (检查 {sections_parsed} 个变化段落)")
+            return 0
         
-        print(f"✅ 已沉淀 {len(new_info)} 条信息")
+        added = sum(1 for line in new_info if line.startswith('- '))
+        print(f"✅ 已沉淀 {added} 条信息 (解析 {sections_parsed} 个变化段落，涉及 {len(processed_days)} 天)")
+        return added
     
     def search(self, keyword):
         """搜索记忆"""
         print(f"🔍 搜索: {keyword}")
         results = []
         
-        # 搜索每日日志
-        if os.path.exists(self.memory_dir):
-            for f in os.listdir(self.memory_dir):
-                if not f.endswith('.md'):
-                    continue
-                path = os.path.join(self.memory_dir, f)
-                with open(path) as file:
-                    content = file.read()
-                    if keyword.lower() in content.lower():
-                        # 找到包含关键词的行
-                        lines = content.split('\n')
-                        matches = [l for l in lines if keyword.lower() in l.lower()]
-                        results.append((f, matches[:3]))
-        
-        # 搜索长期记忆
-        if os.path.exists(self.long_term_file):
-            with open(self.long_term_file) as f:
-                content = f.read()
-                if keyword.lower() in content.lower():
-                    lines = content.split('\n')
-                    matches = [l for l in lines if keyword.lower() in l.lower()]
-                    results.append(('MEMORY.md', matches[:3]))
+        # 增量同步每日日志和长期记忆，然后走全文索引
+        self.store.sync_dir(self.memory_dir, 'daily', exclude=())
+        self.store.sync_file(self.long_term_file, 'long_term')
+        hits = self.store.search(keyword, kind=['daily', 'long_term'], limit=500)
+        
+        # 按文件聚合，每个文件最多 3 行；日志按日期倒序，长期记忆放最后
+        by_source = {}
+        for hit in hits:
+            by_source.setdefault(hit['source'], []).append(hit)
+        daily = sorted((s for s in by_source if by_source[s][0]['kind'] == 'daily'), reverse=True)
+        for source in daily + [s for s in by_source if s not in daily]:
+            matches = []
+            for hit in sorted(by_source[source], key=lambda h: h['offset']):
+                matches.extend(matching_lines(hit['content'], keyword, 3 - len(matches)))
+                if len(matches) >= 3:
+                    break
+            name = 'MEMORY.md' if source == os.path.abspath(self.long_term_file) else os.path.basename(source)
+            results.append((name, matches))
         
         # 显示结果
         if not results:
             print("未找到相关内容")
-            return
+            return results
         
         for source, matches in results:
             print(f"\n📁 {source}")
@@ -167,6 +269,7 @@ class EnhancedMemory:
         
         self.alignment['last_search'] = datetime.now().isoformat()
         self.save_alignment()
+        return results
     
     def status(self):
         """查看状态"""
@@ -197,6 +300,12 @@ if __name__ == '__main__':
         memory.status()
     elif sys.argv[1] == '沉淀':
         memory.consolidate()
+    elif sys.argv[1] == '定时':
+        import time
+        interval = int(sys.argv[2]) if len(sys.argv) > 2 else 600
+        while True:
+            memory.consolidate()
+            time.sleep(interval)
     elif sys.argv[1] == '搜索' and len(sys.argv) > 2:
         memory.search(sys.argv[2])
     elif sys.argv[1] == '状态':
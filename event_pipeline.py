@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+事件处理流水线 - 把耗时的消息处理从接收线程移走
+- KeyedExecutor: 有界线程池，同一个 key (如 chat_id) 的任务按提交顺序串行，不同 key 并行
+- EventPipeline: 按事件 ID 去重 (TTL + 容量上限)，立即返回，处理器在线程池里执行
+- RetryingSender: 回复发送池，失败按指数退避重试，同一会话的回复保持顺序
+- 指标: 排队深度、在途数、排队等待/处理耗时分位数、各类计数
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("EventPipeline")
+
+LATENCY_SAMPLES = 1000
+
+
+class LatencyStats:
+    """最近 N 次耗时的滑动窗口"""
+
+    def __init__(self, size=LATENCY_SAMPLES):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def summary(self):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {"count": 0}
+        pick = lambda q: round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 1)
+        return {"count": len(samples), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "max_ms": round(samples[-1] * 1000, 1)}
+
+
+class KeyedExecutor:
+    """
+    ex = KeyedExecutor(workers=8, max_pending=1000)
+    ex.submit("chat-1", fn, arg)   # 队列已满返回 False
+    同一个 key 同时最多占用一个线程，每执行完一个任务就让出线程，长会话不会饿死其他会话
+    """
+
+    def __init__(self, workers=8, max_pending=1000, name="keyed"):
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._queues = {}        # key -> deque[(fn, args, 提交时间)]，key 在途期间存在
+        self._lock = threading.Condition()
+        self._pending = 0
+        self._running = 0
+        self.counters = {"submitted": 0, "rejected": 0, "failed": 0, "completed": 0}
+        self.wait_latency = LatencyStats()
+        self.run_latency = LatencyStats()
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.counters["rejected"] += 1
+                return False
+            self._pending += 1
+            self.counters["submitted"] += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                # 这个 key 已有任务在排队/执行，排在后面
+                queue.append((fn, args, time.time()))
+                return True
+            self._queues[key] = deque([(fn, args, time.time())])
+        self._pool.submit(self._run_next, key)
+        return True
+
+    def _run_next(self, key):
+        with self._lock:
+            fn, args, submitted = self._queues[key][0]
+            self._running += 1
+        started = time.time()
+        self.wait_latency.add(started - submitted)
+        try:
+            fn(*args)
+            ok = True
+        except Exception as e:
+            logger.error(f"任务执行失败 [{key}]: {e}")
+            ok = False
+        self.run_latency.add(time.time() - started)
+        with self._lock:
+            self._running -= 1
+            self._pending -= 1
+            self.counters["completed" if ok else "failed"] += 1
+            queue = self._queues[key]
+            queue.popleft()
+            if not queue:
+                del self._queues[key]
+                if not self._pending:
+                    self._lock.notify_all()
+                return
+        self._pool.submit(self._run_next, key)
+
+    def join(self, timeout=None):
+        """等待所有已提交的任务执行完，超时返回 False"""
+        with self._lock:
+            return self._lock.wait_for(lambda: not self._pending, timeout)
+
+    def metrics(self):
+        with self._lock:
+            snapshot = {
+                "queue_depth": self._pending - self._running,
+                "in_flight": self._running,
+                "active_keys": len(self._queues),
+                **self.counters
+            }
+        snapshot["wait"] = self.wait_latency.summary()
+        snapshot["handler"] = self.run_latency.summary()
+        return snapshot
+
+    def shutdown(self, wait=True):
+        if wait:
+            self.join()
+        self._pool.shutdown(wait=wait)
+
+
+class EventPipeline:
+    """
+    pipeline = EventPipeline(workers=8)
+    pipeline.dispatch(event_id, chat_id, handler, event) -> "accepted" / "duplicate" / "rejected"
+    """
+
+    def __init__(self, workers=8, max_pending=1000, dedupe_ttl=600, dedupe_size=10000):
+        self.executor = KeyedExecutor(workers, max_pending, name="event")
+        self.dedupe_ttl = dedupe_ttl
+        self.dedupe_size = dedupe_size
+        self._seen = OrderedDict()    # event_id -> 首次收到时间，按时间顺序
+        self._seen_lock = threading.Lock()
+        self.duplicates = 0
+
+    def _is_duplicate(self, event_id):
+        now = time.time()
+        with self._seen_lock:
+            while self._seen:
+                _, seen_at = next(iter(self._seen.items()))
+                if now - seen_at < self.dedupe_ttl and len(self._seen) < self.dedupe_size:
+                    break
+                self._seen.popitem(last=False)
+            if event_id in self._seen:
+                self.duplicates += 1
+                return True
+            self._seen[event_id] = now
+            return False
+
+    def dispatch(self, event_id, key, handler, *args):
+        """去重后把 handler(*args) 排进 key 的队列；不会阻塞调用线程"""
+        if event_id and self._is_duplicate(event_id):
+            return "duplicate"
+        if not self.executor.submit(key, handler, *args):
+            # 没处理的事件不记为已见，平台重投时还能再处理
+            with self._seen_lock:
+                self._seen.pop(event_id, None)
+            return "rejected"
+        return "accepted"
+
+    def metrics(self):
+        return {**self.executor.metrics(), "duplicates": self.duplicates}
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
+
+
+class RetryingSender:
+    """
+    sender = RetryingSender(send_fn, workers=4, retries=3)
+    sender.send(chat_id, payload)   # send_fn(chat_id, payload) 返回 False 或抛异常时重试
+    """
+
+    def __init__(self, send_fn, workers=4, retries=3, backoff=0.5, max_pending=1000):
+        self.send_fn = send_fn
+        self.retries = retries
+        self.backoff = backoff
+        self.executor = KeyedExecutor(workers, max_pending, name="sender")
+        self.retried = 0
+        self.dropped = 0
+
+    def send(self, key, payload):
+        if not self.executor.submit(key, self._send, key, payload):
+            self.dropped += 1
+            logger.error(f"发送队列已满，丢弃回复 [{key}]")
+            return False
+        return True
+
+    def _send(self, key, payload):
+        for attempt in range(self.retries + 1):
+            try:
+                if self.send_fn(key, payload) is not False:
+                    return
+                error = "发送失败"
+            except Exception as e:
+                error = e
+            if attempt < self.retries:
+                self.retried += 1
+                time.sleep(self.backoff * 2 ** attempt)
+        self.dropped += 1
+        raise RuntimeError(f"重试 {self.retries} 次后仍失败: {error}")
+
+    def metrics(self):
+        return {**self.executor.metrics(), "retried": self.retried, "dropped": self.dropped}
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
+
+
+if __name__ == "__main__":
+    import random
+
+    logging.basicConfig(level=logging.WARNING)
+    sent = []
+    flaky = random.Random(1)
+
+    def send(chat_id, text):
+        if flaky.random() < 0.2:
+            raise ConnectionError("网络抖动")
+        sent.append((chat_id, text))
+
+    sender = RetryingSender(send, workers=4, retries=5, backoff=0.01)
+
+    def handle(chat_id, seq, delay):
+        time.sleep(delay)
+        sender.send(chat_id, seq)
+
+    for workers in (1, 8, 32):
+        pipeline = EventPipeline(workers=workers)
+        sent.clear()
+        start = time.time()
+        for seq in range(20):
+            for chat in range(10):
+                # 每个会话里夹一个 1 秒的慢调用
+                delay = 1.0 if (chat, seq) == (0, 3) else 0.02
+                pipeline.dispatch(f"msg-{chat}-{seq}", f"chat{chat}", handle, f"chat{chat}", seq, delay)
+        duplicate = pipeline.dispatch("msg-0-0", "chat0", handle, "chat0", 0, 0)
+        pipeline.shutdown()
+        sender.executor.join()
+        ordered = all(
+            [seq for c, seq in sent if c == f"chat{chat}"] == list(range(20)) for chat in range(10)
+        )
+        m = pipeline.metrics()
+        print(f"{workers:2d} 线程: 200 条 {time.time() - start:.2f}s, 重复事件 {duplicate}, 会话内有序 {ordered}, "
+              f"处理 p95 {m['handler']['p95_ms']}ms, 排队 p95 {m['wait']['p95_ms']}ms")
+    print(f"发送: {sender.metrics()['completed']} 成功, 重试 {sender.metrics()['retried']} 次")
+    sender.shutdown()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+共享交易所客户端
+- 服务器时钟偏移缓存 (后台定时校准，签名请求不再额外请求 /time)
+- 按主机复用的 keep-alive 连接池
+- 按接口统计延迟
+"""
+
+import time
+import json
+import base64
+import hmac
+import hashlib
+import threading
+import queue
+import http.client
+import urllib.parse
+
+
+# ========== 签名函数 ==========
+def ed25519_signer(private_key):
+    """Ed25519签名 (币安新版API Key)"""
+    def sign(payload):
+        return base64.b64encode(private_key.sign(payload.encode('utf-8'))).decode('utf-8')
+    return sign
+
+def hmac_signer(secret):
+    """HMAC SHA256签名"""
+    def sign(payload):
+        return hmac.new(secret.encode('utf-8'), payload.encode('utf-8'), hashlib.sha256).hexdigest()
+    return sign
+
+
+# ========== 连接池 ==========
+class ConnectionPool:
+    """单个主机的 keep-alive 连接池"""
+
+    def __init__(self, scheme, host, port=None, size=4, timeout=15):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _new_connection(self):
+        conn_cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return conn_cls(self.host, self.port, timeout=self.timeout)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def request(self, method, path, body=None, headers=None):
+        """发送请求，返回 (status, body_bytes)
+
+        复用的空闲连接可能已被服务端关闭，此时换新连接重试一次
+        """
+        for attempt in range(2):
+            conn = self.acquire()
+            reused = conn.sock is not None
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    http.client.BadStatusLine, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+            if resp.will_close:
+                conn.close()
+            else:
+                self.release(conn)
+            return resp.status, data
+
+
+# ========== 交易所客户端 ==========
+class ExchangeClient:
+    """币安风格的签名REST客户端
+
+    用法:
+        client = ExchangeClient(api_key, ed25519_signer(PRIVATE_KEY))
+        client.start_time_sync()
+        client.get("/fapi/v2/account")
+        client.post("/fapi/v1/order", {...})
+    """
+
+    def __init__(self, api_key, signer, base_url="https://fapi.binance.com",
+                 time_url=None, pool_size=4, timeout=15,
+                 time_sync_interval=60, time_samples=3, logger=None):
+        self.api_key = api_key
+        self.signer = signer
+        self.base_url = base_url.rstrip("/")
+        self.time_url = time_url or f"{self.base_url}/fapi/v1/time"
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.time_sync_interval = time_sync_interval
+        self.time_samples = time_samples
+        self.logger = logger
+
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+
+        # 服务器时间 = 本地时间 + offset (毫秒)
+        self.time_offset_ms = 0
+        self.time_rtt_ms = None
+        self.last_time_sync = 0
+        self._time_lock = threading.Lock()
+        self._sync_thread = None
+        self._stop = threading.Event()
+
+        # 接口延迟统计
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _log(self, msg, level="INFO"):
+        if self.logger:
+            self.logger(msg, level)
+
+    # ----- 连接池 -----
+    def _pool_for(self, url):
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(parts.scheme, parts.hostname, parts.port,
+                                      size=self.pool_size, timeout=self.timeout)
+                self._pools[key] = pool
+        return pool
+
+    def close(self):
+        """停止校时线程并关闭所有连接"""
+        self._stop.set()
+        with self._pools_lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+    # ----- 时钟偏移 -----
+    def sync_time(self):
+        """估算服务器时钟偏移
+
+        采样多次，取往返时间最短的一次: offset = serverTime - (t0 + t1) / 2
+        """
+        best = None
+        for _ in range(self.time_samples):
+            try:
+                t0 = time.time() * 1000
+                status, body = self._raw("GET", self.time_url, endpoint="/time")
+                t1 = time.time() * 1000
+                if status != 200:
+                    continue
+                server_time = json.loads(body.decode())['serverTime']
+            except Exception as e:
+                self._log(f"校时失败: {e}", "WARN")
+                continue
+            rtt = t1 - t0
+            if best is None or rtt < best[0]:
+                best = (rtt, server_time - (t0 + t1) / 2)
+
+        if best is None:
+            return False
+
+        with self._time_lock:
+            self.time_rtt_ms, offset = best
+            self.time_offset_ms = int(round(offset))
+            self.last_time_sync = time.time()
+        return True
+
+    def server_time(self):
+        """当前服务器时间估计 (毫秒)，从未校时则先同步一次"""
+        if not self.last_time_sync and not self._sync_thread:
+            self.sync_time()
+        return int(time.time() * 1000) + self.time_offset_ms
+
+    def start_time_sync(self):
+        """启动后台校时线程"""
+        if self._sync_thread and self._sync_thread.is_alive():
+            return
+        self.sync_time()
+
+        def loop():
+            while not self._stop.wait(self.time_sync_interval):
+                self.sync_time()
+
+        self._sync_thread = threading.Thread(target=loop, daemon=True)
+        self._sync_thread.start()
+
+    # ----- 统计 -----
+    def _record(self, endpoint, elapsed_ms, ok):
+        with self._stats_lock:
+            s = self._stats.setdefault(endpoint, {
+                "count": 0, "errors": 0, "total_ms": 0.0,
+                "min_ms": None, "max_ms": 0.0, "last_ms": 0.0
+            })
+            s["count"] += 1
+            if not ok:
+                s["errors"] += 1
+            s["total_ms"] += elapsed_ms
+            s["last_ms"] = elapsed_ms
+            s["max_ms"] = max(s["max_ms"], elapsed_ms)
+            s["min_ms"] = elapsed_ms if s["min_ms"] is None else min(s["min_ms"], elapsed_ms)
+
+    def stats(self):
+        """按接口返回延迟统计"""
+        with self._stats_lock:
+            result = {}
+            for endpoint, s in self._stats.items():
+                item = dict(s)
+                item["avg_ms"] = s["total_ms"] / s["count"] if s["count"] else 0
+                result[endpoint] = item
+            return result
+
+    # ----- 请求 -----
+    def _raw(self, method, url, body=None, headers=None, endpoint=None):
+        parts = urllib.parse.urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        start = time.perf_counter()
+        ok = False
+        try:
+            status, data = self._pool_for(url).request(method, path, body=body, headers=headers)
+            ok = status < 400
+            return status, data
+        finally:
+            self._record(endpoint or parts.path, (time.perf_counter() - start) * 1000, ok)
+
+    def request(self, method, endpoint, params=None, signed=True, base_url=None):
+        """发送请求，返回解析后的JSON
+
+        错误时与原 make_request 保持一致: 返回交易所错误JSON或 {"error": ...}
+        """
+        base_url = (base_url or self.base_url).rstrip("/")
+        params = dict(params) if params else {}
+        headers = {}
+
+        if signed:
+            params['timestamp'] = self.server_time()
+            payload = '&'.join([f"{k}={v}" for k, v in params.items()])
+            payload = f"{payload}&signature={self.signer(payload)}"
+            headers['X-MBX-APIKEY'] = self.api_key
+        else:
+            payload = '&'.join([f"{k}={v}" for k, v in params.items()])
+            if self.api_key:
+                headers['X-MBX-APIKEY'] = self.api_key
+
+        body = None
+        if method == "GET":
+            url = f"{base_url}{endpoint}?{payload}" if payload else f"{base_url}{endpoint}"
+        else:
+            url = f"{base_url}{endpoint}"
+            body = payload.encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        try:
+            status, data = self._raw(method, url, body=body, headers=headers, endpoint=endpoint)
+        except Exception as e:
+            self._log(f"请求错误: {e}", "ERROR")
+            return {"error": str(e)}
+
+        text = data.decode()
+        try:
+            result = json.loads(text)
+        except ValueError:
+            return {"error": text[:200]}
+
+        if status >= 400 and isinstance(result, dict):
+            self._log(f"API错误: {result.get('code')} - {result.get('msg')}", "ERROR")
+            # 时间戳超出 recvWindow，立即重新校时
+            if result.get('code') == -1021:
+                self.sync_time()
+        return result
+
+    def get(self, endpoint, params=None, signed=True, base_url=None):
+        return self.request("GET", endpoint, params, signed=signed, base_url=base_url)
+
+    def post(self, endpoint, params=None, signed=True, base_url=None):
+        return self.request("POST", endpoint, params, signed=signed, base_url=base_url)
+
+
+if __name__ == "__main__":
+    client = ExchangeClient("", None)
+    print("=== 交易所客户端延迟测试 ===")
+    if client.sync_time():
+        print(f"⏱️  时钟偏移: {client.time_offset_ms}ms (RTT {client.time_rtt_ms:.1f}ms)")
+    for _ in range(5):
+        client.get("/fapi/v1/ticker/price", {"symbol": "BTCUSDT"}, signed=False)
+    for endpoint, s in client.stats().items():
+        print(f"  {endpoint}: {s['count']}次, 平均 {s['avg_ms']:.1f}ms, 最大 {s['max_ms']:.1f}ms")
@@ -34,6 +34,22 @@ WORKSPACE = Path("/Users/wangjingwen/.openclaw/workspace")
 TEMP_DIR = Path(tempfile.gettempdir()) / "feishu_bot"
 TEMP_DIR.mkdir(exist_ok=True)
 
+from event_pipeline import EventPipeline, RetryingSender
+from resource_cache import ResourceCache, CHUNK_SIZE
+
+# 事件处理: 接收线程只做去重和入队，处理器在线程池里按会话顺序执行
+HANDLER_WORKERS = 8
+SENDER_WORKERS = 4
+MAX_PENDING_EVENTS = 1000
+SEND_RETRIES = 3
+
+# 消息资源: 流式下载到磁盘缓存，同一资源/同一内容只下载、转录一次
+FEISHU_API = "https://open.feishu.cn/open-apis"
+CACHE_DIR = TEMP_DIR / "cache"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_TTL = 7 * 24 * 3600
+DOWNLOAD_TIMEOUT = 60
+
 # 导入语音转录
 try:
     sys.path.insert(0, str(WORKSPACE))
@@ -59,6 +75,12 @@ class FeishuBot:
             "media": self._handle_audio,
             "file": self._handle_file,
         }
+        self.pipeline = EventPipeline(workers=HANDLER_WORKERS, max_pending=MAX_PENDING_EVENTS)
+        self.sender = RetryingSender(self._deliver, workers=SENDER_WORKERS, retries=SEND_RETRIES)
+        self.resources = ResourceCache(CACHE_DIR, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL)
+        self.http = requests.Session()
+        self._token = None
+        self._token_expire = 0
         
     def start(self):
         """启动机器人"""
@@ -190,7 +212,19 @@ class FeishuBot:
             logger.debug(f"忽略事件类型: {event_type}")
     
     def _handle_message(self, event: Dict[str, Any]):
-        """处理消息"""
+        """接收消息: 按 message_id 去重后交给线程池，立即返回"""
+        message = event.get("event", {}).get("message", {})
+        message_id = message.get("message_id", "") or event.get("header", {}).get("event_id", "")
+        chat_id = message.get("chat_id", "")
+        
+        status = self.pipeline.dispatch(message_id, chat_id, self._run_handler, event)
+        if status == "duplicate":
+            logger.info(f"🔁 重复事件已忽略: {message_id}")
+        elif status == "rejected":
+            logger.error(f"🚦 处理队列已满，丢弃消息: {message_id}")
+    
+    def _run_handler(self, event: Dict[str, Any]):
+        """处理消息 (线程池中执行，同一会话按顺序)"""
         event_data = event.get("event", {})
         message = event_data.get("message", {})
         sender = event_data.get("sender", {})
@@ -219,6 +253,10 @@ class FeishuBot:
                 "content": f"❌ 处理消息时出错: {str(e)[:100]}"
             })
     
+    def metrics(self) -> Dict:
+        """排队深度、处理耗时等指标"""
+        return {"handler": self.pipeline.metrics(), "sender": self.sender.metrics(), "resources": self.resources.stats()}
+    
     def _handle_text(self, content: Dict, message: Dict, sender: Dict) -> Dict:
         """处理文本消息"""
         text = content.get("text", "").strip()
@@ -244,7 +282,7 @@ class FeishuBot:
         logger.info(f"🖼️ 图片消息: {image_key[:30]}...")
         
         # 下载图片
-        image_path = self._download_resource(image_key, "image")
+        image_path = self._download_resource(message.get("message_id", ""), image_key, "image")
         
         if image_path:
             # 可以在这里添加图片分析
@@ -272,12 +310,12 @@ class FeishuBot:
             }
         
         # 下载语音文件
-        audio_path = self._download_resource(file_key, "audio")
+        audio_path = self._download_resource(message.get("message_id", ""), file_key, "audio")
         
         if audio_path and audio_path.exists():
             try:
-                # 转录语音
-                transcript = quick_transcribe(str(audio_path))
+                # 转录语音 (按内容哈希缓存，转发的同一段语音不再转录)
+                transcript = self.resources.memo(audio_path, "transcript", lambda: quick_transcribe(str(audio_path)))
                 
                 logger.info(f"🎯 转录结果: {transcript}")
                 
@@ -353,7 +391,11 @@ class FeishuBot:
         return {"type": "text", "content": help_text}
     
     def _cmd_status(self, args, sender) -> Dict:
-        return {"type": "text", "content": "✅ 系统运行正常\n🤖 飞书机器人已连接\n🎤 语音转文字: " + ("已启用" if WHISPER_AVAILABLE else "未启用")}
+        handler = self.pipeline.metrics()
+        latency = handler["handler"]
+        return {"type": "text", "content": "✅ 系统运行正常\n🤖 飞书机器人已连接\n🎤 语音转文字: " + ("已启用" if WHISPER_AVAILABLE else "未启用")
+                + f"\n📥 排队 {handler['queue_depth']} 条, 处理中 {handler['in_flight']} 条"
+                + (f"\n⏱️ 处理耗时 p50 {latency['p50_ms']}ms / p95 {latency['p95_ms']}ms" if latency["count"] else "")}
     
     def _cmd_price(self, args, sender) -> Dict:
         symbol = args[0].upper() if args else "BTC"
@@ -390,51 +432,72 @@ class FeishuBot:
         
         return f"💰 {symbol}/USDT 价格查询\n\n当前价格: 正在通过 Binance API 查询...\n24h 涨跌幅: --"
     
-    def _download_resource(self, key: str, resource_type: str) -> Optional[Path]:
-        """下载资源文件"""
+    def _tenant_token(self) -> str:
+        """tenant_access_token，过期前 5 分钟刷新"""
+        if self._token and time.time() < self._token_expire - 300:
+            return self._token
+        resp = self.http.post(f"{FEISHU_API}/auth/v3/tenant_access_token/internal",
+                              json={"app_id": self.app_id, "app_secret": self.app_secret}, timeout=10)
+        data = resp.json()
+        if data.get("code") != 0:
+            raise RuntimeError(f"获取 tenant_access_token 失败: {data.get('msg')}")
+        self._token = data["tenant_access_token"]
+        self._token_expire = time.time() + data.get("expire", 7200)
+        return self._token
+    
+    def _download_resource(self, message_id: str, key: str, resource_type: str) -> Optional[Path]:
+        """下载消息资源 (流式写入磁盘缓存)，返回本地路径"""
+        ext = {"image": "png", "audio": "ogg", "file": "bin"}.get(resource_type, "bin")
+        
+        def download(write):
+            # 图片用 type=image，语音/文件用 type=file
+            api_type = "image" if resource_type == "image" else "file"
+            with self.http.get(f"{FEISHU_API}/im/v1/messages/{message_id}/resources/{key}",
+                               params={"type": api_type},
+                               headers={"Authorization": f"Bearer {self._tenant_token()}"},
+                               stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+                resp.raise_for_status()
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    write(chunk)
+        
         try:
-            # 使用飞书 API 下载资源
-            # 这里简化处理，实际需要调用 GetMessageResourceReq
-            
-            ext = {"image": "png", "audio": "ogg", "file": "bin"}.get(resource_type, "bin")
-            save_path = TEMP_DIR / f"{key[:20]}.{ext}"
-            
-            logger.info(f"⬇️ 下载资源: {key[:30]}... -> {save_path}")
-            
-            # TODO: 实现实际下载逻辑
-            # 需要使用 GetMessageResourceReq 或类似 API
-            
+            hits = self.resources.hits
+            save_path = self.resources.fetch(key, download, ext=ext)
+            source = "缓存" if self.resources.hits > hits else "下载"
+            logger.info(f"⬇️ 资源{source}: {key[:30]}... -> {save_path}")
             return save_path
         except Exception as e:
             logger.error(f"下载资源失败: {e}")
             return None
     
     def _send_reply(self, chat_id: str, result: Dict, original_type: str = "text"):
-        """发送回复"""
-        try:
-            msg_type = result.get("type", "text")
-            content = result.get("content", "")
-            
-            if msg_type == "text":
-                # 构建文本消息请求
-                req = (CreateMessageReq
-                       .builder()
-                       .receive_id_type("chat_id")
-                       .receive_id(chat_id)
-                       .content(json.dumps({"text": content}))
-                       .msg_type("text")
-                       .build())
-                
-                resp = self.client.im.v1.message.create(req)
-                
-                if resp.success():
-                    logger.info(f"✅ 消息发送成功")
-                else:
-                    logger.error(f"❌ 消息发送失败: {resp.msg}")
-            else:
-                logger.warning(f"暂不支持发送消息类型: {msg_type}")
-        except Exception as e:
-            logger.error(f"发送回复失败: {e}")
+        """发送回复: 交给发送池，失败自动重试，同一会话保持顺序"""
+        msg_type = result.get("type", "text")
+        if msg_type != "text":
+            logger.warning(f"暂不支持发送消息类型: {msg_type}")
+            return
+        self.sender.send(chat_id, result)
+    
+    def _deliver(self, chat_id: str, result: Dict) -> bool:
+        """实际调用发送接口 (发送池中执行)，失败返回 False 触发重试"""
+        content = result.get("content", "")
+        
+        # 构建文本消息请求
+        req = (CreateMessageReq
+               .builder()
+               .receive_id_type("chat_id")
+               .receive_id(chat_id)
+               .content(json.dumps({"text": content}))
+               .msg_type("text")
+               .build())
+        
+        resp = self.client.im.v1.message.create(req)
+        
+        if resp.success():
+            logger.info(f"✅ 消息发送成功")
+            return True
+        logger.error(f"❌ 消息发送失败: {resp.msg}")
+        return False
 
 
 class FeishuLongPollingBot(FeishuBot):
@@ -474,6 +537,16 @@ class FeishuLongPollingBot(FeishuBot):
                     self.send_response(500)
                     self.end_headers()
             
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps(self.bot.metrics(), ensure_ascii=False).encode())
+            
             def log_message(self, format, *args):
                 # 禁用默认日志
                 pass
@@ -484,6 +557,7 @@ class FeishuLongPollingBot(FeishuBot):
         
         logger.info(f"🌐 HTTP 事件服务器启动在端口 {port}")
         logger.info(f"   请在飞书事件订阅配置回调地址: http://your-server:{port}/")
+        logger.info(f"   运行指标: http://localhost:{port}/metrics")
         
         # 启动服务器
         try:
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+大文件按行随机读取 - file_read 的后端
+- mmap 打开文件，只解码需要返回的那几行
+- 稀疏行索引: 每 64KB 记录一次 (字节偏移, 之前的换行数)，内存占用与行数无关
+- 索引按路径缓存，文件 mtime / 大小 / inode 变化时重建
+- 关键字在字节层面查找 (mmap.find / 分块 lower)，不逐行解码
+"""
+
+import os
+import mmap
+import bisect
+import threading
+from collections import OrderedDict
+
+CHUNK_SIZE = 64 * 1024
+SEARCH_BLOCK = 4 * 1024 * 1024
+CACHE_SIZE = 32
+
+
+class LineIndex:
+    """单个文件的稀疏行索引"""
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        self.size = stat.st_size
+        self.offsets = []   # 各块起始字节偏移
+        self.lines_before = []   # 块起始之前的换行数
+        self.total_lines = 0
+        self._build()
+
+    def _build(self):
+        if not self.size:
+            return
+        newlines = 0
+        with open(self.path, "rb") as f:
+            pos = 0
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.offsets.append(pos)
+                self.lines_before.append(newlines)
+                newlines += chunk.count(b"\n")
+                pos += len(chunk)
+                last = chunk[-1:]
+        # 与 readlines() 一致: 末尾没有换行的最后一段也算一行
+        self.total_lines = newlines + (0 if last == b"\n" else 1)
+
+    # ========== 定位 ==========
+    def line_start(self, mm, lineno):
+        """第 lineno 行 (从 1 开始) 的起始字节偏移"""
+        if lineno <= 1:
+            return 0
+        # 找到之前换行数 <= lineno-2 的最后一个块，从块首往后数换行
+        i = bisect.bisect_right(self.lines_before, lineno - 2) - 1
+        pos, seen = self.offsets[i], self.lines_before[i]
+        while seen < lineno - 1:
+            nl = mm.find(b"\n", pos)
+            if nl < 0:
+                return self.size
+            pos = nl + 1
+            seen += 1
+        return pos
+
+    def line_of(self, mm, offset):
+        """字节偏移所在的行号 (从 1 开始)"""
+        i = bisect.bisect_right(self.offsets, offset) - 1
+        start = self.offsets[i]
+        return self.lines_before[i] + mm[start:offset].count(b"\n") + 1
+
+    def read_lines(self, mm, start, count):
+        """读取 [start, start+count) 行，只扫描这一段"""
+        begin = self.line_start(mm, start)
+        end = begin
+        for _ in range(count):
+            if end >= self.size:
+                break
+            nl = mm.find(b"\n", end)
+            end = self.size if nl < 0 else nl + 1
+        # 只按 \n 切分 (str.splitlines 还会在 \x0c、\u2028 等处断行，行号会对不上)
+        parts = mm[begin:end].split(b"\n")
+        tail = parts.pop()
+        lines = [part + b"\n" for part in parts] + ([tail] if tail else [])
+        return [line.decode("utf-8", errors="replace").replace("\r\n", "\n") for line in lines]
+
+    def find(self, mm, keyword, ignore_case=True):
+        """关键字首次出现的行号，找不到返回 None"""
+        needle = keyword.encode("utf-8")
+        if not needle:
+            return None
+        if not ignore_case or needle.lower() == needle.upper():
+            offset = mm.find(needle)
+            return None if offset < 0 else self.line_of(mm, offset)
+        # 忽略大小写: 分块 bytes.lower() 后查找 (只处理 ASCII 大小写)，块间重叠 len-1 字节
+        needle = needle.lower()
+        step = SEARCH_BLOCK
+        pos = 0
+        while pos < self.size:
+            offset = mm[pos:pos + step + len(needle) - 1].lower().find(needle)
+            if offset >= 0:
+                return self.line_of(mm, pos + offset)
+            pos += step
+        return None
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_index(path):
+    """取缓存的索引，文件变化时重建"""
+    real = os.path.realpath(path)
+    stat = os.stat(real)
+    key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with _cache_lock:
+        index = _cache.get(real)
+        if index is not None and index.key == key:
+            _cache.move_to_end(real)
+            return index
+    index = LineIndex(real, stat)
+    with _cache_lock:
+        _cache[real] = index
+        _cache.move_to_end(real)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
+
+
+def read_window(path, start=1, count=200, keyword=None):
+    """
+    读取文件的一个行窗口
+    有 keyword 时定位到首个匹配行前 5 行，窗口改为 20 行 (与 file_read 原有行为一致)
+    返回 (total_lines, start, lines)
+    """
+    index = get_index(path)
+    if not index.size:
+        return 0, start, []
+    with open(index.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if keyword:
+            hit = index.find(mm, keyword)
+            if hit is not None:
+                start, count = max(1, hit - 5), 20
+        start = max(1, start)
+        if start > index.total_lines or count <= 0:
+            return index.total_lines, start, []
+        return index.total_lines, start, index.read_lines(mm, start, count)
+
+
+if __name__ == "__main__":
+    import time
+    import tempfile
+
+    path = os.path.join(tempfile.gettempdir(), "file_index_demo.log")
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(1, 2000001):
+            f.write(f"2024-01-01 00:00:00 INFO 第{i}行 request id={i:08d} status=ok\n")
+        f.write("last line ERROR without newline")
+
+    def readlines_window(start, count, keyword=None):
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        if keyword:
+            for i, line in enumerate(lines, 1):
+                if keyword.lower() in line.lower():
+                    start, count = max(1, i - 5), 20
+                    break
+        return len(lines), lines[start - 1:start - 1 + count]
+
+    print(f"文件大小: {os.path.getsize(path) / 1024 / 1024:.1f}MB")
+    print("=== 正确性 ===")
+    # 换页符、\u2028 等不算换行，只有 \n 断行
+    special = os.path.join(tempfile.gettempdir(), "file_index_special.txt")
+    with open(special, "w", encoding="utf-8", newline="") as f:
+        f.write("a\x0cb\nc\u2028d\ne\n")
+    assert read_window(special) == (3, 1, ["a\x0cb\n", "c\u2028d\n", "e\n"]), read_window(special)
+    os.remove(special)
+    for args in [(1, 3), (1234567, 5), (1999999, 10), (2000001, 1), (2000005, 3)]:
+        total, _, lines = read_window(path, *args)
+        assert (total, lines) == readlines_window(*args), args
+    for kw in ["id=01500000", "error", "第42行"]:
+        total, start, lines = read_window(path, keyword=kw)
+        assert (total, lines) == readlines_window(1, 200, kw), kw
+        print(f"keyword={kw!r} -> 第 {start} 行起, {lines[5].strip()[:50]}")
+
+    print("=== 性能 ===")
+    t = time.perf_counter()
+    readlines_window(1500000, 200)
+    print(f"readlines: {(time.perf_counter() - t) * 1000:.0f}ms")
+    _cache.clear()
+    t = time.perf_counter()
+    read_window(path, 1500000, 200)
+    print(f"首次 (建索引): {(time.perf_counter() - t) * 1000:.0f}ms")
+    t = time.perf_counter()
+    for i in range(100):
+        read_window(path, 1000 + i * 19000, 200)
+    print(f"重复读取窗口: {(time.perf_counter() - t) * 10:.2f}ms/次")
+    t = time.perf_counter()
+    read_window(path, keyword="ERROR without")
+    print(f"关键字查找 (文件末尾): {(time.perf_counter() - t) * 1000:.0f}ms")
+    os.remove(path)
@@ -10,6 +10,8 @@ from dataclasses import dataclass
 from typing import Any, Optional, List, Dict
 from enum import Enum
 
+from agent_context import ContextManager, UsageMeter
+
 
 class StepOutcome:
     """单步执行结果"""
@@ -28,14 +30,21 @@ class GenericAgentLoop:
         result = agent.run("帮我查一下天气")
     """
     
-    def __init__(self, max_turns=40, verbose=True):
+    def __init__(self, max_turns=40, verbose=True, context_budget=60000):
         self.max_turns = max_turns
         self.verbose = verbose
         self.messages = []
         self.turn = 0
+        self.tool_log = []  # 每次工具调用的结果与耗时
         self.working_checkpoint = ""
         self.tools_schema = None
         self.system_prompt = self._get_default_system_prompt()
+        # 稳定前缀 + 滚动窗口，每轮由它生成 self.messages
+        self.context = ContextManager(token_budget=context_budget)
+        self.context.set_prefix(system_prompt=self.system_prompt)
+        self.usage = UsageMeter()
+        self._early = {}
+        self._turn_t0 = None
         
     def _get_default_system_prompt(self):
         """默认系统提示词"""
@@ -62,10 +71,87 @@ class GenericAgentLoop:
     def set_system_prompt(self, prompt: str):
         """设置系统提示词"""
         self.system_prompt = prompt
+        self.context.set_prefix(system_prompt=prompt)
     
     def set_tools_schema(self, schema: List[Dict]):
         """设置工具 schema"""
         self.tools_schema = schema
+        self.context.set_prefix(tools=schema)
+    
+    def set_prefix_excerpts(self, excerpts: List[str]):
+        """设置放进缓存前缀的参考资料 (如相关 SOP)"""
+        self.context.set_prefix(excerpts=excerpts)
+    
+    def _chat(self, llm_client) -> Dict:
+        """用当前上下文调用 LLM，并记录本轮缓存/未缓存 token"""
+        self.messages = self.context.build()
+        started = self._turn_t0 = time.perf_counter()
+        self._early = {}
+        if getattr(llm_client, 'supports_streaming', False):
+            # 流式客户端: 工具参数一完整就提前启动只读工具 (之前出现过写操作则不再提前)
+            from generic_agent_tools import prestart_tool
+            seen = []
+            
+            def on_tool_use(name, args):
+                index = len(seen)
+                seen.append((name, args))
+                if all(self._early.get(i) for i in range(index)):
+                    future = prestart_tool(name, args, started)
+                    if future:
+                        self._early[index] = future
+            
+            response = llm_client.chat(
+                messages=self.messages,
+                tools=self.tools_schema,
+                on_tool_use=on_tool_use
+            )
+            # 与最终解析出的调用不一致的提前结果作废
+            calls = self._parse_tool_calls(response)
+            self._early = {i: f for i, f in self._early.items()
+                           if i < len(calls) and calls[i] == seen[i]}
+        else:
+            response = llm_client.chat(
+                messages=self.messages,
+                tools=self.tools_schema
+            )
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        metrics = self.usage.record(self.turn, self.messages, self.context,
+                                    response.get('usage'), latency_ms)
+        stream = response.get('metrics') or {}
+        metrics['ttft_ms'] = stream.get('ttft_ms')
+        metrics['tokens_per_sec'] = stream.get('tokens_per_sec')
+        if self.verbose:
+            print(f"📊 输入token: 缓存 {metrics['cached_input_tokens']} / "
+                  f"未缓存 {metrics['uncached_input_tokens']} ({metrics['source']}), {latency_ms}ms"
+                  + (f", 首token {stream['ttft_ms']}ms, {stream['tokens_per_sec']} tok/s" if stream else ""))
+        return response
+    
+    def _record_turn(self, response: Dict, calls: List[tuple], next_prompt: str):
+        """把本轮助手输出和工具结果追加进滚动窗口"""
+        assistant = response.get('content', '') or ''
+        for tool_name, args in calls:
+            assistant += f"\n[调用工具] {tool_name} {json.dumps(args, ensure_ascii=False)[:500]}"
+        self.context.add("assistant", assistant.strip() or "(无输出)")
+        self.context.add("user", next_prompt)
+    
+    @staticmethod
+    def _parse_tool_calls(response: Dict) -> List[tuple]:
+        """取出本轮全部工具调用 [(tool_name, args), ...]"""
+        calls = []
+        for tool_call in response.get('tool_calls') or []:
+            function = tool_call.get('function', {})
+            calls.append((function.get('name', ''), json.loads(function.get('arguments') or '{}')))
+        return calls
+    
+    @staticmethod
+    def _format_results(results: List[Dict]) -> str:
+        """把工具结果拼成下一轮 prompt，附带每个调用的耗时"""
+        parts = []
+        for entry in results:
+            result_str = json.dumps(entry['result'], ensure_ascii=False, default=str)[:4000]
+            parts.append(f'<tool_result tool="{entry["tool"]}" elapsed_ms="{entry["elapsed_ms"]}">\n'
+                         f'{result_str}\n</tool_result>\n\n')
+        return ''.join(parts)
     
     def run(self, user_input: str, llm_client=None) -> Dict:
         """
@@ -78,11 +164,11 @@ class GenericAgentLoop:
         Returns:
             {'result': 'SUCCESS/EXITED/MAX_TURNS', 'data': ...}
         """
-        self.messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": user_input}
-        ]
+        self.context.reset(user_input)
+        self.messages = self.context.build()
+        self.usage = UsageMeter()
         self.turn = 0
+        self.tool_log = []
         
         # 如果没有 LLM 客户端，返回提示
         if llm_client is None:
@@ -102,34 +188,34 @@ class GenericAgentLoop:
             
             # 调用 LLM
             try:
-                response = llm_client.chat(
-                    messages=self.messages,
-                    tools=self.tools_schema
-                )
+                response = self._chat(llm_client)
             except Exception as e:
                 return {"status": "error", "msg": f"LLM 调用失败: {e}"}
             
-            # 解析工具调用
-            if not response.get('tool_calls'):
-                tool_name = 'no_tool'
-                args = {}
-            else:
-                tool_call = response['tool_calls'][0]
-                tool_name = tool_call.get('function', {}).get('name', '')
-                args = json.loads(tool_call.get('function', {}).get('arguments', '{}'))
+            # 解析工具调用 (同一轮可能有多个)
+            calls = self._parse_tool_calls(response)
+            if not calls:
+                calls = [('no_tool', {})]
             
             if self.verbose:
-                print(f"🛠️ 工具: {tool_name}")
-                print(f"📥 参数: {json.dumps(args, ensure_ascii=False)[:200]}...")
+                for tool_name, args in calls:
+                    print(f"🛠️ 工具: {tool_name}")
+                    print(f"📥 参数: {json.dumps(args, ensure_ascii=False)[:200]}...")
             
-            # 执行工具
-            from generic_agent_tools import execute_tool, WorkingCheckpoint
+            # 执行工具: 只读调用并发，写操作串行，结果按原顺序返回
+            from generic_agent_tools import execute_tools, WorkingCheckpoint
             
-            tool_result = execute_tool(tool_name, **args)
+            results = execute_tools(calls, early=self._early, t0=self._turn_t0)
+            self.tool_log.extend(results)
             
             # 检查是否需要用户干预
-            if isinstance(tool_result, dict) and tool_result.get('status') == 'INTERRUPT':
+            for entry in results:
+                tool_result = entry['result']
+                if not (isinstance(tool_result, dict) and tool_result.get('status') == 'INTERRUPT'):
+                    continue
                 intent = tool_result.get('intent')
+                # 先记入上下文，continue_with_input 时模型能看到自己的提问
+                self._record_turn(response, calls, self._format_results(results))
                 
                 if intent == 'HUMAN_INTERVENTION':
                     # 需要用户确认
@@ -148,29 +234,30 @@ class GenericAgentLoop:
                     }
             
             if self.verbose:
-                print(f"📤 结果: {str(tool_result)[:200]}...")
+                for entry in results:
+                    print(f"📤 结果 [{entry['tool']} {entry['elapsed_ms']}ms]: {str(entry['result'])[:200]}...")
             
             # 构建下一轮 prompt
-            result_str = json.dumps(tool_result, ensure_ascii=False, default=str)[:4000]
-            next_prompt = f"<tool_result>\n{result_str}\n</tool_result>\n\n"
+            next_prompt = self._format_results(results)
             
             # 如果有工作便签，注入
             checkpoint = WorkingCheckpoint.get()
             if checkpoint:
                 next_prompt += f"[工作便签]\n{checkpoint}\n\n"
             
-            # 添加用户的后续输入（如果有）
-            self.messages = [{"role": "user", "content": next_prompt}]
-            
             # 检查退出条件
-            if tool_name == 'no_tool':
-                return {"status": "SUCCESS", "data": response.get('content', ''), "turns": self.turn}
+            if calls[0][0] == 'no_tool':
+                return {"status": "SUCCESS", "data": response.get('content', ''), "turns": self.turn,
+                        "usage": self.usage.totals()}
+            
+            # 本轮进入滚动窗口 (超出预算的早期轮次会被摘要)
+            self._record_turn(response, calls, next_prompt)
         
-        return {"status": "MAX_TURNS_EXCEEDED", "turns": self.max_turns}
+        return {"status": "MAX_TURNS_EXCEEDED", "turns": self.max_turns, "usage": self.usage.totals()}
     
     def continue_with_input(self, user_response: str, llm_client) -> Dict:
         """继续处理用户输入后的情况"""
-        self.messages.append({"role": "user", "content": user_response})
+        self.context.add("user", user_response)
         
         for turn in range(self.max_turns - self.turn):
             self.turn += 1
@@ -180,35 +267,25 @@ class GenericAgentLoop:
             
             # 调用 LLM
             try:
-                response = llm_client.chat(
-                    messages=self.messages,
-                    tools=self.tools_schema
-                )
+                response = self._chat(llm_client)
             except Exception as e:
                 return {"status": "error", "msg": f"LLM 调用失败: {e}"}
             
             # 解析工具调用
             if not response.get('tool_calls'):
-                return {"status": "SUCCESS", "data": response.get('content', ''), "turns": self.turn}
-            
-            tool_call = response['tool_calls'][0]
-            tool_name = tool_call.get('function', {}).get('name', '')
-            args = json.loads(tool_call.get('function', {}).get('arguments', '{}'))
+                return {"status": "SUCCESS", "data": response.get('content', ''), "turns": self.turn,
+                        "usage": self.usage.totals()}
             
             # 执行工具
-            from generic_agent_tools import execute_tool
-            tool_result = execute_tool(tool_name, **args)
-            
-            # 检查退出
-            if tool_name == 'no_tool':
-                return {"status": "SUCCESS", "data": response.get('content', ''), "turns": self.turn}
+            from generic_agent_tools import execute_tools
+            calls = self._parse_tool_calls(response)
+            results = execute_tools(calls, early=self._early, t0=self._turn_t0)
+            self.tool_log.extend(results)
             
             # 继续循环
-            result_str = json.dumps(tool_result, ensure_ascii=False, default=str)[:4000]
-            next_prompt = f"<tool_result>\n{result_str}\n</tool_result>\n\n"
-            self.messages = [{"role": "user", "content": next_prompt}]
+            self._record_turn(response, calls, self._format_results(results))
         
-        return {"status": "MAX_TURNS_EXCEEDED"}
+        return {"status": "MAX_TURNS_EXCEEDED", "usage": self.usage.totals()}
 
 
 # ========== 模拟 LLM 客户端（用于测试）==========
@@ -242,16 +319,22 @@ class MockLLMClient:
 if __name__ == '__main__':
     print("=== 测试 GenericAgentLoop ===")
     
-    # 创建模拟响应：第一次调用 file_read，第二次结束
+    # 创建模拟响应：第一次同时读取两个文件，第二次结束
     mock_responses = [
         {
-            "content": "我来看看这个文件",
+            "content": "我来看看这两个文件",
             "tool_calls": [
                 {
                     "function": {
                         "name": "file_read",
                         "arguments": json.dumps({"path": "ga.py", "count": 10})
                     }
+                },
+                {
+                    "function": {
+                        "name": "file_read",
+                        "arguments": json.dumps({"path": "generic_agent_tools.py", "count": 5})
+                    }
                 }
             ]
         },
@@ -264,5 +347,7 @@ if __name__ == '__main__':
     client = MockLLMClient(mock_responses)
     agent = GenericAgentLoop(verbose=True)
     
-    result = agent.run("看看 ga.py 的内容", llm_client=client)
+    result = agent.run("看看 ga.py 和 generic_agent_tools.py 的内容", llm_client=client)
     print(f"\n结果: {result}")
+    print(f"LLM 调用次数: {client.call_count}, 工具耗时: "
+          f"{[(e['tool'], e['started_ms'], e['elapsed_ms']) for e in agent.tool_log]}")
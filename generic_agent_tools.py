@@ -12,8 +12,32 @@ import subprocess
 import threading
 import time
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from file_index import read_window
 
 # ========== 工具 1: code_run ==========
+# Python 代码默认交给预热解释器池执行 (仅 POSIX)，省掉每次启动解释器 + import 的时间
+USE_WARM_INTERPRETER = os.name != 'nt'
+WARM_POOL_SIZE = 2
+WARM_POOL_MEMORY_MB = 2048
+WARM_POOL_MAX_TASKS = 50
+
+_warm_pool = None
+_warm_pool_lock = threading.Lock()
+
+
+def _get_warm_pool():
+    global _warm_pool
+    with _warm_pool_lock:
+        if _warm_pool is None:
+            from warm_interpreter import WarmInterpreterPool
+            _warm_pool = WarmInterpreterPool(
+                size=WARM_POOL_SIZE, memory_mb=WARM_POOL_MEMORY_MB, max_tasks=WARM_POOL_MAX_TASKS
+            )
+        return _warm_pool
+
+
 def code_run(code, code_type="python", timeout=60, cwd=None):
     """执行 Python/Bash 代码"""
     preview = (code[:60].replace('\n', ' ') + '...') if len(code) > 60 else code.strip()
@@ -23,6 +47,12 @@ def code_run(code, code_type="python", timeout=60, cwd=None):
     os.makedirs(cwd, exist_ok=True)
     tmp_path = None
     
+    if code_type == "python" and USE_WARM_INTERPRETER:
+        try:
+            return _get_warm_pool().run(code, cwd=cwd, timeout=timeout)
+        except Exception as e:
+            return {"status": "error", "msg": str(e)}
+    
     if code_type == "python":
         tmp_file = tempfile.NamedTemporaryFile(suffix=".ai.py", delete=False, mode='w', encoding='utf-8')
         tmp_file.write(code)
@@ -53,18 +83,20 @@ def code_run(code, code_type="python", timeout=60, cwd=None):
             cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
             bufsize=0, cwd=cwd
         )
-        start_t = time.time()
         t = threading.Thread(target=stream_reader, args=(process, full_stdout), daemon=True)
         t.start()
         
-        while t.is_alive():
-            if time.time() - start_t > timeout:
-                process.kill()
-                full_stdout.append("\n[Timeout Error] 超时强制终止")
-                break
-            time.sleep(0.5)
+        # 输出读完即返回，不再按 0.5s 轮询
+        t.join(timeout)
+        if t.is_alive():
+            process.kill()
+            full_stdout.append("\n[Timeout Error] 超时强制终止")
         
         t.join(timeout=1)
+        try:
+            process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            pass
         exit_code = process.poll()
         
         stdout_str = "".join(full_stdout)
@@ -89,21 +121,8 @@ def file_read(path, start=1, count=200, keyword=None, show_linenos=True):
         if not os.path.exists(path):
             return {"status": "error", "msg": f"文件不存在: {path}"}
         
-        with open(path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        total_lines = len(lines)
-        
-        if keyword:
-            # 搜索关键字
-            for i, line in enumerate(lines, 1):
-                if keyword.lower() in line.lower():
-                    start = max(1, i - 5)
-                    count = 20
-                    break
-        
-        end = min(start + count - 1, total_lines)
-        content_lines = lines[start-1:end]
+        # mmap + 缓存的稀疏行索引，只读取返回的窗口，大文件不整体载入内存
+        total_lines, start, content_lines = read_window(path, start, count, keyword)
         
         result = {
             "status": "success",
@@ -278,42 +297,55 @@ def start_long_term_update():
 
 
 # ========== 工具注册表 ==========
+# effect: 副作用类别，决定同一轮多个调用的调度方式
+#   read      只读，可与相邻的只读调用并发
+#   write     有副作用，按顺序单独执行
+#   interrupt 需要暂停 Agent (提问/长期记忆)，之后的调用不再执行
 TOOLS_REGISTRY = {
     "code_run": {
         "func": code_run,
-        "description": "执行 Python/Bash 代码"
+        "description": "执行 Python/Bash 代码",
+        "effect": "write"
     },
     "file_read": {
         "func": file_read,
-        "description": "读取文件内容"
+        "description": "读取文件内容",
+        "effect": "read"
     },
     "file_patch": {
         "func": file_patch,
-        "description": "精细化局部文件修改"
+        "description": "精细化局部文件修改",
+        "effect": "write"
     },
     "file_write": {
         "func": file_write,
-        "description": "新建/覆盖/追加文件"
+        "description": "新建/覆盖/追加文件",
+        "effect": "write"
     },
     "web_scan": {
         "func": web_scan,
-        "description": "获取页面内容"
+        "description": "获取页面内容",
+        "effect": "read"
     },
     "web_execute_js": {
         "func": web_execute_js,
-        "description": "执行 JavaScript 控制浏览器"
+        "description": "执行 JavaScript 控制浏览器",
+        "effect": "write"
     },
     "ask_user": {
         "func": ask_user,
-        "description": "向用户提问"
+        "description": "向用户提问",
+        "effect": "interrupt"
     },
     "update_working_checkpoint": {
         "func": WorkingCheckpoint.update,
-        "description": "更新工作便签"
+        "description": "更新工作便签",
+        "effect": "write"
     },
     "start_long_term_update": {
         "func": start_long_term_update,
-        "description": "准备长期记忆更新"
+        "description": "准备长期记忆更新",
+        "effect": "interrupt"
     }
 }
 
@@ -330,6 +362,87 @@ def execute_tool(tool_name, **kwargs):
         return {"status": "error", "msg": str(e)}
 
 
+_POOL = None
+_POOL_LOCK = threading.Lock()
+MAX_PARALLEL_TOOLS = 8
+
+
+def _get_pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=MAX_PARALLEL_TOOLS, thread_name_prefix="tool")
+        return _POOL
+
+
+def _timed_call(tool_name, args, t0):
+    started = time.perf_counter()
+    result = execute_tool(tool_name, **args)
+    finished = time.perf_counter()
+    return {
+        "tool": tool_name,
+        "args": args,
+        "result": result,
+        "started_ms": round((started - t0) * 1000, 1),
+        "elapsed_ms": round((finished - started) * 1000, 1)
+    }
+
+
+def prestart_tool(tool_name, args, t0):
+    """流式响应中工具参数刚完整时提前启动只读工具，返回 Future；其他类别返回 None"""
+    if TOOLS_REGISTRY.get(tool_name, {}).get("effect") != "read":
+        return None
+    return _get_pool().submit(_timed_call, tool_name, args, t0)
+
+
+def execute_tools(calls, early=None, t0=None):
+    """执行同一轮的多个工具调用
+    
+    calls: [(tool_name, args), ...]
+    连续的只读调用放进线程池并发执行，写操作在前面的调用完成后单独执行，
+    保证读写顺序与模型给出的顺序一致。遇到 interrupt 类工具后，剩余调用标记为 skipped。
+    
+    early: {下标: Future}，由 prestart_tool 提前启动的只读调用，直接取结果不再重复执行
+    
+    Returns:
+        与 calls 顺序一致的列表，每项含 tool/args/result/started_ms/elapsed_ms
+    """
+    t0 = time.perf_counter() if t0 is None else t0
+    early = early or {}
+    results = [None] * len(calls)
+    batch = []
+    
+    def flush_batch():
+        if len(batch) == 1 and batch[0] not in early:
+            i = batch[0]
+            results[i] = _timed_call(*calls[i], t0)
+        elif batch:
+            futures = [(i, early.get(i) or _get_pool().submit(_timed_call, *calls[i], t0)) for i in batch]
+            for i, future in futures:
+                results[i] = future.result()
+        batch.clear()
+    
+    for i, (tool_name, args) in enumerate(calls):
+        effect = TOOLS_REGISTRY.get(tool_name, {}).get("effect", "write")
+        if effect == "read":
+            batch.append(i)
+            continue
+        flush_batch()
+        results[i] = _timed_call(tool_name, args, t0)
+        if effect == "interrupt":
+            for j in range(i + 1, len(calls)):
+                results[j] = {
+                    "tool": calls[j][0],
+                    "args": calls[j][1],
+                    "result": {"status": "skipped", "msg": f"{tool_name} 中断了本轮执行"},
+                    "started_ms": None,
+                    "elapsed_ms": 0
+                }
+            return results
+    flush_batch()
+    return results
+
+
 if __name__ == '__main__':
     # 测试
     print("=== 测试 code_run ===")
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+增量指标引擎 - 每根新K线 O(1) 更新
+- 滚动窗口和 (SMA / RSI / ATR / ADX)
+- Wilder 平滑 (RSI / ATR, 与 safe_trading_bot_v2 口径一致)
+- 滑动窗口 Welford 方差 (布林带)
+
+与 trading_bot_pro.TechnicalAnalysis 的批量函数口径一致，
+运行 `python3 indicator_engine.py` 会用随机K线逐根对比两者结果。
+"""
+
+import copy
+import math
+from collections import deque
+
+
+# ========== 基础组件 ==========
+class RollingSum:
+    """固定窗口滚动和
+
+    浮点累加会漂移，每 resync_every 次更新用 fsum 重算一次
+    """
+
+    def __init__(self, period, resync_every=1000):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self.resync_every = resync_every
+        self._updates = 0
+
+    def push(self, x):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(x)
+        self.total += x
+        self._updates += 1
+        if self._updates % self.resync_every == 0:
+            self.total = math.fsum(self.window)
+
+    def __len__(self):
+        return len(self.window)
+
+    @property
+    def full(self):
+        return len(self.window) == self.period
+
+    @property
+    def mean(self):
+        return self.total / self.period if self.full else None
+
+
+class RollingVariance:
+    """滑动窗口 Welford 方差 (总体方差，除以 period)"""
+
+    def __init__(self, period):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def push(self, x):
+        n = len(self.window)
+        if n < self.period:
+            # 窗口未满: 标准 Welford 增加
+            n += 1
+            delta = x - self.mean
+            self.mean += delta / n
+            self.m2 += delta * (x - self.mean)
+        else:
+            # 窗口已满: 一进一出
+            old = self.window[0]
+            old_mean = self.mean
+            self.mean += (x - old) / n
+            self.m2 += (x - old) * (x - self.mean + old - old_mean)
+            if self.m2 < 0:
+                self.m2 = 0.0
+        self.window.append(x)
+
+    @property
+    def full(self):
+        return len(self.window) == self.period
+
+    @property
+    def variance(self):
+        return self.m2 / self.period if self.full else None
+
+
+class WilderAverage:
+    """Wilder 平滑: 前 period 个值取均值作种子，之后 avg = (avg*(n-1) + x) / n"""
+
+    def __init__(self, period):
+        self.period = period
+        self.count = 0
+        self._seed = 0.0
+        self.value = None
+
+    def push(self, x):
+        self.count += 1
+        if self.value is None:
+            self._seed += x
+            if self.count == self.period:
+                self.value = self._seed / self.period
+        else:
+            self.value = (self.value * (self.period - 1) + x) / self.period
+
+
+class StreamingEMA:
+    """指数移动平均
+
+    seed="first": 以第一个价格为种子 (trading_bot_pro 口径)
+    seed="sma":   以前 period 个价格的均值为种子 (safe_trading_bot_v2 口径)
+    """
+
+    def __init__(self, period, seed="first"):
+        self.period = period
+        self.multiplier = 2 / (period + 1)
+        self.seed = seed
+        self.count = 0
+        self._ema = None
+        self._seed_sum = 0.0
+
+    def push(self, price):
+        self.count += 1
+        if self.seed == "sma":
+            if self._ema is None:
+                self._seed_sum += price
+                if self.count == self.period:
+                    self._ema = self._seed_sum / self.period
+                return
+        elif self._ema is None:
+            self._ema = price
+            return
+        self._ema = (price - self._ema) * self.multiplier + self._ema
+
+    @property
+    def value(self):
+        if self.count < self.period:
+            return None
+        return self._ema
+
+
+# ========== 单个交易对的指标状态 ==========
+class SymbolIndicators:
+    """单个交易对的全部指标状态，push() 一根已收盘K线"""
+
+    def __init__(self, sma_periods=(20, 50), ema_periods=(20, 50), rsi_period=14,
+                 atr_period=14, adx_period=14, bb_period=20, bb_std=2, volume_period=20):
+        self.count = 0
+        self.last_close = None
+        self.prev_high = None
+        self.prev_low = None
+        self.prev_close = None
+
+        self.sma = {p: RollingSum(p) for p in sma_periods}
+        self.ema = {p: StreamingEMA(p, "first") for p in ema_periods}
+        self.ema_sma_seed = {p: StreamingEMA(p, "sma") for p in ema_periods}
+
+        self.rsi_period = rsi_period
+        self.gains = RollingSum(rsi_period)
+        self.losses = RollingSum(rsi_period)
+        self.wilder_gain = WilderAverage(rsi_period)
+        self.wilder_loss = WilderAverage(rsi_period)
+
+        self.atr_period = atr_period
+        self.tr = RollingSum(atr_period)
+        self.wilder_tr = WilderAverage(atr_period)
+
+        self.adx_period = adx_period
+        self.adx_plus_dm = RollingSum(adx_period)
+        self.adx_minus_dm = RollingSum(adx_period)
+        self.adx_tr = RollingSum(adx_period)
+
+        self.bb_std = bb_std
+        self.bb = RollingVariance(bb_period)
+
+        self.volume_period = volume_period
+        self.volume = RollingSum(volume_period)
+        self.volume_total = 0.0
+
+    def push(self, high, low, close, volume=0.0):
+        """追加一根K线"""
+        if self.prev_close is not None:
+            change = close - self.prev_close
+            gain = change if change > 0 else 0
+            loss = abs(change) if change <= 0 else 0
+            self.gains.push(gain)
+            self.losses.push(loss)
+            self.wilder_gain.push(gain)
+            self.wilder_loss.push(loss)
+
+            tr = max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+            self.tr.push(tr)
+            self.wilder_tr.push(tr)
+            self.adx_tr.push(tr)
+            self.adx_plus_dm.push(max(0, high - self.prev_high))
+            self.adx_minus_dm.push(max(0, self.prev_low - low))
+
+        for ind in self.sma.values():
+            ind.push(close)
+        for ind in self.ema.values():
+            ind.push(close)
+        for ind in self.ema_sma_seed.values():
+            ind.push(close)
+        self.bb.push(close)
+        self.volume.push(volume)
+        if self.count < self.volume_period:
+            self.volume_total += volume
+
+        self.count += 1
+        self.prev_high, self.prev_low, self.prev_close = high, low, close
+        self.last_close = close
+
+    # ----- trading_bot_pro 口径 -----
+    def sma_value(self, period):
+        return self.sma[period].mean
+
+    def ema_value(self, period):
+        return self.ema[period].value
+
+    def rsi(self):
+        """窗口均值RSI，数据不足返回50"""
+        if self.count < self.rsi_period + 1:
+            return 50
+        avg_gain = self.gains.total / self.rsi_period
+        avg_loss = self.losses.total / self.rsi_period
+        if avg_loss <= 0:
+            return 100
+        rs = avg_gain / avg_loss
+        return 100 - (100 / (1 + rs))
+
+    def atr(self):
+        """窗口均值ATR，数据不足返回0"""
+        if self.count < self.atr_period + 1:
+            return 0
+        return max(self.tr.total, 0.0) / self.atr_period
+
+    def adx(self):
+        """简化版ADX (窗口DX)，数据不足返回0"""
+        period = self.adx_period
+        if self.count < period * 2:
+            return 0
+        avg_tr = self.adx_tr.total / period
+        if avg_tr <= 0:
+            return 0
+        plus_di = 100 * (self.adx_plus_dm.total / period) / avg_tr
+        minus_di = 100 * (self.adx_minus_dm.total / period) / avg_tr
+        if plus_di + minus_di <= 0:
+            return 0
+        return 100 * abs(plus_di - minus_di) / (plus_di + minus_di)
+
+    def bollinger_bands(self):
+        """布林带 (upper, middle, lower)，数据不足返回 (None, None, None)"""
+        variance = self.bb.variance
+        if variance is None:
+            return None, None, None
+        std = variance ** 0.5
+        middle = self.bb.mean
+        return middle + self.bb_std * std, middle, middle - self.bb_std * std
+
+    def volume_sma(self):
+        """成交量均值，不足一个周期时取全部均值"""
+        if self.volume.full:
+            return self.volume.mean
+        return self.volume_total / self.count if self.count else 0
+
+    # ----- safe_trading_bot_v2 口径 (Wilder 平滑) -----
+    def ema_sma_seed_value(self, period):
+        return self.ema_sma_seed[period].value
+
+    def wilder_rsi(self):
+        """Wilder RSI，数据不足返回None"""
+        if self.wilder_gain.count <= self.rsi_period:
+            return None
+        avg_loss = self.wilder_loss.value
+        if avg_loss == 0:
+            return 100
+        rs = self.wilder_gain.value / avg_loss
+        return 100 - (100 / (1 + rs))
+
+    def wilder_atr(self):
+        """Wilder ATR，数据不足返回None"""
+        return self.wilder_tr.value
+
+
+# ========== 多交易对引擎 ==========
+class IndicatorEngine:
+    """按交易对维护指标状态
+
+    已收盘K线直接提交；未收盘K线在提交状态的副本上计算 (副本大小只与周期有关，
+    与历史长度无关)，同一根K线的下一次更新会替换它。
+    """
+
+    def __init__(self, **indicator_params):
+        self.indicator_params = indicator_params
+        self.committed = {}      # symbol -> SymbolIndicators (仅已收盘K线)
+        self.live = {}           # symbol -> SymbolIndicators (含未收盘K线)
+        self.last_open_time = {}  # symbol -> 最后一根已提交K线的开盘时间
+
+    def _state(self, symbol):
+        if symbol not in self.committed:
+            self.committed[symbol] = SymbolIndicators(**self.indicator_params)
+        return self.committed[symbol]
+
+    def update(self, symbol, open_time, high, low, close, volume=0.0, closed=True):
+        """更新一根K线，重复的已提交K线会被忽略"""
+        state = self._state(symbol)
+        last = self.last_open_time.get(symbol)
+        if last is not None and open_time <= last:
+            return self.get(symbol)
+
+        if closed:
+            state.push(high, low, close, volume)
+            self.last_open_time[symbol] = open_time
+            self.live[symbol] = state
+        else:
+            provisional = copy.deepcopy(state)
+            provisional.push(high, low, close, volume)
+            self.live[symbol] = provisional
+        return self.live[symbol]
+
+    def update_klines(self, symbol, klines, last_is_open=True):
+        """用币安K线数组更新，只处理新增的K线
+
+        klines: [[open_time, open, high, low, close, volume, ...], ...]
+        """
+        for i, k in enumerate(klines):
+            closed = not (last_is_open and i == len(klines) - 1)
+            self.update(symbol, int(k[0]), float(k[2]), float(k[3]), float(k[4]),
+                        float(k[5]), closed=closed)
+        return self.get(symbol)
+
+    def get(self, symbol):
+        """返回最新状态 (含未收盘K线)"""
+        return self.live.get(symbol) or self._state(symbol)
+
+    def reset(self, symbol):
+        self.committed.pop(symbol, None)
+        self.live.pop(symbol, None)
+        self.last_open_time.pop(symbol, None)
+
+
+def _close_enough(a, b, rel=1e-9, abs_tol=1e-9):
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=rel, abs_tol=abs_tol)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    from trading_bot_pro import TechnicalAnalysis as ProTA
+    from safe_trading_bot_v2 import TechnicalAnalysis as SafeTA
+
+    print("=== 增量指标引擎 vs 批量函数 ===")
+    random.seed(7)
+    highs, lows, closes = [], [], []
+    state = SymbolIndicators()
+    price = 60000.0
+    mismatches = 0
+    for i in range(600):
+        price *= 1 + random.gauss(0, 0.002)
+        high = price * (1 + abs(random.gauss(0, 0.001)))
+        low = price * (1 - abs(random.gauss(0, 0.001)))
+        highs.append(high)
+        lows.append(low)
+        closes.append(price)
+        state.push(high, low, price, random.random() * 10)
+
+        pairs = [
+            ("sma20", state.sma_value(20), ProTA.calculate_sma(closes, 20)),
+            ("sma50", state.sma_value(50), ProTA.calculate_sma(closes, 50)),
+            ("ema20", state.ema_value(20), ProTA.calculate_ema(closes, 20)),
+            ("rsi", state.rsi(), ProTA.calculate_rsi(closes, 14)),
+            ("atr", state.atr(), ProTA.calculate_atr(highs, lows, closes, 14)),
+            ("adx", state.adx(), ProTA.calculate_adx(highs, lows, closes, 14)),
+            ("wilder_rsi", state.wilder_rsi(), SafeTA.calculate_rsi(closes, 14)),
+            ("wilder_atr", state.wilder_atr(), SafeTA.calculate_atr(highs, lows, closes, 14)),
+        ]
+        safe_ema = SafeTA.calculate_ema(closes, 20)
+        pairs.append(("ema20_sma_seed", state.ema_sma_seed_value(20), safe_ema[-1] if safe_ema else None))
+        for name, got, want in zip(("bb_upper", "bb_middle", "bb_lower"),
+                                   state.bollinger_bands(),
+                                   ProTA.calculate_bollinger_bands(closes, 20, 2)):
+            pairs.append((name, got, want))
+
+        for name, got, want in pairs:
+            if not _close_enough(got, want):
+                mismatches += 1
+                print(f"  ❌ 第{i}根 {name}: 增量={got} 批量={want}")
+
+    print(f"✅ 对比完成, 不一致: {mismatches}")
+
+    engine = IndicatorEngine()
+    symbols = [f"SYM{i}USDT" for i in range(200)]
+    start = time.perf_counter()
+    for t in range(100):
+        for sym in symbols:
+            engine.update(sym, t, 101.0 + t % 3, 99.0, 100.0 + t % 5, 1.0)
+    elapsed = time.perf_counter() - start
+    print(f"⏱️  {len(symbols)}个币种 x 100根K线: {elapsed*1000:.1f}ms "
+          f"({elapsed / (len(symbols) * 100) * 1e6:.1f}µs/次更新)")
@@ -22,29 +22,75 @@ import glob
 from datetime import datetime
 from pathlib import Path
 
+from memory_store import MemoryStore
+from vector_index import VectorIndex
+
 # 配置
 DATA_DIR = os.path.expanduser('~/.knowledge_brain')
 NOTES_FILE = os.path.join(DATA_DIR, 'notes.json')
+INDEX_DB = os.path.join(DATA_DIR, 'brain.db')
+VECTOR_DIR = os.path.join(DATA_DIR, 'vectors')
+# 语义召回的最低混合分数
+SEMANTIC_MIN_SCORE = 0.15
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
 class KnowledgeBrain:
     def __init__(self):
-        self.notes = self.load_notes()
+        # 笔记存放在统一记忆存储里，每次 add 只写一行
+        self.store = MemoryStore(INDEX_DB)
+        self.vectors = VectorIndex(VECTOR_DIR, dtype='int8')
+        self.migrate_notes()
+        self.sync_vectors()
+    
+    def migrate_notes(self):
+        """旧版 notes.json 一次性导入"""
+        if not os.path.exists(NOTES_FILE):
+            return
+        with open(NOTES_FILE) as f:
+            notes = json.load(f)
+        for note in notes:
+            self._put(note)
+        if notes:
+            self.store.next_id('note', at_least=max(n['id'] for n in notes))
+        os.replace(NOTES_FILE, NOTES_FILE + '.migrated')
+    
+    def sync_vectors(self):
+        """向量索引缺少的笔记补录进去"""
+        missing = [(f"note:{n['id']}", self._vector_text(n), None)
+                   for n in self.list_all() if f"note:{n['id']}" not in self.vectors]
+        self.vectors.add_many(missing)
+    
+    @staticmethod
+    def _vector_text(note):
+        return ' '.join([note['content']] + note.get('tags', []))
     
-    def load_notes(self):
-        if os.path.exists(NOTES_FILE):
-            with open(NOTES_FILE) as f:
-                return json.load(f)
-        return []
+    def _put(self, note):
+        self.store.put(
+            f"note:{note['id']}", note['content'], kind='note',
+            tags=note.get('tags', []) + note.get('auto_tags', []),
+            meta={'id': note['id'], 'tags': note.get('tags', []), 'auto_tags': note.get('auto_tags', [])},
+            created_at=note.get('created_at')
+        )
     
-    def save_notes(self):
-        with open(NOTES_FILE, 'w') as f:
-            json.dump(self.notes, f, indent=2, ensure_ascii=False)
+    @staticmethod
+    def _note(item):
+        meta = item['meta']
+        return {
+            'id': meta['id'],
+            'content': item['content'],
+            'tags': meta.get('tags', []),
+            'created_at': item['created_at'],
+            'auto_tags': meta.get('auto_tags', [])
+        }
+    
+    @property
+    def notes(self):
+        return self.list_all()
     
     def add(self, content, tags=None):
         note = {
-            'id': len(self.notes) + 1,
+            'id': self.store.next_id('note'),
             'content': content,
             'tags': tags or [],
             'created_at': datetime.now().isoformat()
@@ -54,35 +100,30 @@ class KnowledgeBrain:
         keywords = content.split()
         note['auto_tags'] = [k for k in keywords if len(k) > 2][:5]
         
-        self.notes.append(note)
-        self.save_notes()
+        self._put(note)
+        self.vectors.add(f"note:{note['id']}", self._vector_text(note))
         return note['id']
     
     def search(self, query, limit=10):
-        """简单搜索 - 关键词匹配"""
-        results = []
-        query_lower = query.lower()
-        
-        for note in self.notes:
-            score = 0
-            if query_lower in note['content'].lower():
-                score += 10
-            for tag in note.get('tags', []) + note.get('auto_tags', []):
-                if query_lower in tag.lower():
-                    score += 5
-            
-            if score > 0:
-                results.append((score, note))
-        
-        results.sort(key=lambda x: -x[0])
-        return [n[1] for n in results[:limit]]
+        """检索 - 字面命中 (全文索引) 在前，其余按语义相似度补足"""
+        items = self.store.search(query, kind='note', limit=limit)
+        seen = {item['uid'] for item in items}
+        for hit in self.vectors.search(query, k=limit, min_score=SEMANTIC_MIN_SCORE):
+            if len(items) >= limit:
+                break
+            if hit['key'] not in seen:
+                item = self.store.get(hit['key'])
+                if item:
+                    items.append(item)
+                    seen.add(hit['key'])
+        return [self._note(item) for item in items]
     
     def list_all(self):
-        return self.notes
+        return [self._note(item) for item in self.store.list('note')]
     
     def delete(self, note_id):
-        self.notes = [n for n in self.notes if n['id'] != note_id]
-        self.save_notes()
+        self.store.delete(f"note:{note_id}")
+        self.vectors.remove(f"note:{note_id}")
 
 
 def main():
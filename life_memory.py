@@ -3,9 +3,13 @@
 案例60: 记忆记录
 """
 
+from vector_index import VectorIndex
+
+
 class LifeMemory:
-    def __init__(self):
+    def __init__(self, index_dir=None):
         self.memories = []
+        self.index = VectorIndex(index_dir)
     
     def remember(self, event, people=None):
         memory = {
@@ -14,16 +18,22 @@ class LifeMemory:
             'date': 'today'
         }
         self.memories.append(memory)
+        self.index.add(str(len(self.memories) - 1), ' '.join([event] + memory['people']))
         print(f"✅ 已记住: {event}")
     
-    def recall(self, keyword):
+    def recall(self, keyword, k=3, min_score=0.15):
+        """语义召回最相关的 k 条记忆"""
         print(f"\n🔍 回忆: {keyword}")
-        for m in self.memories:
-            if keyword in m['event']:
-                print(f"  - {m['event']}")
+        results = []
+        for hit in self.index.search(keyword, k=k, min_score=min_score):
+            m = self.memories[int(hit['key'])]
+            results.append(m)
+            print(f"  - {m['event']}")
+        return results
 
 
 if __name__ == '__main__':
     m = LifeMemory()
     m.remember('张三的生日', ['张三'])
     m.recall('生日')
+    m.recall('张三哪天过生日')
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+共享流式 LLM 客户端
+- requests.Session 连接池，多次调用复用 TLS 连接
+- 解析 SSE 增量: Anthropic Messages 流 / OpenAI 兼容 chat completions 流 (MiniMax 等)
+- 工具调用的 JSON 参数一拼完整就回调 on_tool_use，调用方可以提前开始执行
+- 统计首 token 延迟 (TTFT) 与输出速度 (tokens/s)
+- FakeSSEServer: 本地假 SSE 服务器，按脚本推送事件，用于离线测试
+"""
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# ========== SSE 解析 ==========
+def iter_sse(lines):
+    """把 SSE 文本行解析成 (event, data) 序列，data 为多行 data: 拼接后的字符串"""
+    event, data = None, []
+    for raw in lines:
+        line = raw.decode('utf-8') if isinstance(raw, bytes) else raw
+        line = line.rstrip('\r\n')
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = None, []
+        elif line.startswith(':'):
+            continue
+        elif line.startswith('event:'):
+            event = line[6:].strip()
+        elif line.startswith('data:'):
+            data.append(line[5:].lstrip(' '))
+    if data:
+        yield event, "\n".join(data)
+
+
+class StreamMetrics:
+    """单次流式调用的耗时统计"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.finished = None
+        self.output_tokens = 0
+        self.chunks = 0
+
+    def on_delta(self):
+        self.chunks += 1
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def finish(self, output_tokens=None):
+        self.finished = time.perf_counter()
+        if output_tokens:
+            self.output_tokens = output_tokens
+        elif not self.output_tokens:
+            self.output_tokens = self.chunks
+
+    def as_dict(self):
+        finished = self.finished or time.perf_counter()
+        ttft = (self.first_token - self.started) if self.first_token else None
+        gen_time = finished - (self.first_token or self.started)
+        return {
+            "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+            "total_ms": round((finished - self.started) * 1000, 1),
+            "output_tokens": self.output_tokens,
+            "tokens_per_sec": round(self.output_tokens / gen_time, 1) if gen_time > 0 else None
+        }
+
+
+# ========== 客户端 ==========
+class StreamingLLMClient:
+    """
+    流式 LLM 客户端
+
+    用法:
+        client = StreamingLLMClient("https://api.anthropic.com", headers={...})
+        result = client.stream_anthropic("/v1/messages", payload, on_text=print)
+        result["content"], result["tool_calls"], result["metrics"]
+    """
+
+    def __init__(self, base_url, headers=None, pool_size=4, connect_timeout=10, read_timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+
+    def close(self):
+        self.session.close()
+
+    def _events(self, path, payload):
+        """发送流式请求，逐个产出 SSE 事件 (读超时按两次数据之间的间隔计算)"""
+        resp = self.session.post(self.base_url + path, json=payload, stream=True, timeout=self.timeout)
+        try:
+            if resp.status_code >= 400:
+                raise requests.HTTPError(f"{resp.status_code}: {resp.text[:500]}", response=resp)
+            yield from iter_sse(resp.iter_lines())
+        finally:
+            resp.close()
+
+    def stream_anthropic(self, path, payload, on_text=None, on_tool_use=None):
+        """Anthropic Messages 流
+
+        Returns:
+            {"content", "tool_calls" (function 格式), "usage", "stop_reason", "metrics"}
+        """
+        payload = dict(payload, stream=True)
+        metrics = StreamMetrics()
+        blocks = {}
+        usage = {}
+        stop_reason = None
+
+        for event, data in self._events(path, payload):
+            msg = json.loads(data)
+            kind = msg.get("type", event)
+            if kind == "message_start":
+                usage.update(msg.get("message", {}).get("usage", {}))
+            elif kind == "content_block_start":
+                block = dict(msg["content_block"])
+                if block.get("type") == "tool_use":
+                    block["partial_json"] = ""
+                blocks[msg["index"]] = block
+            elif kind == "content_block_delta":
+                metrics.on_delta()
+                block = blocks[msg["index"]]
+                delta = msg["delta"]
+                if delta.get("type") == "text_delta":
+                    block["text"] = block.get("text", "") + delta["text"]
+                    if on_text:
+                        on_text(delta["text"])
+                elif delta.get("type") == "input_json_delta":
+                    block["partial_json"] += delta.get("partial_json", "")
+            elif kind == "content_block_stop":
+                block = blocks[msg["index"]]
+                if block.get("type") == "tool_use":
+                    block["input"] = json.loads(block.pop("partial_json") or "{}")
+                    if on_tool_use:
+                        on_tool_use(block["name"], block["input"])
+            elif kind == "message_delta":
+                usage.update(msg.get("usage", {}))
+                stop_reason = msg.get("delta", {}).get("stop_reason", stop_reason)
+            elif kind == "error":
+                raise RuntimeError(msg.get("error", msg))
+            # message_stop 之后继续读到流结束，连接才能放回连接池
+
+        metrics.finish(usage.get("output_tokens"))
+        ordered = [blocks[i] for i in sorted(blocks)]
+        return {
+            "content": "".join(b.get("text", "") for b in ordered if b.get("type") == "text"),
+            "tool_calls": [
+                {"id": b.get("id"), "function": {"name": b["name"], "arguments": json.dumps(b.get("input", {}))}}
+                for b in ordered if b.get("type") == "tool_use"
+            ],
+            "usage": usage,
+            "stop_reason": stop_reason,
+            "metrics": metrics.as_dict()
+        }
+
+    def stream_openai(self, path, payload, on_text=None, on_tool_use=None):
+        """OpenAI 兼容 chat completions 流 (MiniMax chatcompletion_v2 同格式)
+
+        工具调用按 index 拼接 arguments，下一个 index 出现或流结束时回调
+        """
+        payload = dict(payload, stream=True)
+        metrics = StreamMetrics()
+        text = []
+        calls = {}
+        usage = {}
+        finish_reason = None
+        emitted = set()
+
+        def emit_ready(before_index=None):
+            for i in sorted(calls):
+                if i in emitted or (before_index is not None and i >= before_index):
+                    continue
+                emitted.add(i)
+                if on_tool_use:
+                    fn = calls[i]["function"]
+                    on_tool_use(fn["name"], json.loads(fn["arguments"] or "{}"))
+
+        for _, data in self._events(path, payload):
+            if data.strip() == "[DONE]":
+                continue
+            msg = json.loads(data)
+            if msg.get("usage"):
+                usage.update(msg["usage"])
+            if msg.get("base_resp", {}).get("status_code"):
+                raise RuntimeError(msg["base_resp"])
+            for choice in msg.get("choices", []):
+                delta = choice.get("delta") or {}
+                if delta.get("content"):
+                    metrics.on_delta()
+                    text.append(delta["content"])
+                    if on_text:
+                        on_text(delta["content"])
+                for tc in delta.get("tool_calls") or []:
+                    metrics.on_delta()
+                    i = tc.get("index", 0)
+                    emit_ready(before_index=i)
+                    call = calls.setdefault(i, {"id": tc.get("id"), "function": {"name": "", "arguments": ""}})
+                    fn = tc.get("function") or {}
+                    call["function"]["name"] += fn.get("name") or ""
+                    call["function"]["arguments"] += fn.get("arguments") or ""
+                finish_reason = choice.get("finish_reason") or finish_reason
+
+        emit_ready()
+        metrics.finish(usage.get("completion_tokens"))
+        return {
+            "content": "".join(text),
+            "tool_calls": [calls[i] for i in sorted(calls)],
+            "usage": usage,
+            "stop_reason": finish_reason,
+            "metrics": metrics.as_dict()
+        }
+
+
+# ========== 本地假 SSE 服务器 ==========
+def anthropic_script(text="", tool_uses=(), chunk=8, input_tokens=100):
+    """生成 Anthropic 流事件脚本: 文本按 chunk 个字符切片，工具参数 JSON 分两段推送"""
+    events = [("message_start", {"type": "message_start",
+                                 "message": {"usage": {"input_tokens": input_tokens, "output_tokens": 1}}})]
+    index = 0
+    if text:
+        events.append(("content_block_start", {"type": "content_block_start", "index": 0,
+                                               "content_block": {"type": "text", "text": ""}}))
+        for i in range(0, len(text), chunk):
+            events.append(("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                   "delta": {"type": "text_delta", "text": text[i:i + chunk]}}))
+        events.append(("content_block_stop", {"type": "content_block_stop", "index": 0}))
+        index = 1
+    for n, (name, args) in enumerate(tool_uses):
+        raw = json.dumps(args, ensure_ascii=False)
+        half = len(raw) // 2
+        events.append(("content_block_start", {"type": "content_block_start", "index": index,
+                                               "content_block": {"type": "tool_use", "id": f"toolu_{n}",
+                                                                 "name": name, "input": {}}}))
+        for part in (raw[:half], raw[half:]):
+            events.append(("content_block_delta", {"type": "content_block_delta", "index": index,
+                                                   "delta": {"type": "input_json_delta", "partial_json": part}}))
+        events.append(("content_block_stop", {"type": "content_block_stop", "index": index}))
+        index += 1
+    pieces = sum(1 for e, _ in events if e == "content_block_delta")
+    events.append(("message_delta", {"type": "message_delta",
+                                     "delta": {"stop_reason": "tool_use" if tool_uses else "end_turn"},
+                                     "usage": {"output_tokens": pieces}}))
+    events.append(("message_stop", {"type": "message_stop"}))
+    return events
+
+
+def openai_script(text="", tool_uses=(), chunk=8):
+    """生成 OpenAI 兼容流事件脚本"""
+    events = []
+    for i in range(0, len(text), chunk):
+        events.append((None, {"choices": [{"index": 0, "delta": {"content": text[i:i + chunk]}}]}))
+    for n, (name, args) in enumerate(tool_uses):
+        raw = json.dumps(args, ensure_ascii=False)
+        half = len(raw) // 2
+        events.append((None, {"choices": [{"index": 0, "delta": {"tool_calls": [
+            {"index": n, "id": f"call_{n}", "function": {"name": name, "arguments": raw[:half]}}]}}]}))
+        events.append((None, {"choices": [{"index": 0, "delta": {"tool_calls": [
+            {"index": n, "function": {"arguments": raw[half:]}}]}}]}))
+    events.append((None, {"choices": [{"index": 0, "delta": {},
+                                       "finish_reason": "tool_calls" if tool_uses else "stop"}],
+                          "usage": {"completion_tokens": len(events)}}))
+    events.append((None, "[DONE]"))
+    return events
+
+
+class FakeSSEServer:
+    """本地假 SSE 服务器
+
+    server = FakeSSEServer()
+    server.script = anthropic_script("你好", [("file_read", {"path": "a.py"})])
+    server.start()
+    client = StreamingLLMClient(server.url)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, first_delay=0.05, event_delay=0.005):
+        self.script = []
+        self.first_delay = first_delay
+        self.event_delay = event_delay
+        self.requests = []       # 收到的请求体
+        self.connections = set()  # 客户端连接端口，用于验证连接复用
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                server.requests.append(json.loads(self.rfile.read(length) or b"{}"))
+                server.connections.add(self.client_address[1])
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(server.first_delay)
+                for event, data in server.script:
+                    body = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+                    frame = (f"event: {event}\n" if event else "") + f"data: {body}\n\n"
+                    raw = frame.encode('utf-8')
+                    self.wfile.write(f"{len(raw):x}\r\n".encode() + raw + b"\r\n")
+                    self.wfile.flush()
+                    time.sleep(server.event_delay)
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.host, self.port = self._httpd.server_address[:2]
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+if __name__ == "__main__":
+    server = FakeSSEServer(first_delay=0.2, event_delay=0.02).start()
+    client = StreamingLLMClient(server.url)
+
+    print("=== Anthropic 流 ===")
+    server.script = anthropic_script("我先读取这两个文件。",
+                                     [("file_read", {"path": "a.py"}), ("file_read", {"path": "b.py"})])
+    t0 = time.perf_counter()
+    seen = []
+    result = client.stream_anthropic("/v1/messages", {"model": "fake", "messages": []},
+                                     on_tool_use=lambda n, a: seen.append((n, a, round((time.perf_counter() - t0) * 1000))))
+    print(f"文本: {result['content']}")
+    print(f"工具调用 (name, args, 到达ms): {seen}")
+    print(f"指标: {result['metrics']}")
+
+    print("=== OpenAI 兼容流 ===")
+    server.script = openai_script("小红书评论改写结果", [("search", {"q": "咖啡"})])
+    result = client.stream_openai("/text/chatcompletion_v2", {"model": "fake", "messages": []})
+    print(f"文本: {result['content']}, 工具: {result['tool_calls']}")
+    print(f"指标: {result['metrics']}")
+    print(f"连接复用: {len(server.requests)} 次请求 / {len(server.connections)} 个连接")
+    server.stop()
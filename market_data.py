@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+WebSocket 行情订阅 - 替代每轮 REST 轮询K线
+- 订阅币安合约组合流 (<symbol>@kline_<interval> + <symbol>@bookTicker)
+- 每个交易对一个K线环形缓冲区
+- K线收盘时触发回调
+- 仅在断线/跳号后用 REST 回补缺失K线
+
+本地测试: python3 market_data.py  (启动 FakeKlineStreamServer 驱动订阅)
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+try:
+    import websockets
+    WEBSOCKETS_AVAILABLE = True
+except ImportError:
+    WEBSOCKETS_AVAILABLE = False
+
+
+INTERVAL_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "1d": 86_400_000,
+}
+
+
+def kline_from_event(k):
+    """WebSocket kline 事件 -> REST K线格式 [open_time, o, h, l, c, v, close_time]"""
+    return [int(k["t"]), k["o"], k["h"], k["l"], k["c"], k["v"], int(k["T"])]
+
+
+class CandleBuffer:
+    """单个交易对的K线环形缓冲区 (REST K线格式)"""
+
+    def __init__(self, size=500):
+        self.candles = deque(maxlen=size)
+        self.last_closed = False
+
+    def last_open_time(self):
+        return self.candles[-1][0] if self.candles else None
+
+    def upsert(self, candle, closed):
+        """同一根K线替换，新K线追加，过期K线忽略"""
+        last = self.last_open_time()
+        if last is not None and candle[0] < last:
+            return False
+        if last == candle[0]:
+            self.candles[-1] = candle
+        else:
+            self.candles.append(candle)
+        self.last_closed = closed
+        return True
+
+    def merge(self, candles):
+        """合并REST回补的K线 (需按时间排序)"""
+        for c in candles:
+            self.upsert(c[:7], closed=True)
+
+
+class MarketDataFeed:
+    """组合流行情订阅
+
+    用法:
+        feed = MarketDataFeed(["BTCUSDT"], "1m", rest_client=CLIENT)
+        feed.on_candle_close(lambda symbol, candle: ...)
+        feed.start()
+        klines = feed.get_klines("BTCUSDT", 100)
+    """
+
+    def __init__(self, symbols, interval="1m", buffer_size=500,
+                 ws_url="wss://fstream.binance.com", rest_client=None,
+                 rest_fetch=None, logger=None, reconnect_delay=1, max_reconnect_delay=30):
+        self.symbols = [s.upper() for s in symbols]
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.buffer_size = buffer_size
+        self.ws_url = ws_url.rstrip("/")
+        self.rest_client = rest_client
+        self.rest_fetch = rest_fetch or self._rest_fetch
+        self.logger = logger
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self.buffers = {s: CandleBuffer(buffer_size) for s in self.symbols}
+        self.books = {}  # symbol -> {"bid", "bid_qty", "ask", "ask_qty", "time"}
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._loop = None
+        self._stop = False
+
+        self.stats = {"messages": 0, "reconnects": 0, "backfills": 0,
+                      "backfilled_candles": 0, "last_message": 0}
+
+    def _log(self, msg, level="INFO"):
+        if self.logger:
+            self.logger(msg, level)
+
+    # ----- 对外接口 -----
+    def on_candle_close(self, callback):
+        """注册K线收盘回调 callback(symbol, candle)"""
+        self._callbacks.append(callback)
+
+    @property
+    def stream_url(self):
+        streams = []
+        for s in self.symbols:
+            streams.append(f"{s.lower()}@kline_{self.interval}")
+            streams.append(f"{s.lower()}@bookTicker")
+        return f"{self.ws_url}/stream?streams={'/'.join(streams)}"
+
+    def get_klines(self, symbol, limit=None):
+        """返回最近K线 (REST格式列表)，最后一根可能未收盘"""
+        with self._lock:
+            candles = list(self.buffers[symbol].candles)
+        return candles[-limit:] if limit else candles
+
+    def get_book(self, symbol):
+        return self.books.get(symbol)
+
+    def is_stale(self, max_age=10):
+        return time.time() - self.stats["last_message"] > max_age
+
+    def wait_ready(self, timeout=10):
+        return self._ready.wait(timeout)
+
+    def start(self):
+        """在后台线程运行订阅"""
+        if not WEBSOCKETS_AVAILABLE:
+            raise RuntimeError("请安装 websockets: pip install websockets")
+        self._stop = False
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop = True
+        if self._loop:
+            self._loop.call_soon_threadsafe(lambda: None)
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    # ----- REST回补 -----
+    def _rest_fetch(self, symbol, start_time=None, limit=500):
+        if self.rest_client is None:
+            return []
+        params = {"symbol": symbol, "interval": self.interval, "limit": limit}
+        if start_time is not None:
+            params["startTime"] = start_time
+        result = self.rest_client.get("/fapi/v1/klines", params, signed=False)
+        return result if isinstance(result, list) else []
+
+    def backfill(self, symbol, next_open=None):
+        """
+        补齐缓冲区: 为空时取最近 buffer_size 根，否则从最后一根开始补
+        next_open: 已收到的下一根K线开盘时间，早于它的K线一定已收盘
+        返回补回来的已收盘K线 (缓冲区原本为空时不算，历史K线不触发收盘回调)
+        """
+        buf = self.buffers[symbol]
+        last = buf.last_open_time()
+        if last is None:
+            candles = self.rest_fetch(symbol, None, self.buffer_size)
+        else:
+            candles = self.rest_fetch(symbol, last, min(1000, self.buffer_size))
+        if not candles:
+            return []
+        now_ms = int(time.time() * 1000)
+        is_closed = lambda c: int(c[6]) < now_ms or (next_open is not None and c[0] < next_open)
+        with self._lock:
+            before = len(buf.candles)
+            last, was_closed = buf.last_open_time(), buf.last_closed
+            closed = [c[:7] for c in candles
+                      if last is not None and is_closed(c)
+                      and (c[0] > last or (c[0] == last and not was_closed))]
+            buf.merge(candles)
+            # 最后一根若还没到收盘时间则标记为未收盘
+            buf.last_closed = is_closed(candles[-1])
+        self.stats["backfills"] += 1
+        self.stats["backfilled_candles"] += len(candles)
+        self._log(f"📥 {symbol} REST回补 {len(candles)} 根K线 (缓冲区 {before}->{len(buf.candles)})")
+        return closed
+
+    async def _backfill_async(self, symbol, next_open=None):
+        """在线程池里跑 REST 回补，不阻塞事件循环；补回的收盘K线在循环线程里触发回调"""
+        closed = await asyncio.get_running_loop().run_in_executor(None, self.backfill, symbol, next_open)
+        for candle in closed:
+            self._emit_close(symbol, candle)
+
+    def _emit_close(self, symbol, candle):
+        for callback in self._callbacks:
+            try:
+                callback(symbol, candle)
+            except Exception as e:
+                self._log(f"❌ K线回调错误: {e}", "ERROR")
+
+    # ----- WebSocket -----
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._consume())
+        finally:
+            self._loop.close()
+
+    async def _consume(self):
+        delay = self.reconnect_delay
+        first = True
+        while not self._stop:
+            try:
+                async with websockets.connect(self.stream_url, ping_interval=20) as ws:
+                    if not first:
+                        self.stats["reconnects"] += 1
+                        self._log(f"🔌 行情流重连成功 ({self.stats['reconnects']})")
+                    first = False
+                    delay = self.reconnect_delay
+                    # 连接后先补齐断线期间的K线
+                    for symbol in self.symbols:
+                        await self._backfill_async(symbol)
+                    self._ready.set()
+                    while not self._stop:
+                        try:
+                            message = await asyncio.wait_for(ws.recv(), timeout=1)
+                        except asyncio.TimeoutError:
+                            continue
+                        await self.handle_message(message)
+            except Exception as e:
+                if self._stop:
+                    break
+                self._log(f"⚠️ 行情流断开: {e}，{delay}秒后重连", "WARN")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def handle_message(self, message):
+        """处理一条组合流消息"""
+        data = json.loads(message)
+        data = data.get("data", data)
+        self.stats["messages"] += 1
+        self.stats["last_message"] = time.time()
+
+        if data.get("e") == "kline":
+            await self._handle_kline(data["s"], data["k"])
+        elif "b" in data and "a" in data:
+            self.books[data["s"]] = {
+                "bid": float(data["b"]), "bid_qty": float(data["B"]),
+                "ask": float(data["a"]), "ask_qty": float(data["A"]),
+                "time": data.get("T", data.get("E")),
+            }
+
+    async def _handle_kline(self, symbol, k):
+        buf = self.buffers.get(symbol)
+        if buf is None:
+            return
+        candle = kline_from_event(k)
+        last = buf.last_open_time()
+        # 跳号: 中间缺了K线，先REST回补再写入
+        if last is not None and candle[0] > last + self.interval_ms:
+            self._log(f"⚠️ {symbol} K线跳号 {last} -> {candle[0]}，REST回补", "WARN")
+            await self._backfill_async(symbol, candle[0])
+
+        with self._lock:
+            # 回补时已经收盘并回调过的K线不再重复回调
+            emitted = buf.last_open_time() == candle[0] and buf.last_closed
+            accepted = buf.upsert(candle, closed=bool(k["x"]))
+        if accepted and k["x"] and not emitted:
+            self._emit_close(symbol, candle)
+
+
+# ========== 本地测试用假行情服务器 ==========
+class FakeKlineStreamServer:
+    """本地假组合流服务器，按真实格式推送 kline / bookTicker 事件
+
+    server = FakeKlineStreamServer(["BTCUSDT"])
+    server.start()
+    feed = MarketDataFeed(["BTCUSDT"], ws_url=server.url, rest_fetch=server.rest_klines)
+    """
+
+    def __init__(self, symbols, interval="1m", host="127.0.0.1", port=0,
+                 start_price=60000.0, ticks_per_candle=3, tick_delay=0.01):
+        self.symbols = [s.upper() for s in symbols]
+        self.interval_ms = INTERVAL_MS[interval]
+        self.host = host
+        self.port = port
+        self.ticks_per_candle = ticks_per_candle
+        self.tick_delay = tick_delay
+        self.history = {s: [] for s in self.symbols}  # 已收盘K线 (REST格式)
+        self.prices = {s: start_price for s in self.symbols}
+        self.open_time = int(time.time() * 1000) // self.interval_ms * self.interval_ms
+        self.skip_next = 0  # 设为N则跳过推送N根K线，模拟断流
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def rest_klines(self, symbol, start_time=None, limit=500):
+        candles = self.history[symbol]
+        if start_time is not None:
+            candles = [c for c in candles if c[0] >= start_time]
+        return [list(c) for c in candles[-limit:]] if start_time is None else [list(c) for c in candles[:limit]]
+
+    def _next_price(self, symbol, step):
+        self.prices[symbol] *= 1 + (0.0005 if (step // 2) % 2 == 0 else -0.0004)
+        return self.prices[symbol]
+
+    async def _handler(self, websocket, path=None):
+        step = 0
+        while True:
+            for symbol in self.symbols:
+                o = self.prices[symbol]
+                prices = [self._next_price(symbol, step + i) for i in range(self.ticks_per_candle)]
+                h, l = max([o] + prices), min([o] + prices)
+                skip = self.skip_next > 0
+                for i, c in enumerate(prices):
+                    closed = i == len(prices) - 1
+                    k = {"t": self.open_time, "T": self.open_time + self.interval_ms - 1,
+                         "s": symbol, "o": f"{o}", "h": f"{h}", "l": f"{l}",
+                         "c": f"{c}", "v": "1.0", "x": closed}
+                    if closed:
+                        self.history[symbol].append([self.open_time, k["o"], k["h"], k["l"],
+                                                     k["c"], k["v"], k["T"]])
+                    if skip:
+                        continue
+                    await websocket.send(json.dumps({
+                        "stream": f"{symbol.lower()}@kline_1m",
+                        "data": {"e": "kline", "E": int(time.time() * 1000), "s": symbol, "k": k}
+                    }))
+                    await websocket.send(json.dumps({
+                        "stream": f"{symbol.lower()}@bookTicker",
+                        "data": {"s": symbol, "b": f"{c * 0.9999}", "B": "1", "a": f"{c * 1.0001}",
+                                 "A": "1", "T": int(time.time() * 1000)}
+                    }))
+                    await asyncio.sleep(self.tick_delay)
+            if self.skip_next > 0:
+                self.skip_next -= 1
+            self.open_time += self.interval_ms
+            step += self.ticks_per_candle
+
+    async def _serve(self):
+        self._server = await websockets.serve(self._handler, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        await self._server.wait_closed()
+
+    def start(self):
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self._serve())
+        threading.Thread(target=run, daemon=True).start()
+        self._ready.wait(5)
+
+    def seed_history(self, n):
+        """预先生成 n 根历史K线，供首次REST回补"""
+        for symbol in self.symbols:
+            for i in range(n):
+                t = self.open_time - (n - i) * self.interval_ms
+                p = self.prices[symbol]
+                self.history[symbol].append([t, f"{p}", f"{p}", f"{p}", f"{p}", "1.0",
+                                             t + self.interval_ms - 1])
+
+
+if __name__ == "__main__":
+    print("=== 假行情服务器驱动测试 ===")
+    server = FakeKlineStreamServer(["BTCUSDT", "ETHUSDT"])
+    server.seed_history(50)
+    server.start()
+
+    closed = []
+    feed = MarketDataFeed(["BTCUSDT", "ETHUSDT"], "1m", ws_url=server.url,
+                          rest_fetch=server.rest_klines,
+                          logger=lambda m, l="INFO": print(f"  [{l}] {m}"))
+    feed.on_candle_close(lambda s, c: closed.append((s, c[0])))
+    feed.start()
+    print(f"✅ 就绪: {feed.wait_ready(5)}")
+    time.sleep(0.5)
+    server.skip_next = 2  # 模拟漏推2根K线
+    time.sleep(1.0)
+    feed.stop()
+
+    for symbol in feed.symbols:
+        klines = feed.get_klines(symbol)
+        times = [k[0] for k in klines]
+        gaps = sum(1 for a, b in zip(times, times[1:]) if b - a != feed.interval_ms)
+        print(f"  {symbol}: {len(klines)}根K线, 跳号 {gaps}, 盘口 {feed.get_book(symbol)}")
+    print(f"  收盘回调 {len(closed)} 次, 统计 {feed.stats}")
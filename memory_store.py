@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+统一记忆存储 - AIMemorySystem / EnhancedMemory / KnowledgeBrain 共用的存储引擎
+- SQLite (WAL) + FTS5 trigram 索引，中英文子串检索都走索引
+- Markdown 文件按标题切成段落入库，增量同步: 最后一段之前的内容没变 (按哈希判断) 时只重新解析最后一段之后的内容
+- 稳定 ID: 文件段落为 "<来源>@<字节偏移>"，笔记等直接写入的条目由调用方指定
+- 查询接口统一为 search(query, kind=..., fields=..., limit=...)
+"""
+
+import os
+import re
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# 段落切分: 一、二级标题开新段，过长的段按行数再切
+SECTION_HEADING = re.compile(rb"^#{1,2} ")
+MAX_SECTION_LINES = 50
+# 目录同步: 最近 HOT_SECONDS 内修改过的文件每次都检查，其余文件每 FULL_SCAN_INTERVAL 秒检查一次
+HOT_SECONDS = 2 * 24 * 3600
+FULL_SCAN_INTERVAL = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    uid TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    source TEXT,
+    offset INTEGER,
+    title TEXT,
+    content TEXT NOT NULL,
+    tags TEXT DEFAULT '',
+    meta TEXT DEFAULT '{}',
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS docs_kind ON docs(kind);
+CREATE INDEX IF NOT EXISTS docs_source ON docs(source, offset);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    ino INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    tail_offset INTEGER,
+    tail_prefix TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    title, content, tags, content='docs', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO docs_fts(rowid, title, content, tags) VALUES (new.id, new.title, new.content, new.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, title, content, tags) VALUES ('delete', old.id, old.title, old.content, old.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_au AFTER UPDATE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, title, content, tags) VALUES ('delete', old.id, old.title, old.content, old.tags);
+    INSERT INTO docs_fts(rowid, title, content, tags) VALUES (new.id, new.title, new.content, new.tags);
+END;
+"""
+
+_COLUMNS = "id, uid, kind, source, offset, title, content, tags, meta, created_at"
+
+
+def split_sections(data, base_offset=0, title=""):
+    """
+    把 Markdown 字节切成 [(字节偏移, 标题, 文本)]
+    超过 MAX_SECTION_LINES 行的段落切成多块，后续块沿用所属标题 (title 为 data 开头所在段落的标题)
+    """
+    sections = []
+    start, lines = base_offset, []
+    pos = base_offset
+    for line in data.splitlines(True):
+        if lines and (SECTION_HEADING.match(line) or len(lines) >= MAX_SECTION_LINES):
+            sections.append((start, lines))
+            start, lines = pos, []
+        lines.append(line)
+        pos += len(line)
+    if lines:
+        sections.append((start, lines))
+    result = []
+    for offset, chunk in sections:
+        text = b"".join(chunk).decode("utf-8", errors="replace")
+        if SECTION_HEADING.match(chunk[0]):
+            title = chunk[0].decode("utf-8", errors="replace").strip().lstrip("#").strip()
+        result.append((offset, title, text))
+    return result
+
+
+class MemoryStore:
+    """
+    store = MemoryStore("~/.ai_memory_system/memory.db")
+    store.sync_file(path, kind="patterns")            # 增量同步 Markdown
+    store.sync_dir(dir, kind="daily")                 # 同步目录下所有 .md
+    store.put("note:1", "内容", kind="note", tags=[...])
+    store.search("关键词", kind="note", limit=10)
+    """
+
+    def __init__(self, db_path):
+        self.db_path = os.path.expanduser(db_path)
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # 旧库的 sources 表没有 tail_prefix 列: 补上，这些文件下次同步时全量重建一次
+        if "tail_prefix" not in {row["name"] for row in self.conn.execute("PRAGMA table_info(sources)")}:
+            self.conn.execute("ALTER TABLE sources ADD COLUMN tail_prefix TEXT")
+        self._dir_state = {}
+        # 源文件状态缓存，同步时先和 stat 比较，未变化的文件不碰数据库
+        self._sources = {
+            row["path"]: (row["ino"], row["size"], row["mtime_ns"], row["tail_offset"], row["tail_prefix"])
+            for row in self.conn.execute("SELECT * FROM sources")
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    # ========== 写入 ==========
+    def put(self, uid, content, kind, title="", tags=None, meta=None, created_at=None):
+        """写入/覆盖一条条目，返回行 id"""
+        with self._lock, self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO docs(uid, kind, title, content, tags, meta, created_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(uid) DO UPDATE SET kind=excluded.kind, title=excluded.title, content=excluded.content, "
+                "tags=excluded.tags, meta=excluded.meta, created_at=excluded.created_at",
+                (uid, kind, title, content, " ".join(tags or []), json.dumps(meta or {}, ensure_ascii=False),
+                 created_at or datetime.now().isoformat())
+            )
+            return cur.lastrowid
+
+    def next_id(self, name, at_least=0):
+        """自增计数器 (用于生成笔记编号等稳定 ID)"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO counters(name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = MAX(value + 1, excluded.value)",
+                (name, max(at_least, 1))
+            )
+            return self.conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+
+    def delete(self, uid):
+        with self._lock, self.conn:
+            return self.conn.execute("DELETE FROM docs WHERE uid = ?", (uid,)).rowcount
+
+    def get(self, uid):
+        with self._lock:
+            row = self.conn.execute(f"SELECT {_COLUMNS} FROM docs WHERE uid = ?", (uid,)).fetchone()
+        return self._row(row) if row else None
+
+    def list(self, kind, order="id"):
+        with self._lock:
+            rows = self.conn.execute(f"SELECT {_COLUMNS} FROM docs WHERE kind = ? ORDER BY {order}", (kind,)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def count(self, kind=None):
+        with self._lock:
+            if kind:
+                return self.conn.execute("SELECT COUNT(*) FROM docs WHERE kind = ?", (kind,)).fetchone()[0]
+            return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    # ========== Markdown 增量同步 ==========
+    def sync_file(self, path, kind):
+        """
+        同步单个 Markdown 文件，返回新入库的段落数
+        inode 相同且上次最后一段之前的字节没变 (哈希比对): 从最后一段的起点重新解析 (最后一段可能被追加)；
+        其它变化 (包括原地改写后文件变大) 全量重建
+        """
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if path in self._sources:
+                self.forget_file(path)
+            return 0
+        state = self._sources.get(path)
+        if state and state[:3] == (st.st_ino, st.st_size, st.st_mtime_ns):
+            return 0
+
+        with open(path, "rb") as f:
+            data = f.read()
+        start = 0
+        if state and state[0] == st.st_ino and state[4] and len(data) >= state[3]:
+            if hashlib.sha1(data[:state[3]]).hexdigest() == state[4]:
+                start = state[3]
+        title = ""
+        if start:
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT title FROM docs WHERE source = ? AND offset = ?", (path, start)
+                ).fetchone()
+            title = row[0] if row else ""
+        sections = split_sections(data[start:], start, title)
+        tail = sections[-1][0] if sections else start
+        prefix = hashlib.sha1(data[:tail]).hexdigest()
+
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM docs WHERE source = ? AND offset >= ?", (path, start))
+            self.conn.executemany(
+                "INSERT INTO docs(uid, kind, source, offset, title, content, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(f"{path}@{offset}", kind, path, offset, title, text,
+                  datetime.fromtimestamp(st.st_mtime).isoformat()) for offset, title, text in sections]
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources(path, kind, ino, size, mtime_ns, tail_offset, tail_prefix) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, kind, st.st_ino, st.st_size, st.st_mtime_ns, tail, prefix)
+            )
+        self._sources[path] = (st.st_ino, st.st_size, st.st_mtime_ns, tail, prefix)
+        return len(sections)
+
+    def sync_dir(self, directory, kind, suffix=".md", exclude=("README.md",)):
+        """
+        同步目录下所有 Markdown 文件，已删除的文件从索引中移除
+        目录本身没变化 (没有增删文件) 时只检查最近修改过的"热"文件，
+        旧日志每隔 FULL_SCAN_INTERVAL 秒才整体 stat 一遍，查询耗时不随日志天数增长
+        """
+        directory = os.path.abspath(directory)
+        try:
+            dir_mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime = None
+        now = time.time()
+        state = self._dir_state.get((directory, kind))
+        if state and state[0] == dir_mtime and now - state[1] < FULL_SCAN_INTERVAL:
+            added = 0
+            for path in state[2]:
+                added += self.sync_file(path, kind)
+            return added
+
+        seen = set()
+        added = 0
+        if dir_mtime is not None:
+            for name in os.listdir(directory):
+                if name.endswith(suffix) and name not in exclude:
+                    path = os.path.join(directory, name)
+                    seen.add(path)
+                    added += self.sync_file(path, kind)
+        prefix = directory + os.sep
+        for path in [p for p in self._sources if p.startswith(prefix) and os.sep not in p[len(prefix):]]:
+            if path not in seen and path.endswith(suffix):
+                self.forget_file(path)
+        hot = [p for p in seen if now - self._sources[p][2] / 1e9 < HOT_SECONDS] if dir_mtime is not None else []
+        self._dir_state[(directory, kind)] = (dir_mtime, now, hot)
+        return added
+
+    def forget_file(self, path):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM docs WHERE source = ?", (path,))
+            self.conn.execute("DELETE FROM sources WHERE path = ?", (path,))
+        self._sources.pop(path, None)
+
+    # ========== 查询 ==========
+    def search(self, query, kind=None, fields=None, limit=20):
+        """
+        子串检索 (不区分大小写)，按 BM25 排序
+        kind: 字符串或列表；fields: 限定 title / content / tags 列
+        trigram 索引要求至少 3 个字符，更短的查询退回 LIKE 扫描
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+        kinds = [kind] if isinstance(kind, str) else list(kind or [])
+        kind_sql = f" AND d.kind IN ({','.join('?' * len(kinds))})" if kinds else ""
+        fields = fields or ["title", "content", "tags"]
+
+        if len(query) >= 3:
+            phrase = '"' + query.replace('"', '""') + '"'
+            match = phrase if len(fields) == 3 else "{" + " ".join(fields) + "} : " + phrase
+            sql = (f"SELECT {', '.join('d.' + c for c in _COLUMNS.split(', '))}, bm25(docs_fts) AS score "
+                   f"FROM docs_fts JOIN docs d ON d.id = docs_fts.rowid "
+                   f"WHERE docs_fts MATCH ?{kind_sql} ORDER BY score LIMIT ?")
+            params = [match, *kinds, limit]
+        else:
+            like = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            cond = " OR ".join(f"d.{f} LIKE ? ESCAPE '\\'" for f in fields)
+            sql = (f"SELECT {', '.join('d.' + c for c in _COLUMNS.split(', '))}, 0.0 AS score "
+                   f"FROM docs d WHERE ({cond}){kind_sql} ORDER BY d.id LIMIT ?")
+            params = [like] * len(fields) + kinds + [limit]
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._row(row) for row in rows]
+
+    @staticmethod
+    def _row(row):
+        item = {key: row[key] for key in row.keys()}
+        item["tags"] = item["tags"].split() if item.get("tags") else []
+        item["meta"] = json.loads(item["meta"]) if item.get("meta") else {}
+        if "score" in item:
+            item["score"] = -item["score"]   # bm25() 越小越相关，翻转成越大越相关
+        return item
+
+
+def matching_lines(text, keyword, limit=3):
+    """段落中包含关键词的行"""
+    key = keyword.lower()
+    return [line for line in text.split("\n") if key in line.lower()][:limit]
+
+
+if __name__ == "__main__":
+    import random
+    import shutil
+    import tempfile
+    from datetime import timedelta
+
+    root = tempfile.mkdtemp()
+    log_dir = os.path.join(root, "memory")
+    os.makedirs(log_dir)
+    store = MemoryStore(os.path.join(root, "index.db"))
+    words = ["部署", "行情", "飞书", "小红书", "语音", "回测", "告警", "Python", "SQLite", "agent", "SOP", "日报"]
+    rnd = random.Random(0)
+    today = datetime.now()
+
+    def write_day(i):
+        """写 i 天前的日志"""
+        day = (today - timedelta(days=i)).strftime("%Y-%m-%d")
+        with open(os.path.join(log_dir, f"{day}.md"), "w", encoding="utf-8") as f:
+            f.write(f"# {day}\n")
+            for h in range(4):
+                f.write(f"\n## {h * 6:02d}:00 记录\n")
+                for _ in range(10):
+                    f.write(f"- {rnd.choice(['✅', '❌', '-'])} {' '.join(rnd.sample(words, 4))} 事项{rnd.randint(1, 99999)}\n")
+        if i % 97 == 0:
+            with open(os.path.join(log_dir, f"{day}.md"), "a", encoding="utf-8") as f:
+                f.write("- 决定把记忆索引迁移到 FTS5 needle-marker\n")
+        # 历史日志的修改时间停在当天
+        ts = (today - timedelta(days=i)).timestamp()
+        os.utime(os.path.join(log_dir, f"{day}.md"), (ts, ts))
+
+    def scan(keyword):
+        """旧方式: 每次读取全部日志文件"""
+        hits = []
+        for name in os.listdir(log_dir):
+            with open(os.path.join(log_dir, name), encoding="utf-8") as f:
+                content = f.read()
+            if keyword.lower() in content.lower():
+                hits.append(name)
+        return hits
+
+    print(f"{'天数':>6} {'全量扫描':>10} {'同步+索引查询':>14} {'命中':>6}")
+    written = 0
+    for days in [30, 365, 1095, 1825]:
+        for i in range(written, days):
+            write_day(i)
+        written = days
+        store.sync_dir(log_dir, "daily")
+        # 模拟当天日志追加，查询前的增量同步只处理这一个文件
+        with open(os.path.join(log_dir, f"{today:%Y-%m-%d}.md"), "a", encoding="utf-8") as f:
+            f.write("- 追加一行 needle-marker\n")
+        n = 20
+        start = time.perf_counter()
+        for _ in range(3):
+            old = scan("needle-marker")
+        old_ms = (time.perf_counter() - start) / 3 * 1000
+        start = time.perf_counter()
+        for _ in range(n):
+            store.sync_dir(log_dir, "daily")
+            hits = store.search("needle-marker", kind="daily", limit=100)
+        new_ms = (time.perf_counter() - start) / n * 1000
+        assert {os.path.basename(h["source"]) for h in hits} == set(old)
+        print(f"{days:>6} {old_ms:>8.1f}ms {new_ms:>12.2f}ms {len(hits):>6}")
+    store.close()
+    shutil.rmtree(root)
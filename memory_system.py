@@ -22,6 +22,8 @@ import re
 from datetime import datetime
 from pathlib import Path
 
+from memory_store import MemoryStore
+
 # 配置
 DATA_DIR = os.path.expanduser('~/.ai_memory_system')
 
@@ -31,6 +33,14 @@ MEMORY_FILE = os.path.join(DATA_DIR, 'MEMORY.md')
 PATTERNS_FILE = os.path.join(DATA_DIR, 'patterns.md')
 TODAY_FILE = os.path.join(DATA_DIR, 'today.md')
 ALIGN_FILE = os.path.join(DATA_DIR, 'alignment.json')
+INDEX_DB = os.path.join(DATA_DIR, 'memory.db')
+
+# 记忆层 -> 文件
+LAYER_FILES = {
+    'memory': MEMORY_FILE,
+    'patterns': PATTERNS_FILE,
+    'today': TODAY_FILE,
+}
 
 
 class AIMemorySystem:
@@ -39,6 +49,7 @@ class AIMemorySystem:
     def __init__(self):
         self.init_files()
         self.alignment = self.load_alignment()
+        self.store = MemoryStore(INDEX_DB)
     
     def init_files(self):
         """初始化文件"""
@@ -158,29 +169,24 @@ class AIMemorySystem:
     # ===== 懒加载 =====
     
     def lazy_load(self, keyword):
-        """懒加载 - 按关键词加载"""
-        memories = self.read_memory('all')
+        """懒加载 - 按关键词加载 (匹配模式库的二级标题)"""
+        self.store.sync_file(PATTERNS_FILE, 'patterns')
+        hits = self.store.search(keyword, kind='patterns', fields=['title'], limit=500)
         
+        # 长模式被切成多块 (后续块沿用同一标题)，按偏移把紧接着的块拼回去
         result = {}
-        
-        # 在patterns中搜索
-        if 'patterns' in memories:
-            lines = memories['patterns'].split('\n')
-            in_section = False
-            section_content = []
-            section_name = ''
-            
-            for line in lines:
-                if line.startswith('## '):
-                    if keyword.lower() in line.lower():
-                        in_section = True
-                        section_name = line
-                        section_content = [line]
-                    elif in_section:
-                        result[section_name] = '\n'.join(section_content)
-                        in_section = False
-                elif in_section:
-                    section_content.append(line)
+        name, end = None, None
+        for hit in sorted(hits, key=lambda h: h['offset']):
+            content = hit['content']
+            if content.startswith('## '):
+                name = content.split('\n', 1)[0]
+                result[name] = content
+            elif name and hit['offset'] == end and not re.match(r'#{1,2} ', content):
+                result[name] += content
+            else:
+                name = None
+            end = hit['offset'] + len(content.encode('utf-8'))
+        result = {name: content.rstrip('\n') for name, content in result.items()}
         
         if result:
             print(f"✅ 找到相关模式:")
@@ -192,6 +198,15 @@ class AIMemorySystem:
         
         return result
     
+    # ===== 检索 =====
+    
+    def search(self, query, layer=None, limit=20):
+        """在记忆文件中检索 (增量同步后走全文索引)"""
+        layers = [layer] if layer else list(LAYER_FILES)
+        for name in layers:
+            self.store.sync_file(LAYER_FILES[name], name)
+        return self.store.search(query, kind=layers, limit=limit)
+    
     # ===== 指令遵循度 =====
     
     def confirm_command(self, command):
@@ -272,6 +287,7 @@ def main():
   python3 memory_system.py add-memory <内容>  # 添加到长期
   python3 memory_system.py pattern <名称> <内容>  # 添加模式
   python3 memory_system.py load <关键词>  # 懒加载
+  python3 memory_system.py search <关键词>  # 全文检索
   python3 memory_system.py confirm <指令> # 确认指令
   python3 memory_system.py check         # 检查对齐
   python3 memory_system.py evolve         # 自动进化
@@ -308,6 +324,13 @@ def main():
         keyword = sys.argv[2]
         mem.lazy_load(keyword)
     
+    elif cmd == 'search' and len(sys.argv) >= 3:
+        query = ' '.join(sys.argv[2:])
+        for hit in mem.search(query):
+            print(f"\n[{hit['kind']}] {hit['title'] or os.path.basename(hit['source'])}")
+            for line in hit['content'].strip().split('\n')[:5]:
+                print(f"  {line}")
+    
     elif cmd == 'confirm' and len(sys.argv) >= 3:
         command = ' '.join(sys.argv[2:])
         mem.confirm_command(command)
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+本地持久化消息队列 - 微信进程和 Agent 进程之间的通信
+- SQLite WAL 存储，每条消息有自增 ID，多进程/多线程并发读写安全
+- 租约 + ack: 取出的消息在 ack 之前不会丢，消费者崩溃后租约过期自动重投 (至少一次)
+- 回复按 correlation_id 关联到原消息，多个会话同时等待互不抢占
+- 背压: 主题内待处理消息达到上限时 put 阻塞，超时抛 QueueFull
+- 按发送者保序: get_batch 只取没有在途消息的发送者，并把该发送者排队中的消息一起取出
+- 唤醒: 同进程用条件变量，跨进程轮询 PRAGMA data_version (只读共享内存，1ms 起步退避)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+LEASE_SECONDS = 60
+MAX_ATTEMPTS = 5
+POLL_MIN = 0.001
+POLL_MAX = 0.02
+
+
+class QueueFull(Exception):
+    """待处理消息超过上限"""
+
+
+class MessageQueue:
+    """
+    q = MessageQueue("~/.openclaw/workspace/wechat_queue/queue.db")
+    msg_id = q.put("in", {"message": "你好"}, sender="张三")
+    msg = q.get("in", timeout=1)         # {"id", "topic", "sender", "correlation_id", "payload", "attempts", "created_at"}
+    q.reply(msg, {"reply": "..."})        # 写回复并 ack，同一事务
+    q.wait_reply(msg_id, timeout=30)     # 只取关联到 msg_id 的回复
+    batch = q.get_batch("in", timeout=1) # 同一发送者的连续消息，该发送者同一时间只有一批在处理
+    q.reply(batch, {"reply": "..."})      # 回复关联到最后一条，整批 ack
+    """
+
+    def __init__(self, db_path, max_pending=1000, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.db_path = os.path.expanduser(db_path)
+        self.max_pending = max_pending
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT NOT NULL,
+                sender TEXT,
+                correlation_id INTEGER,
+                payload TEXT NOT NULL,
+                lease_until REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_topic ON messages(topic, lease_until, id);
+            CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(topic, sender, lease_until);
+            CREATE INDEX IF NOT EXISTS idx_messages_corr ON messages(correlation_id) WHERE correlation_id IS NOT NULL;
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                id INTEGER PRIMARY KEY,
+                topic TEXT, sender TEXT, correlation_id INTEGER, payload TEXT,
+                attempts INTEGER, created_at REAL, failed_at REAL
+            );
+        """)
+
+    def _conn(self):
+        """每个线程一个连接，等待中的线程互不阻塞"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _notify(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _wait(self, deadline, delay, version):
+        """
+        等待新提交: 本进程的提交通过条件变量立即唤醒，
+        其他进程的提交通过 data_version 变化发现，轮询间隔逐步退避到 POLL_MAX
+        返回 (下次轮询间隔, 最新 data_version)
+        """
+        conn = self._conn()
+        end = time.time() + delay if deadline is None else min(deadline, time.time() + delay)
+        while True:
+            current = conn.execute("PRAGMA data_version").fetchone()[0]
+            if current != version:
+                return POLL_MIN, current
+            remaining = end - time.time()
+            if remaining <= 0:
+                return min(delay * 2, POLL_MAX), current
+            with self._cond:
+                if self._cond.wait(remaining):
+                    return POLL_MIN, current
+
+    # ========== 写入 ==========
+    def put(self, topic, payload, sender=None, correlation_id=None, ttl=None, block=True, timeout=None):
+        """
+        写入一条消息，返回消息 ID
+        主题内待处理消息达到 max_pending 时阻塞等待消费 (block=False 或超时则抛 QueueFull)
+        ttl: 秒，过期未被取走的消息直接丢弃 (用于没人等的回复)
+        """
+        conn = self._conn()
+        deadline = None if timeout is None else time.time() + timeout
+        delay, version = POLL_MIN, None
+        data = json.dumps(payload, ensure_ascii=False)
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                pending = conn.execute(
+                    "SELECT COUNT(*) FROM messages WHERE topic=? AND (expires_at IS NULL OR expires_at>?)", (topic, now)
+                ).fetchone()[0]
+                if not self.max_pending or pending < self.max_pending:
+                    cur = conn.execute(
+                        "INSERT INTO messages (topic, sender, correlation_id, payload, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (topic, sender, correlation_id, data, now, now + ttl if ttl else None)
+                    )
+                    conn.execute("COMMIT")
+                    self._notify()
+                    return cur.lastrowid
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            if not block or (deadline is not None and time.time() >= deadline):
+                raise QueueFull(f"{topic}: {pending} 条待处理")
+            delay, version = self._wait(deadline, delay, version)
+
+    # ========== 消费 ==========
+    def _claim(self, where, params, limit=1):
+        """在一个写事务里取最早的可用消息并加租约；超过重试次数的转入死信表"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM messages WHERE expires_at IS NOT NULL AND expires_at<=?", (now,))
+            rows = self._select(conn, where, params, now, limit)
+            if rows:
+                conn.executemany(
+                    "UPDATE messages SET lease_until=?, attempts=attempts+1 WHERE id=?",
+                    [(now + self.lease_seconds, row[0]) for row in rows]
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [
+            {"id": row[0], "topic": row[1], "sender": row[2], "correlation_id": row[3],
+             "payload": json.loads(row[4]), "attempts": row[5] + 1, "created_at": row[6]}
+            for row in rows
+        ]
+
+    def _select(self, conn, where, params, now, limit):
+        while True:
+            rows = conn.execute(
+                f"SELECT id, topic, sender, correlation_id, payload, attempts, created_at FROM messages m "
+                f"WHERE {where} AND lease_until<=? ORDER BY id LIMIT ?",
+                (*params, now, limit)
+            ).fetchall()
+            dead = [row[0] for row in rows if row[5] >= self.max_attempts]
+            if not dead:
+                return rows
+            for msg_id in dead:
+                conn.execute(
+                    "INSERT OR REPLACE INTO dead_letters SELECT id, topic, sender, correlation_id, payload, attempts, created_at, ? "
+                    "FROM messages WHERE id=?", (now, msg_id)
+                )
+                conn.execute("DELETE FROM messages WHERE id=?", (msg_id,))
+
+    def _get(self, where, params, timeout, limit=1):
+        deadline = None if timeout is None else time.time() + timeout
+        delay, version = POLL_MIN, None
+        while True:
+            msgs = self._claim(where, params, limit)
+            if msgs:
+                return msgs
+            if deadline is not None and time.time() >= deadline:
+                return None
+            delay, version = self._wait(deadline, delay, version)
+
+    def get(self, topic, timeout=None):
+        """取一条消息 (带租约)，处理完必须 ack/reply；timeout 秒内没有消息返回 None"""
+        msgs = self._get("topic=?", (topic,), timeout)
+        return msgs[0] if msgs else None
+
+    def get_batch(self, topic, max_items=20, timeout=None):
+        """
+        取最早一条可处理消息所属发送者的排队消息 (最多 max_items 条，按 ID 顺序)
+        有消息在途 (租约未过期或等待重试) 的发送者整体跳过，保证同一发送者按顺序处理
+        timeout 秒内没有消息返回 []
+        """
+        conn = self._conn()
+        deadline = None if timeout is None else time.time() + timeout
+        delay, version = POLL_MIN, None
+        while True:
+            row = conn.execute(
+                "SELECT sender FROM messages m WHERE topic=? AND lease_until<=? AND NOT EXISTS ("
+                "SELECT 1 FROM messages b WHERE b.topic=m.topic AND b.sender IS m.sender AND b.lease_until>?"
+                ") ORDER BY id LIMIT 1", (topic, time.time(), time.time())
+            ).fetchone()
+            if row is not None:
+                # 认领时再检查一次，另一个消费者可能刚认领了同一发送者
+                msgs = self._claim(
+                    "topic=? AND sender IS ? AND NOT EXISTS ("
+                    "SELECT 1 FROM messages b WHERE b.topic=m.topic AND b.sender IS m.sender AND b.lease_until>?)",
+                    (topic, row[0], time.time()), max_items
+                )
+                if msgs:
+                    return msgs
+                continue
+            if deadline is not None and time.time() >= deadline:
+                return []
+            delay, version = self._wait(deadline, delay, version)
+
+    def claim_sender(self, topic, sender, max_items=20):
+        """已持有该发送者的一批消息时，追加认领之后到达的消息 (合并突发消息用)"""
+        return self._claim("topic=? AND sender IS ?", (topic, sender), max_items)
+
+    def wait_reply(self, correlation_id, timeout=30):
+        """等待关联到 correlation_id 的回复，取到即 ack，返回 payload 或 None"""
+        msgs = self._get("correlation_id=?", (correlation_id,), timeout)
+        if not msgs:
+            return None
+        msg = msgs[0]
+        self.ack(msg["id"])
+        return msg["payload"]
+
+    def ack(self, msg_id):
+        self._conn().execute("DELETE FROM messages WHERE id=?", (msg_id,))
+        self._notify()
+
+    def nack(self, msg_id, delay=0):
+        """放回队列，delay 秒后可再次被取"""
+        self._conn().execute("UPDATE messages SET lease_until=? WHERE id=?", (time.time() + delay, msg_id))
+        self._notify()
+
+    def reply(self, msg, payload, topic="out", ttl=None):
+        """
+        写入关联到 msg 的回复并 ack 原消息 (同一事务，不会出现回复了却重投)
+        msg 可以是 get_batch 返回的一批，回复关联到最后一条，整批 ack
+        """
+        msgs = msg if isinstance(msg, list) else [msg]
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                "INSERT INTO messages (topic, sender, correlation_id, payload, created_at, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (topic, msgs[-1].get("sender"), msgs[-1]["id"], json.dumps(payload, ensure_ascii=False), now, now + ttl if ttl else None)
+            )
+            conn.executemany("DELETE FROM messages WHERE id=?", [(m["id"],) for m in msgs])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._notify()
+        return cur.lastrowid
+
+    # ========== 状态 ==========
+    def pending(self, topic):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM messages WHERE topic=? AND (expires_at IS NULL OR expires_at>?)", (topic, time.time())
+        ).fetchone()[0]
+
+    def dead_letters(self, limit=20):
+        rows = self._conn().execute(
+            "SELECT id, topic, sender, payload, attempts, failed_at FROM dead_letters ORDER BY failed_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [
+            {"id": r[0], "topic": r[1], "sender": r[2], "payload": json.loads(r[3]), "attempts": r[4], "failed_at": r[5]}
+            for r in rows
+        ]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    import multiprocessing
+
+    directory = tempfile.mkdtemp()
+    db = os.path.join(directory, "queue.db")
+
+    def agent(n):
+        q = MessageQueue(db)
+        for _ in range(n):
+            msg = q.get("in", timeout=10)
+            q.reply(msg, {"reply": f"收到: {msg['payload']['message']}"})
+
+    n = 500
+    proc = multiprocessing.Process(target=agent, args=(n,))
+    proc.start()
+    q = MessageQueue(db)
+    latencies = []
+    for i in range(n):
+        start = time.perf_counter()
+        msg_id = q.put("in", {"message": f"消息{i}"}, sender=f"user{i % 5}")
+        reply = q.wait_reply(msg_id, timeout=10)
+        latencies.append(time.perf_counter() - start)
+        assert reply == {"reply": f"收到: 消息{i}"}
+    proc.join()
+    latencies.sort()
+    print(f"跨进程往返 {n} 次: p50 {latencies[n // 2] * 1000:.2f}ms, p99 {latencies[int(n * 0.99)] * 1000:.2f}ms "
+          f"(旧 JSONL 队列每跳最多轮询 1-2 秒)")
+
+    print("=== 并发会话只取自己的回复 ===")
+    agents = [multiprocessing.Process(target=agent, args=(50,)) for _ in range(2)]
+    for p in agents:
+        p.start()
+    errors = []
+
+    def chat(sender):
+        for i in range(20):
+            msg_id = q.put("in", {"message": f"{sender}-{i}"}, sender=sender)
+            reply = q.wait_reply(msg_id, timeout=10)
+            if reply != {"reply": f"收到: {sender}-{i}"}:
+                errors.append((sender, i, reply))
+
+    threads = [threading.Thread(target=chat, args=(f"chat{c}",)) for c in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for p in agents:
+        p.join()
+    print(f"5 个会话 × 20 条, 回复错配 {len(errors)} 条")
+
+    print("=== 租约过期重投 / 背压 ===")
+    q2 = MessageQueue(db, max_pending=3, lease_seconds=0.05)
+    q2.put("retry", {"n": 1})
+    first = q2.get("retry", timeout=1)
+    again = q2.get("retry", timeout=1)
+    print(f"未 ack 的消息重投: id {first['id']} -> {again['id']}, attempts {again['attempts']}")
+    q2.ack(again["id"])
+    for i in range(3):
+        q2.put("bp", {"n": i})
+    try:
+        q2.put("bp", {"n": 3}, timeout=0.05)
+    except QueueFull as e:
+        print(f"背压: {e}")
+    shutil.rmtree(directory)
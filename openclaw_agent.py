@@ -24,6 +24,7 @@ import sys
 from generic_agent_tools import TOOLS_REGISTRY, execute_tool, WorkingCheckpoint
 from generic_agent_loop import GenericAgentLoop
 from sop_system import SOPSystem, SOPSaver
+from llm_stream import StreamingLLMClient
 
 
 # ========== 工具 Schema (用于 LLM) ==========
@@ -214,6 +215,12 @@ class OpenClawAgent:
         # 记录开始
         self.sop_saver.start_task(task)
         
+        # 相关 SOP 放进可缓存前缀
+        excerpts = []
+        for sop in self.sop_system.search_sops(task)[:3]:
+            excerpts.append(f"### {sop.get('name', '')}\n{sop.get('description', '')}")
+        self.agent_loop.set_prefix_excerpts(excerpts)
+        
         # 运行 Agent
         result = self.agent_loop.run(task, llm_client)
         
@@ -256,29 +263,55 @@ class OpenClawAgent:
 class AnthropicClient:
     """Anthropic Claude 客户端"""
     
-    def __init__(self, api_key: str, model: str = "claude-3-5-sonnet-20241022"):
+    supports_streaming = True
+    
+    def __init__(self, api_key: str, model: str = "claude-3-5-sonnet-20241022",
+                 base_url: str = "https://api.anthropic.com"):
         self.api_key = api_key
         self.model = model
-        self.api_url = "https://api.anthropic.com/v1/messages"
-    
-    def chat(self, messages: list, tools: list = None) -> dict:
-        """发送聊天请求"""
-        import requests
-        
-        headers = {
-            "x-api-key": self.api_key,
+        # 流式 + 连接池，多轮对话复用同一个 TLS 连接
+        self.client = StreamingLLMClient(base_url, headers={
+            "x-api-key": api_key,
             "anthropic-version": "2023-06-01",
             "content-type": "application/json"
-        }
+        })
+        self.last_metrics = None
+    
+    @staticmethod
+    def convert_tools(tools: list) -> list:
+        """OpenAI function 格式的工具 schema 转为 Anthropic 格式，最后一个工具打缓存断点"""
+        converted = []
+        for tool in tools:
+            fn = tool.get("function", tool)
+            converted.append({
+                "name": fn["name"],
+                "description": fn.get("description", ""),
+                "input_schema": fn.get("parameters") or fn.get("input_schema") or {"type": "object", "properties": {}}
+            })
+        if converted:
+            converted[-1]["cache_control"] = {"type": "ephemeral"}
+        return converted
+    
+    def chat(self, messages: list, tools: list = None, on_text=None, on_tool_use=None) -> dict:
+        """发送聊天请求 (流式)
         
-        # 转换消息格式
+        on_text(delta): 文本增量回调
+        on_tool_use(name, input): 工具参数完整时回调，可提前开始执行
+        """
+        # 转换消息格式: system 消息放进 system 参数，cache 标记转成 cache_control 断点
+        system_blocks = []
         converted_messages = []
         for msg in messages:
+            block = {"type": "text", "text": msg["content"]}
+            if msg.get("cache"):
+                block["cache_control"] = {"type": "ephemeral"}
             if msg["role"] == "system":
-                continue  # system prompt 单独处理
+                if msg["content"]:
+                    system_blocks.append(block)
+                continue
             converted_messages.append({
                 "role": msg["role"],
-                "content": msg["content"]
+                "content": [block] if msg.get("cache") else msg["content"]
             })
         
         payload = {
@@ -286,40 +319,17 @@ class AnthropicClient:
             "messages": converted_messages,
             "max_tokens": 4096
         }
+        if system_blocks:
+            payload["system"] = system_blocks
         
         if tools:
-            payload["tools"] = tools
+            payload["tools"] = self.convert_tools(tools)
         
         try:
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            # 转换为标准格式
-            content = result["content"][0]["text"]
-            
-            # 检查是否有工具调用
-            if result.get("content") and len(result["content"]) > 1:
-                # 有工具调用
-                tool_use = result["content"][1]
-                return {
-                    "content": content,
-                    "tool_calls": [
-                        {
-                            "function": {
-                                "name": tool_use["name"],
-                                "arguments": json.dumps(tool_use["input"])
-                            }
-                        }
-                    ]
-                }
-            else:
-                return {"content": content, "tool_calls": []}
+            result = self.client.stream_anthropic("/v1/messages", payload,
+                                                  on_text=on_text, on_tool_use=on_tool_use)
+            self.last_metrics = result["metrics"]
+            return result
                 
         except Exception as e:
             return {"error": str(e)}
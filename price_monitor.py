@@ -21,18 +21,27 @@ import os
 import time
 from datetime import datetime
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from timeseries_store import TimeSeriesStore
+from alert_rules import AlertEngine
 
 # 配置
 CONFIG = {
     'data_dir': os.path.expanduser('~/.price_monitor'),
     'check_interval': 300,  # 5分钟
+    'fetch_workers': 16,    # 单独获取价格时的最大并发数
 }
 
+# 走 Binance 的加密货币
+CRYPTOS = ['BTC', 'ETH', 'BNB', 'SOL', 'DOGE', 'XRP', 'ADA', 'AVAX', 'DOT', 'MATIC']
+
 # 确保目录存在
 Path(CONFIG['data_dir']).mkdir(parents=True, exist_ok=True)
 
 WATCH_FILE = os.path.join(CONFIG['data_dir'], 'watches.json')
-HISTORY_FILE = os.path.join(CONFIG['data_dir'], 'history.json')
+HISTORY_FILE = os.path.join(CONFIG['data_dir'], 'history.json')  # 旧版历史，首次启动时导入
+HISTORY_DIR = os.path.join(CONFIG['data_dir'], 'tsdb')
 
 
 class PriceMonitor:
@@ -40,7 +49,12 @@ class PriceMonitor:
     
     def __init__(self):
         self.watches = self.load_watches()
-        self.history = self.load_history()
+        self.alerts = AlertEngine()
+        for watch in self.watches:
+            self.alerts.add(watch, rule_id=self.watch_id(watch))
+        self.session = requests.Session()  # 复用连接
+        self.history = TimeSeriesStore(HISTORY_DIR).series("prices", ["price"])
+        self.migrate_history()
     
     def load_watches(self):
         """加载监控列表"""
@@ -54,17 +68,34 @@ class PriceMonitor:
         with open(WATCH_FILE, 'w') as f:
             json.dump(self.watches, f, indent=2)
     
-    def load_history(self):
-        """加载历史"""
-        if os.path.exists(HISTORY_FILE):
-            with open(HISTORY_FILE) as f:
-                return json.load(f)
-        return {}
+    @staticmethod
+    def watch_id(watch):
+        """规则ID: 监控项自带 id 时用它，否则为 标的:方向，增删其它监控时不变 (触发/冷却状态得以保留)"""
+        return watch.get('id') or f"{watch['symbol'].upper()}:{watch['direction']}"
+    
+    def migrate_history(self):
+        """把旧版 history.json 导入时序存储 (只执行一次)"""
+        if not os.path.exists(HISTORY_FILE):
+            return
+        with open(HISTORY_FILE) as f:
+            legacy = json.load(f)
+        for symbol, records in legacy.items():
+            self.history.append_many(symbol, [
+                (int(datetime.fromisoformat(r['time']).timestamp() * 1000), r['price'])
+                for r in records
+            ])
+        os.rename(HISTORY_FILE, HISTORY_FILE + '.migrated')
+    
+    def record_price(self, symbol, price, flush=True):
+        """追加一条价格记录"""
+        self.history.append(symbol, int(time.time() * 1000), price, flush=flush)
     
-    def save_history(self):
-        """保存历史"""
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump(self.history, f, indent=2)
+    def get_history(self, symbol, limit=100):
+        """最近的价格记录"""
+        return [
+            {'time': datetime.fromtimestamp(t / 1000).isoformat(), 'price': p}
+            for t, p in self.history.last(symbol, limit)
+        ]
     
     # ========== 价格获取 ==========
     
@@ -72,7 +103,7 @@ class PriceMonitor:
         """获取加密货币价格 (Binance)"""
         try:
             url = f'https://api.binance.com/api/v3/ticker/price?symbol={symbol.upper()}USDT'
-            resp = requests.get(url, timeout=10)
+            resp = self.session.get(url, timeout=10)
             if resp.status_code == 200:
                 return float(resp.json()['price'])
         except Exception as e:
@@ -86,7 +117,7 @@ class PriceMonitor:
             if code.startswith('0') or code.startswith('6'):
                 # A股 - 腾讯财经
                 url = f'https://qt.gtimg.cn/q={code}'
-                resp = requests.get(url, timeout=10)
+                resp = self.session.get(url, timeout=10)
                 if resp.status_code == 200:
                     data = resp.text
                     if '"' in data:
@@ -95,7 +126,7 @@ class PriceMonitor:
             elif code.endswith('.HK'):
                 # 港股
                 url = f'https://qt.gtimg.cn/q={code}'
-                resp = requests.get(url, timeout=10)
+                resp = self.session.get(url, timeout=10)
                 if resp.status_code == 200:
                     data = resp.text
                     if '"' in data:
@@ -104,7 +135,7 @@ class PriceMonitor:
             else:
                 # 美股
                 url = f'https://qt.gtimg.cn/q={code}'
-                resp = requests.get(url, timeout=10)
+                resp = self.session.get(url, timeout=10)
                 if resp.status_code == 200:
                     data = resp.text
                     if '"' in data:
@@ -117,37 +148,100 @@ class PriceMonitor:
     def get_price(self, symbol):
         """智能获取价格"""
         # 加密货币
-        cryptos = ['BTC', 'ETH', 'BNB', 'SOL', 'DOGE', 'XRP', 'ADA', 'AVAX', 'DOT', 'MATIC']
-        if symbol.upper() in cryptos:
+        if symbol.upper() in CRYPTOS:
             return self.get_crypto_price(symbol.upper())
         
         # 股票/数字货币
         return self.get_stock_price(symbol)
     
+    def get_crypto_prices(self, symbols):
+        """批量获取加密货币价格 (Binance 一次请求)"""
+        pairs = {f'{s.upper()}USDT': s for s in symbols}
+        try:
+            url = 'https://api.binance.com/api/v3/ticker/price'
+            resp = self.session.get(url, params={'symbols': json.dumps(list(pairs), separators=(',', ':'))}, timeout=10)
+            if resp.status_code == 200:
+                return {pairs[t['symbol']]: float(t['price']) for t in resp.json() if t['symbol'] in pairs}
+        except Exception as e:
+            print(f"批量获取加密货币失败: {e}")
+        return {}
+    
+    def get_stock_prices(self, codes):
+        """批量获取股票价格 (腾讯财经一次查询多个代码)"""
+        prices = {}
+        try:
+            resp = self.session.get(f'https://qt.gtimg.cn/q={",".join(codes)}', timeout=10)
+            if resp.status_code == 200:
+                # 每行形如 v_<代码>="字段~字段~...";
+                for line in resp.text.split(';'):
+                    name, sep, data = line.strip().partition('=')
+                    code = name[2:] if name.startswith('v_') else None
+                    if not sep or code not in codes or '"' not in data:
+                        continue
+                    parts = data.split('"')[1].split('~')
+                    index = 3 if code.startswith('0') or code.startswith('6') else 1
+                    if len(parts) > index and parts[index]:
+                        prices[code] = float(parts[index])
+        except Exception as e:
+            print(f"批量获取股票失败: {e}")
+        return prices
+    
+    def get_prices(self, symbols):
+        """批量获取价格: 去重后走批量接口，剩下的用线程池并发单独获取
+        
+        返回 {symbol: price}，获取失败的为 None
+        """
+        unique = list(dict.fromkeys(symbols))
+        cryptos = [s for s in unique if s.upper() in CRYPTOS]
+        stocks = [s for s in unique if s.upper() not in CRYPTOS]
+        
+        prices = {}
+        if cryptos:
+            prices.update(self.get_crypto_prices(cryptos))
+        if stocks:
+            prices.update(self.get_stock_prices(stocks))
+        
+        missing = [s for s in unique if s not in prices]
+        if missing:
+            workers = min(CONFIG['fetch_workers'], len(missing))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                prices.update(zip(missing, pool.map(self.get_price, missing)))
+        return prices
+    
     # ========== 监控操作 ==========
     
-    def add_watch(self, symbol, target_price, direction='above'):
-        """添加监控"""
+    def add_watch(self, symbol, target_price, direction='above', **options):
+        """添加监控
+        
+        options 透传给规则引擎: hysteresis (回差%), cooldown (冷却秒数)
+        """
         watch = {
             'symbol': symbol.upper(),
             'target': float(target_price),
             'direction': direction,  # 'above' 或 'below'
-            'added_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'added_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            **options
         }
         
-        # 检查是否已存在
+        # 检查是否已存在 (已存在则替换这一条规则，其它规则的状态不受影响)
         for w in self.watches:
             if w['symbol'] == watch['symbol']:
+                self.alerts.remove(self.watch_id(w))
                 w.update(watch)
                 break
         else:
+            w = watch
             self.watches.append(watch)
+        self.alerts.add(w, rule_id=self.watch_id(w))
         
         self.save_watches()
         print(f"✅ 已添加监控: {symbol} 目标 {direction} ${target_price}")
     
     def remove_watch(self, symbol):
         """移除监控"""
+        for w in self.watches:
+            if w['symbol'] == symbol.upper():
+                self.alerts.remove(self.watch_id(w))
         self.watches = [w for w in self.watches if w['symbol'] != symbol.upper()]
         self.save_watches()
         print(f"✅ 已移除监控: {symbol}")
@@ -171,50 +265,30 @@ class PriceMonitor:
         print(f"🔍 价格检查 - {datetime.now().strftime('%H:%M:%S')}")
         print('='*50)
         
-        triggered = []
+        prices = self.get_prices([w['symbol'] for w in self.watches])
         
-        for w in self.watches:
-            symbol = w['symbol']
-            target = w['target']
-            direction = w['direction']
-            
-            price = self.get_price(symbol)
-            
+        for symbol, price in prices.items():
             if price is None:
                 print(f"  ⚠️ {symbol}: 无法获取价格")
-                continue
-            
-            # 检查是否触发
-            is_triggered = False
-            if direction == 'above' and price > target:
-                is_triggered = True
-            elif direction == 'below' and price < target:
-                is_triggered = True
-            
-            # 记录历史
-            if symbol not in self.history:
-                self.history[symbol] = []
-            self.history[symbol].append({
-                'time': datetime.now().isoformat(),
-                'price': price
+            else:
+                print(f"  {symbol}: ${price:.2f}")
+        
+        # 规则引擎按阈值索引找出本轮触发的监控
+        triggered = []
+        for _, rule in self.alerts.update_many(prices):
+            goal = f"${rule['target']:.2f}" if 'target' in rule else f"跟踪 {rule['trailing']}%"
+            print(f"  🔔 触发! {rule['symbol']}: ${rule['fired_price']:.2f} (目标: {rule['direction']} {goal})")
+            triggered.append({
+                'symbol': rule['symbol'],
+                'price': rule['fired_price'],
+                'target': rule.get('target')
             })
-            
-            # 只保留最近100条
-            if len(self.history[symbol]) > 100:
-                self.history[symbol] = self.history[symbol][-100:]
-            
-            self.save_history()
-            
-            # 输出
-            status = "🔔 触发!" if is_triggered else ""
-            print(f"  {symbol}: ${price:.2f} (目标: ${target}) {status}")
-            
-            if is_triggered:
-                triggered.append({
-                    'symbol': symbol,
-                    'price': price,
-                    'target': target
-                })
+        
+        # 记录历史: 每个币种一条，整轮结束后统一刷盘
+        for symbol, price in prices.items():
+            if price is not None:
+                self.record_price(symbol, price, flush=False)
+        self.history.flush()
         
         return triggered
     
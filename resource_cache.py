@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+资源磁盘缓存 - 飞书图片/语音等消息资源
+- 下载边写边算 SHA-256，分块落盘，不把整个文件读进内存
+- 两级键: 资源 key (file_key/image_key) -> 内容哈希 -> 文件；同一 key 不会重复下载，
+  不同 key 但内容相同 (转发的语音/图片) 只存一份
+- 派生结果缓存: 转录文本等按内容哈希缓存，同一段语音只转录一次
+- 淘汰: 超过 TTL 的删除，总大小超过上限时按最近访问时间 LRU 淘汰
+- 同一个 key 并发请求只下载一次 (其他线程等待结果)
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+
+CHUNK_SIZE = 64 * 1024
+MAX_BYTES = 512 * 1024 * 1024
+TTL_SECONDS = 7 * 24 * 3600
+
+
+class ResourceCache:
+    """
+    cache = ResourceCache("/tmp/feishu_bot/cache")
+    path = cache.fetch(file_key, lambda write: stream_download(write), ext="ogg")
+    text = cache.memo(path, "transcript", lambda: transcribe(path))
+    """
+
+    def __init__(self, directory, max_bytes=MAX_BYTES, ttl=TTL_SECONDS):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._inflight = {}    # 正在下载/计算的 key -> threading.Event
+        self.conn = sqlite3.connect(str(self.directory / "index.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY, name TEXT, size INTEGER, created_at REAL, accessed_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_blobs_accessed ON blobs(accessed_at);
+            CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, hash TEXT);
+            CREATE INDEX IF NOT EXISTS idx_keys_hash ON keys(hash);
+            CREATE TABLE IF NOT EXISTS derived (
+                hash TEXT, kind TEXT, value TEXT, created_at REAL, PRIMARY KEY (hash, kind)
+            );
+        """)
+        self.hits = 0
+        self.misses = 0
+
+    # ========== 查找 ==========
+    def _lookup(self, key):
+        """key 命中且文件还在、未过期时返回路径并更新访问时间"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT b.hash, b.name, b.created_at FROM keys k JOIN blobs b ON b.hash=k.hash WHERE k.key=?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            path = self.directory / row[1]
+            if time.time() - row[2] > self.ttl or not path.exists():
+                self._remove_blob(row[0], row[1])
+                self.conn.commit()
+                return None
+            self.conn.execute("UPDATE blobs SET accessed_at=? WHERE hash=?", (time.time(), row[0]))
+            self.conn.commit()
+            return path
+
+    def get(self, key):
+        return self._lookup(key)
+
+    # ========== 下载 ==========
+    def _once(self, flight_key, lookup, produce):
+        """lookup 未命中时只让一个线程执行 produce，其他线程等它完成后重新 lookup；返回 (结果, 是否命中)"""
+        while True:
+            found = lookup()
+            if found is not None:
+                return found, True
+            with self._lock:
+                event = self._inflight.get(flight_key)
+                if event is None:
+                    event = self._inflight[flight_key] = threading.Event()
+                    break
+            event.wait()
+        try:
+            return produce(), False
+        finally:
+            with self._lock:
+                self._inflight.pop(flight_key, None)
+            event.set()
+
+    def fetch(self, key, download, ext="bin"):
+        """
+        返回 key 对应的本地文件路径 (文件名是内容哈希)
+        未命中时调用 download(write)，download 分块调用 write(bytes) 写入数据
+        """
+        path, hit = self._once(("key", key), lambda: self._lookup(key), lambda: self._download(key, download, ext))
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return path
+
+    def _download(self, key, download, ext):
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                def write(chunk):
+                    nonlocal size
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                download(write)
+            content_hash = digest.hexdigest()
+            name = f"{content_hash}.{ext}"
+            path = self.directory / name
+            now = time.time()
+            with self._lock:
+                if path.exists():
+                    os.remove(tmp)      # 内容已有 (另一个 key 下载过)，只记映射
+                else:
+                    os.replace(tmp, path)
+                self.conn.execute(
+                    "INSERT INTO blobs (hash, name, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(hash) DO UPDATE SET accessed_at=excluded.accessed_at",
+                    (content_hash, name, size, now, now)
+                )
+                self.conn.execute("INSERT OR REPLACE INTO keys (key, hash) VALUES (?, ?)", (key, content_hash))
+                self._evict(keep=content_hash)
+                self.conn.commit()
+            return path
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    # ========== 派生结果 ==========
+    def memo(self, path, kind, compute):
+        """按内容哈希缓存派生结果 (如转录文本)；path 必须是 fetch 返回的路径"""
+        content_hash = Path(path).stem
+
+        def lookup():
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT value FROM derived WHERE hash=? AND kind=?", (content_hash, kind)
+                ).fetchone()
+            return row[0] if row else None
+
+        def produce():
+            value = compute()
+            with self._lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO derived (hash, kind, value, created_at) VALUES (?, ?, ?, ?)",
+                    (content_hash, kind, value, time.time())
+                )
+                self.conn.commit()
+            return value
+
+        return self._once(("memo", content_hash, kind), lookup, produce)[0]
+
+    # ========== 淘汰 ==========
+    def _remove_blob(self, content_hash, name):
+        try:
+            os.remove(self.directory / name)
+        except FileNotFoundError:
+            pass
+        self.conn.execute("DELETE FROM blobs WHERE hash=?", (content_hash,))
+        self.conn.execute("DELETE FROM keys WHERE hash=?", (content_hash,))
+        self.conn.execute("DELETE FROM derived WHERE hash=?", (content_hash,))
+
+    def _evict(self, keep=None):
+        """先删过期的，再按最近访问时间淘汰到总大小不超过上限 (调用方持有锁)"""
+        expired = self.conn.execute(
+            "SELECT hash, name FROM blobs WHERE created_at<? AND hash IS NOT ?", (time.time() - self.ttl, keep)
+        ).fetchall()
+        for content_hash, name in expired:
+            self._remove_blob(content_hash, name)
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for content_hash, name, size in self.conn.execute(
+            "SELECT hash, name, size FROM blobs WHERE hash IS NOT ? ORDER BY accessed_at", (keep,)
+        ).fetchall():
+            self._remove_blob(content_hash, name)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def cleanup(self):
+        """定期调用: 清理过期文件和下载中断留下的临时文件"""
+        with self._lock:
+            self._evict()
+            self.conn.commit()
+        cutoff = time.time() - 3600
+        for part in self.directory.glob("*.part"):
+            if part.stat().st_mtime < cutoff:
+                part.unlink()
+
+    def stats(self):
+        with self._lock:
+            count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        return {"files": count, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+
+if __name__ == "__main__":
+    import shutil
+    from concurrent.futures import ThreadPoolExecutor
+
+    directory = tempfile.mkdtemp()
+    cache = ResourceCache(directory, max_bytes=3 * 1024 * 1024)
+    downloads = []
+    transcribed = []
+
+    def fake_download(seed, size=1024 * 1024):
+        def download(write):
+            downloads.append(seed)
+            time.sleep(0.05)
+            block = hashlib.sha256(str(seed).encode()).digest() * (CHUNK_SIZE // 32)
+            for _ in range(size // CHUNK_SIZE):
+                write(block)
+        return download
+
+    def transcribe(path):
+        transcribed.append(path)
+        time.sleep(0.2)
+        return f"转录 {Path(path).stem[:8]}"
+
+    # 同一条语音被并发处理 8 次 + 被转发成另一个 file_key
+    def handle(key, seed):
+        path = cache.fetch(key, fake_download(seed), ext="ogg")
+        return cache.memo(path, "transcript", lambda: transcribe(path))
+
+    start = time.time()
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda i: handle("file_v1", 1), range(8)))
+    handle("file_v1_forwarded", 1)
+    print(f"同一语音 9 次 (含转发): 下载 {len(downloads)} 次, 转录 {len(transcribed)} 次, {time.time() - start:.2f}s")
+
+    for i in range(2, 6):
+        cache.fetch(f"file_{i}", fake_download(i), ext="ogg")
+    print(f"写入 5 个 1MB 文件, 上限 3MB: {cache.stats()}")
+    print(f"最早的 file_v1 已被淘汰: {cache.get('file_v1') is None}")
+    shutil.rmtree(directory)
@@ -14,6 +14,7 @@ import hashlib
 from datetime import datetime, timedelta
 import os
 import sys
+from trade_log import LogWriter
 
 # ============ 配置 ============
 CONFIG = {
@@ -47,14 +48,16 @@ LOG_FILE = f"{DATA_DIR}/SAFE_TRADING.log"
 POSITION_FILE = f"{DATA_DIR}/positions.json"
 DAILY_STATS_FILE = f"{DATA_DIR}/daily_stats.json"
 
+# 日志后台批量写入
+LOG_WRITER = LogWriter(LOG_FILE)
+
 # ============ 工具函数 ============
 def log(msg, level="INFO"):
     """记录日志"""
     ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     line = f"[{ts}] [{level}] {msg}"
     print(line)
-    with open(LOG_FILE, "a") as f:
-        f.write(line + "\n")
+    LOG_WRITER.write(line)
 
 def send_alert(title, message, priority="normal"):
     """发送报警（可扩展到飞书/邮件）"""
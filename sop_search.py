@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+SOP 检索索引 - SOPSystem.search_sops 的后端
+- 分词: 英文/数字按词，中文按单字 + 双字 n-gram
+- 倒排表 + BM25 排序，字段加权 (名称 > 标签/描述 > 步骤正文)
+- 标签位图: 每个标签一个整数 bitset，标签过滤是位运算
+- 持久化: 快照 (每个 SOP 的词频向量) + 追加日志，增删只写一行，日志过长时合并进快照
+"""
+
+import os
+import re
+import json
+import math
+from collections import Counter
+
+FIELD_WEIGHTS = {"name": 3.0, "tags": 2.0, "description": 2.0, "body": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+JOURNAL_COMPACT = 200
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[㐀-鿿豈-﫿]+")
+
+
+def tokenize(text, query=False):
+    """
+    英文/数字整词，中日韩字符输出单字 + 相邻双字
+    查询时连续中文只取双字 (单字的倒排表很长，区分度又低)，单独一个字才用单字
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer((text or "").lower()):
+        word = match.group()
+        if word.isascii():
+            tokens.append(word)
+        elif query and len(word) > 1:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def sop_body(content):
+    """SOP Markdown 中参与检索的正文 (步骤部分)"""
+    idx = content.find("## 步骤")
+    return content[idx:] if idx >= 0 else content
+
+
+def term_weights(sop, body=""):
+    """单个 SOP 的加权词频向量和加权长度"""
+    fields = {
+        "name": sop.get("name", ""),
+        "tags": " ".join(sop.get("tags", [])),
+        "description": sop.get("description", ""),
+        "body": body
+    }
+    tf = Counter()
+    length = 0.0
+    for field, text in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        tokens = tokenize(text)
+        length += weight * len(tokens)
+        for token in tokens:
+            tf[token] += weight
+    return dict(tf), length
+
+
+class SOPSearchIndex:
+    """
+    SOP 倒排索引，以 filename 为文档键
+
+    index = SOPSearchIndex("memory/sop_search_index.json")
+    index.load(sops, read_body)        # 与 sop_index.json 不一致时自动重建
+    index.add(sop, body) / index.remove(filename)
+    index.search("读取文件", tags=["文件"]) -> [(filename, score), ...]
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + ".jsonl"
+        self._reset()
+
+    def _reset(self):
+        self.docs = []           # doc_id -> {"filename", "tags", "tf", "len"} 或 None (已删除)
+        self.ids = {}            # filename -> doc_id
+        self.postings = {}       # term -> {doc_id: 加权词频}
+        self.tag_bits = {}       # tag -> bitset
+        self.total_len = 0.0
+        self._norms = None
+        self._journal_lines = 0
+
+    # ========== 内存索引 ==========
+    def _insert(self, doc):
+        filename = doc["filename"]
+        if filename in self.ids:
+            self._delete(filename)
+        doc_id = len(self.docs)
+        self.docs.append(doc)
+        self.ids[filename] = doc_id
+        for term, weight in doc["tf"].items():
+            self.postings.setdefault(term, {})[doc_id] = weight
+        for tag in doc["tags"]:
+            self.tag_bits[tag] = self.tag_bits.get(tag, 0) | (1 << doc_id)
+        self.total_len += doc["len"]
+        self._norms = None
+
+    def _delete(self, filename):
+        doc_id = self.ids.pop(filename, None)
+        if doc_id is None:
+            return False
+        doc = self.docs[doc_id]
+        self.docs[doc_id] = None
+        for term in doc["tf"]:
+            plist = self.postings.get(term)
+            if plist is not None:
+                plist.pop(doc_id, None)
+                if not plist:
+                    del self.postings[term]
+        for tag in doc["tags"]:
+            bits = self.tag_bits.get(tag, 0) & ~(1 << doc_id)
+            if bits:
+                self.tag_bits[tag] = bits
+            else:
+                self.tag_bits.pop(tag, None)
+        self.total_len -= doc["len"]
+        self._norms = None
+        return True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, filename):
+        return filename in self.ids
+
+    # ========== 增量更新 ==========
+    def add(self, sop, body=""):
+        """新增或覆盖一个 SOP"""
+        tf, length = term_weights(sop, body)
+        doc = {"filename": sop["filename"], "tags": list(sop.get("tags", [])), "tf": tf, "len": length}
+        self._insert(doc)
+        self._append_journal({"op": "add", "doc": doc})
+
+    def remove(self, filename):
+        if self._delete(filename):
+            self._append_journal({"op": "remove", "filename": filename})
+
+    # ========== 检索 ==========
+    def _doc_norms(self):
+        """BM25 长度归一项，平均长度变化后惰性重算"""
+        if self._norms is None:
+            avg = self.total_len / len(self.ids) if self.ids else 1.0
+            self._norms = [
+                BM25_K1 * (1 - BM25_B + BM25_B * doc["len"] / avg) if doc else 0.0
+                for doc in self.docs
+            ]
+        return self._norms
+
+    def tag_mask(self, tags):
+        """任一标签命中的文档位图"""
+        mask = 0
+        for tag in tags:
+            mask |= self.tag_bits.get(tag, 0)
+        return mask
+
+    def search(self, query, tags=None, limit=None):
+        """返回按 BM25 分数降序的 [(filename, score)]"""
+        mask = self.tag_mask(tags) if tags else None
+        terms = set(tokenize(query, query=True))
+        if not terms:
+            return []
+        norms = self._doc_norms()
+        n = len(self.ids)
+        scores = {}
+        for term in terms:
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for doc_id, tf in plist.items():
+                if mask is not None and not (mask >> doc_id) & 1:
+                    continue
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norms[doc_id])
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        if limit:
+            ranked = ranked[:limit]
+        return [(self.docs[doc_id]["filename"], score) for doc_id, score in ranked]
+
+    def filter_tags(self, tags):
+        """只按标签过滤，按文档加入顺序返回 filename"""
+        mask = self.tag_mask(tags)
+        result = []
+        while mask:
+            low = mask & -mask
+            result.append(self.docs[low.bit_length() - 1]["filename"])
+            mask ^= low
+        return result
+
+    # ========== 持久化 ==========
+    def _append_journal(self, entry):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._journal_lines += 1
+        if self._journal_lines >= JOURNAL_COMPACT:
+            self.save()
+
+    def save(self):
+        """写快照 (顺带压缩掉已删除的文档 id) 并清空日志"""
+        docs = [doc for doc in self.docs if doc]
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "docs": docs}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._reset()
+        for doc in docs:
+            self._insert(doc)
+
+    def _load_files(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            for doc in json.load(f).get("docs", []):
+                self._insert(doc)
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break   # 写了一半的尾行
+                    if entry["op"] == "add":
+                        self._insert(entry["doc"])
+                    else:
+                        self._delete(entry["filename"])
+                    self._journal_lines += 1
+        return True
+
+    def load(self, sops, read_body):
+        """
+        加载持久化索引；与 sop_index.json 中的 SOP 集合不一致时全量重建
+        read_body(filename) 返回 SOP 正文，文件缺失时返回空字符串
+        """
+        try:
+            loaded = self._load_files()
+        except (OSError, ValueError, KeyError):
+            loaded = False
+        if loaded and set(self.ids) == {sop["filename"] for sop in sops}:
+            return
+        self.rebuild(sops, read_body)
+
+    def rebuild(self, sops, read_body):
+        self._reset()
+        for sop in sops:
+            tf, length = term_weights(sop, read_body(sop["filename"]))
+            self._insert({"filename": sop["filename"], "tags": list(sop.get("tags", [])), "tf": tf, "len": length})
+        self.save()
@@ -7,9 +7,17 @@ SOP 自进化系统
 import os
 import json
 import re
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 
+from sop_search import SOPSearchIndex, sop_body
+from task_log import TaskRecordLog
+
+CONTENT_CACHE_SIZE = 128
+# 同一段工具调用序列在至少这么多个任务里出现，才建议保存为 SOP
+SOP_MIN_SUPPORT = 2
+
 
 class SOPSystem:
     """
@@ -17,7 +25,7 @@ class SOPSystem:
     
     功能:
     - 任务解决后自动保存为 SOP
-    - 支持 SOP 检索
+    - 支持 SOP 检索 (倒排索引 + BM25 排序)
     - 支持 SOP 执行
     """
     
@@ -29,6 +37,18 @@ class SOPSystem:
         # L1 索引文件
         self.index_file = os.path.join(memory_dir, "sop_index.json")
         self.index = self._load_index()
+        
+        # SOP 内容 LRU 缓存: filename -> (mtime_ns, size, content)
+        self._content_cache = OrderedDict()
+        
+        # 检索索引，与 L1 索引不一致时自动重建
+        self._by_filename = {sop["filename"]: sop for sop in self.index.get("sops", [])}
+        self.search_index = SOPSearchIndex(os.path.join(memory_dir, "sop_search_index.json"))
+        self.search_index.load(list(self._by_filename.values()), self._read_body)
+        
+        # 任务记录: 追加写分段日志
+        self.task_log = TaskRecordLog(os.path.join(memory_dir, "task_records"))
+        self._migrate_task_records()
     
     def _load_index(self):
         """加载索引"""
@@ -37,6 +57,30 @@ class SOPSystem:
                 return json.load(f)
         return {"sops": [], "last_updated": None}
     
+    def _read_content(self, filename):
+        """读取 SOP 文件，按 mtime/大小校验缓存"""
+        filepath = os.path.join(self.sops_dir, filename)
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            self._content_cache.pop(filename, None)
+            return None
+        cached = self._content_cache.get(filename)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            self._content_cache.move_to_end(filename)
+            return cached[2]
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
+        self._content_cache[filename] = (st.st_mtime_ns, st.st_size, content)
+        self._content_cache.move_to_end(filename)
+        while len(self._content_cache) > CONTENT_CACHE_SIZE:
+            self._content_cache.popitem(last=False)
+        return content
+    
+    def _read_body(self, filename):
+        content = self._read_content(filename)
+        return sop_body(content) if content else ""
+    
     def _save_index(self):
         """保存索引"""
         self.index["last_updated"] = datetime.now().isoformat()
@@ -86,6 +130,7 @@ class SOPSystem:
         # 写入文件
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(content)
+        self._content_cache.pop(filename, None)
         
         # 更新索引
         sop_entry = {
@@ -99,6 +144,9 @@ class SOPSystem:
         self.index["sops"].append(sop_entry)
         self._save_index()
         
+        self._by_filename[filename] = sop_entry
+        self.search_index.add(sop_entry, sop_body(content))
+        
         return {"status": "success", "filepath": filepath, "sop": sop_entry}
     
     def record_task(self, task_name, tool_calls, result):
@@ -110,67 +158,85 @@ class SOPSystem:
             tool_calls: 工具调用列表 [{"tool": "xxx", "args": {...}}, ...]
             result: 执行结果
         """
-        # 保存到临时记录
-        record_file = os.path.join(self.memory_dir, "task_records.json")
-        records = []
-        
-        if os.path.exists(record_file):
-            with open(record_file, 'r', encoding='utf-8') as f:
-                records = json.load(f)
-        
         record = {
             "task_name": task_name,
             "tool_calls": tool_calls,
             "result": str(result)[:500],
             "recorded_at": datetime.now().isoformat()
         }
-        records.append(record)
+        self.task_log.append(record)
         
-        with open(record_file, 'w', encoding='utf-8') as f:
-            json.dump(records, f, ensure_ascii=False, indent=2)
-        
-        return {"status": "success", "records_count": len(records)}
+        return {"status": "success", "records_count": self.task_log.count()}
+    
+    def _migrate_task_records(self):
+        """旧版 task_records.json 一次性导入任务日志"""
+        record_file = os.path.join(self.memory_dir, "task_records.json")
+        if not os.path.exists(record_file):
+            return
+        with open(record_file, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        for record in records:
+            self.task_log.append(record)
+        self.task_log.flush()
+        os.replace(record_file, record_file + ".migrated")
     
-    def suggest_sop_creation(self, task_name, tool_calls):
+    def suggest_sop_creation(self, task_name, tool_calls, min_support=SOP_MIN_SUPPORT):
         """
         根据工具调用建议是否创建 SOP
         
-        如果一个任务调用了 3+ 个工具，建议创建 SOP
+        在任务记录中挖掘重复出现的连续工具序列: 本任务包含某段
+        在 min_support 个以上任务里出现过的序列时，建议把这段保存为 SOP
         """
-        if len(tool_calls) >= 3:
+        tools = [c.get("tool", "unknown") for c in tool_calls]
+        best = None
+        for seq, support in self.task_log.sequence_support(tools).items():
+            if support < min_support:
+                continue
+            if best is None or (len(seq), support) > (len(best[0]), best[1]):
+                best = (seq, support)
+        
+        if best:
+            seq, support = best
+            start = next(i for i in range(len(tools)) if tuple(tools[i:i + len(seq)]) == seq)
             return {
                 "suggestion": "CREATE_SOP",
-                "reason": f"此任务调用了 {len(tool_calls)} 个工具，值得保存为 SOP",
+                "reason": f"工具序列 {' → '.join(seq)} 已在 {support} 个任务中出现，值得保存为 SOP",
                 "task_name": task_name,
-                "steps": tool_calls
+                "support": support,
+                "steps": tool_calls[start:start + len(seq)]
             }
-        return {"suggestion": "SKIP", "reason": "任务较简单，无需创建 SOP"}
+        return {"suggestion": "SKIP", "reason": "没有重复出现的工具序列，暂不创建 SOP"}
     
-    def search_sops(self, query, tags=None):
+    def search_sops(self, query, tags=None, limit=None):
         """
         搜索 SOP
         
         Args:
-            query: 搜索关键词
-            tags: 标签过滤
+            query: 搜索关键词，按 BM25 相关度排序
+            tags: 标签过滤 (命中任一标签)
+            limit: 最多返回条数
         """
-        results = []
-        
-        for sop in self.index.get("sops", []):
-            # 标签过滤
+        if not query:
             if tags:
-                if not any(tag in sop.get("tags", []) for tag in tags):
-                    continue
-            
-            # 关键词搜索
-            if query:
-                q = query.lower()
-                if q not in sop.get("name", "").lower() and q not in sop.get("description", "").lower():
-                    continue
-            
+                results = [self._by_filename[f] for f in self.search_index.filter_tags(tags)]
+            else:
+                results = list(self._by_filename.values())
+            return results[:limit] if limit else results
+        
+        results = []
+        for filename, score in self.search_index.search(query, tags=tags, limit=limit):
+            sop = dict(self._by_filename[filename])
+            sop["score"] = round(score, 4)
             results.append(sop)
+        if results:
+            return results
         
-        return results
+        # 分词没有命中时退回子串匹配 (如英文单词的一部分)
+        q = query.lower()
+        for sop in self.search_sops("", tags):
+            if q in sop.get("name", "").lower() or q in sop.get("description", "").lower():
+                results.append(sop)
+        return results[:limit] if limit else results
     
     def get_sop(self, name_or_filename):
         """获取 SOP 内容"""
@@ -180,19 +246,17 @@ class SOPSystem:
         
         filepath = os.path.join(self.sops_dir, name_or_filename)
         
-        if not os.path.exists(filepath):
+        if name_or_filename not in self._by_filename and not os.path.exists(filepath):
             # 尝试搜索
             for sop in self.index.get("sops", []):
                 if name_or_filename in sop.get("filename", ""):
                     filepath = os.path.join(self.sops_dir, sop["filename"])
                     break
         
-        if not os.path.exists(filepath):
+        content = self._read_content(os.path.relpath(filepath, self.sops_dir))
+        if content is None:
             return {"status": "error", "msg": f"SOP 不存在: {name_or_filename}"}
         
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
         return {"status": "success", "content": content}
     
     def list_sops(self):
@@ -222,6 +286,10 @@ class SOPSystem:
         self.index["sops"] = [s for s in self.index["sops"] if s["filename"] != filename]
         self._save_index()
         
+        self._by_filename.pop(filename, None)
+        self._content_cache.pop(filename, None)
+        self.search_index.remove(filename)
+        
         return {"status": "success", "msg": f"已删除: {filename}"}
 
 
@@ -252,6 +320,9 @@ class SOPSaver:
         if not self.current_task:
             return
         
+        # 先写入任务记录，再从记录中挖掘重复序列
+        self.sop_system.record_task(self.current_task, self.tool_calls, result)
+        
         # 检查是否建议创建 SOP
         suggestion = self.sop_system.suggest_sop_creation(
             self.current_task, 
@@ -260,7 +331,7 @@ class SOPSaver:
         
         if suggestion["suggestion"] == "CREATE_SOP":
             print(f"[SOP] 建议创建 SOP: {self.current_task}")
-            print(f"       工具调用数: {len(self.tool_calls)}")
+            print(f"       {suggestion['reason']}")
             return suggestion
         
         self.current_task = None
@@ -304,3 +375,44 @@ if __name__ == '__main__':
     
     # 列出
     print(f"所有 SOP: {sop_system.list_sops()}")
+    
+    # 检索性能: 2000 个 SOP
+    import random
+    import tempfile
+    import time
+    
+    bench = SOPSystem(memory_dir=tempfile.mkdtemp())
+    tools = ["file_read", "file_write", "code_run", "web_scan", "web_execute_js", "file_patch"]
+    words = ["文件", "读取", "网页", "抓取", "小红书", "发布", "飞书", "消息", "日志", "分析",
+             "行情", "交易", "语音", "转写", "数据", "清洗", "报表", "部署", "监控", "告警"]
+    random.seed(0)
+    start = time.perf_counter()
+    for i in range(2000):
+        kw = random.sample(words, 3)
+        bench.create_sop(
+            name=f"{''.join(kw[:2])}流程{i}",
+            description=f"用于{kw[0]}和{kw[2]}的自动化流程",
+            steps=[{"tool": random.choice(tools), "args": {"path": f"/data/{i}.txt"}, "note": kw[1]}
+                   for _ in range(3)],
+            tags=kw[:2]
+        )
+    print(f"\n创建 2000 个 SOP: {time.perf_counter() - start:.1f}s")
+    
+    for query, tags in [("读取日志文件并分析", None), ("小红书发布", ["发布"]), ("code_run", None)]:
+        n = 200
+        start = time.perf_counter()
+        for _ in range(n):
+            hits = bench.search_sops(query, tags=tags, limit=3)
+        print(f"search_sops({query!r}, tags={tags}): {(time.perf_counter() - start) / n * 1000:.3f}ms, "
+              f"top={[h['name'] for h in hits]}")
+    
+    start = time.perf_counter()
+    reloaded = SOPSystem(memory_dir=bench.memory_dir)
+    print(f"重新加载索引: {(time.perf_counter() - start) * 1000:.0f}ms, 文档数 {len(reloaded.search_index)}")
+    name = hits[0]["name"]
+    start = time.perf_counter()
+    for _ in range(1000):
+        reloaded.get_sop(hits[0]["filename"])
+    print(f"get_sop (缓存): {(time.perf_counter() - start):.3f}ms/次")
+    reloaded.delete_sop(name)
+    print(f"删除后检索: {[h['name'] for h in reloaded.search_sops(name, limit=1)]}")
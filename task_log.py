@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+任务记录日志 - SOPSystem.record_task 的存储
+- 追加写 JSONL 分段文件，每条记录一次 O_APPEND write，多个 Agent 进程同时写不会互相覆盖
+- fsync 合批: 写入立即可见，后台线程按间隔统一 fsync
+- 分段超过大小后轮转，旧分段可以合并压缩 (按条数/时间保留)
+- 聚合视图: 增量扫描日志，统计跨任务重复出现的连续工具调用序列，用于 SOP 建议
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:   # Windows: 只在单进程内加锁
+    fcntl = None
+
+SEGMENT_SUFFIX = ".jsonl"
+
+
+class TaskRecordLog:
+    """
+    log = TaskRecordLog("memory/task_records")
+    log.append({"task_name": ..., "tool_calls": [...], ...})
+    log.frequent_sequences(min_support=2) -> [{"tools": [...], "support": n, "tasks": [...]}, ...]
+    """
+
+    def __init__(self, directory, segment_bytes=4 * 1024 * 1024, fsync_interval=1.0,
+                 min_seq_len=2, max_seq_len=6):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.min_seq_len = min_seq_len
+        self.max_seq_len = max_seq_len
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._fd = None
+        self._dirty = False
+        self._closed = False
+        # 聚合视图的增量扫描状态: 分段名 -> (inode, 已读偏移)
+        self._scan = {}
+        self._count = 0
+        self._support = Counter()
+        self._examples = {}
+        self._flusher = threading.Thread(target=self._fsync_loop, name="TaskRecordLog", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # ========== 分段 ==========
+    def segments(self):
+        """按顺序返回分段文件名"""
+        names = [n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX) and n[:-len(SEGMENT_SUFFIX)].isdigit()]
+        return sorted(names)
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"{seq:08d}{SEGMENT_SUFFIX}")
+
+    def _file_lock(self):
+        """跨进程锁 (轮转/压缩时持有)"""
+        return _FileLock(os.path.join(self.directory, ".lock"))
+
+    def _open_current(self):
+        """打开最新分段；已满时新建下一个"""
+        with self._file_lock():
+            names = self.segments()
+            seq = int(names[-1][:-len(SEGMENT_SUFFIX)]) if names else 1
+            path = self._segment_path(seq)
+            if names and os.path.getsize(path) >= self.segment_bytes:
+                path = self._segment_path(seq + 1)
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if self._fd is not None:
+            if self._dirty:
+                os.fsync(self._fd)
+            os.close(self._fd)
+        self._fd = fd
+        self._dirty = False
+
+    # ========== 写入 ==========
+    def append(self, record):
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            # 当前分段已满 (可能被别的进程写满) 或已被压缩替换时换到最新分段
+            if self._fd is None:
+                self._open_current()
+            else:
+                st = os.fstat(self._fd)
+                if st.st_size >= self.segment_bytes or st.st_nlink == 0:
+                    self._open_current()
+            os.write(self._fd, data)
+            self._dirty = True
+
+    def flush(self):
+        """立即 fsync"""
+        with self._lock:
+            if self._fd is not None and self._dirty:
+                os.fsync(self._fd)
+                self._dirty = False
+
+    def _fsync_loop(self):
+        while not self._closed:
+            time.sleep(self.fsync_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"[TaskRecordLog] fsync 失败: {e}")
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    # ========== 读取 ==========
+    def iter_records(self):
+        for name in self.segments():
+            with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+
+    def compact(self, max_records=None, max_age_days=None):
+        """
+        合并除当前分段外的所有分段，丢掉超出保留条数/天数的旧记录
+        返回合并后保留的记录数
+        """
+        with self._file_lock():
+            names = self.segments()[:-1]
+            if not names:
+                return 0
+            cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat() if max_age_days else None
+            records = []
+            for name in names:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.endswith("\n"):
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        if cutoff and record.get("recorded_at", "") < cutoff:
+                            continue
+                        records.append(line)
+            if max_records is not None:
+                records = records[-max_records:] if max_records else []
+            # 写到第一个分段的位置，保持分段顺序
+            target = os.path.join(self.directory, names[0])
+            tmp = target + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(records)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, target)
+            for name in names[1:]:
+                os.remove(os.path.join(self.directory, name))
+        return len(records)
+
+    # ========== 聚合视图 ==========
+    def _sequences(self, tools):
+        """一条记录里出现的所有连续子序列 (每条记录每个序列只计一次)"""
+        seen = set()
+        for n in range(self.min_seq_len, min(self.max_seq_len, len(tools)) + 1):
+            for i in range(len(tools) - n + 1):
+                seen.add(tuple(tools[i:i + n]))
+        return seen
+
+    def _refresh(self):
+        """只读取上次扫描之后新增的内容；分段被压缩/删除时全量重扫"""
+        names = self.segments()
+        stats = {}
+        for name in names:
+            try:
+                stats[name] = os.stat(os.path.join(self.directory, name)).st_ino
+            except FileNotFoundError:
+                pass
+        if any(name not in stats or stats[name] != ino for name, (ino, _) in self._scan.items()):
+            self._scan, self._count, self._support, self._examples = {}, 0, Counter(), {}
+        for name, ino in stats.items():
+            offset = self._scan.get(name, (ino, 0))[1]
+            with open(os.path.join(self.directory, name), "rb") as f:
+                f.seek(offset)
+                data = f.read()
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._count += 1
+                tools = [c.get("tool", "unknown") for c in record.get("tool_calls", [])]
+                for seq in self._sequences(tools):
+                    self._support[seq] += 1
+                    examples = self._examples.setdefault(seq, OrderedDict())
+                    examples[record.get("task_name", "")] = None
+                    if len(examples) > 5:
+                        examples.popitem(last=False)
+            self._scan[name] = (ino, offset + end)
+
+    def count(self):
+        with self._scan_lock:
+            self._refresh()
+            return self._count
+
+    def sequence_support(self, tools):
+        """给定工具序列的每个连续子序列在多少条记录中出现过"""
+        with self._scan_lock:
+            self._refresh()
+            return {seq: self._support.get(seq, 0) for seq in self._sequences(list(tools))}
+
+    def frequent_sequences(self, min_support=2, limit=20):
+        """
+        重复出现的工具调用序列，按 (支持度, 长度) 降序
+        被同支持度的更长序列包含的短序列不单独列出
+        """
+        with self._scan_lock:
+            self._refresh()
+            frequent = {seq: n for seq, n in self._support.items() if n >= min_support}
+        dominated = set()
+        for seq, n in frequent.items():
+            if len(seq) > self.min_seq_len:
+                for part in (seq[:-1], seq[1:]):
+                    if frequent.get(part) == n:
+                        dominated.add(part)
+        closed = [
+            {"tools": list(seq), "support": n, "tasks": list(self._examples[seq])}
+            for seq, n in frequent.items() if seq not in dominated
+        ]
+        closed.sort(key=lambda item: (-item["support"], -len(item["tools"])))
+        return closed[:limit]
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+
+
+if __name__ == "__main__":
+    import random
+    import shutil
+    import tempfile
+    import multiprocessing
+
+    directory = tempfile.mkdtemp()
+    flows = [["web_scan", "file_read", "file_write"], ["code_run", "file_read", "file_patch", "code_run"]]
+
+    def worker(n, seed):
+        rnd = random.Random(seed)
+        log = TaskRecordLog(directory, segment_bytes=64 * 1024)
+        for i in range(n):
+            tools = rnd.choice(flows) if rnd.random() < 0.5 else rnd.sample(["web_scan", "code_run", "file_read", "ask_user"], 2)
+            log.append({"task_name": f"task-{seed}-{i}", "tool_calls": [{"tool": t, "args": {"i": i}} for t in tools],
+                        "result": "ok", "recorded_at": datetime.now().isoformat()})
+        log.close()
+
+    print("=== 4 个进程并发写 ===")
+    start = time.perf_counter()
+    procs = [multiprocessing.Process(target=worker, args=(2500, seed)) for seed in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    log = TaskRecordLog(directory, segment_bytes=64 * 1024)
+    print(f"10000 条: {time.perf_counter() - start:.2f}s, 读回 {log.count()} 条, 分段 {len(log.segments())} 个")
+
+    old_file = os.path.join(directory, "old.json")
+    records = []
+    start = time.perf_counter()
+    for i in range(1000):
+        records = json.load(open(old_file, encoding="utf-8")) if os.path.exists(old_file) else []
+        records.append({"task_name": f"t{i}", "tool_calls": [{"tool": "code_run", "args": {}}], "result": "ok"})
+        with open(old_file, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+    print(f"旧方式 (整文件读写) 1000 条: {time.perf_counter() - start:.2f}s")
+    os.remove(old_file)
+
+    print("=== 重复序列 ===")
+    for item in log.frequent_sequences(min_support=1000, limit=5):
+        print(f"{' → '.join(item['tools'])}: {item['support']}")
+
+    kept = log.compact(max_records=3000)
+    print(f"压缩后: 旧分段保留 {kept} 条, 分段 {len(log.segments())} 个, 共 {log.count()} 条")
+    log.close()
+    shutil.rmtree(directory)
@@ -1,38 +1,60 @@
 #!/usr/bin/env python3
 """
 案例04: 三层记忆系统(完整版)
+回忆走本地向量索引 (哈希 n-gram + BM25 混合)，同义改写也能找到，只返回最相关的几条
 """
 
+from vector_index import VectorIndex
+
+
 class ThreeTierMemory:
-    def __init__(self):
+    def __init__(self, index_dir=None):
         self.long_term = []  # 长期记忆
         self.working = []    # 工作记忆
         self.episodic = []  # 情景记忆
+        self.index = VectorIndex(index_dir)
+        self._seq = 0
+        self._working_keys = []
+    
+    def _index(self, tier, info):
+        self._seq += 1
+        key = f"{tier}:{self._seq}"
+        self.index.add(key, str(info), {"tier": tier})
+        return key
     
     def store_long_term(self, info):
         self.long_term.append(info)
+        self._index("long_term", info)
         print(f"✅ 存入长期记忆: {info}")
     
     def store_working(self, info):
         self.working.append(info)
+        self._working_keys.append(self._index("working", info))
         print(f"📝 存入工作记忆: {info}")
     
     def store_episodic(self, event):
         self.episodic.append(event)
+        self._index("episodic", event)
         print(f"📸 存入情景记忆: {event}")
     
-    def recall(self, query):
+    def recall(self, query, k=3, min_score=0.15):
+        """返回最相关的 k 条 [(层级, 内容, 分数)]"""
         print(f"\n🔍 回忆: {query}")
         
-        for m in self.long_term:
-            if query in m:
-                print(f"  找到: {m}")
+        results = []
+        for hit in self.index.search(query, k=k, min_score=min_score):
+            results.append((hit["meta"]["tier"], hit["text"], hit["score"]))
+            print(f"  找到 [{hit['meta']['tier']}] {hit['text']} ({hit['score']:.2f})")
+        return results
     
     def consolidate(self):
         """将工作记忆转入长期记忆"""
-        for info in self.working:
+        for info, key in zip(self.working, self._working_keys):
             self.long_term.append(info)
+            self.index.remove(key)
+            self._index("long_term", info)
         self.working = []
+        self._working_keys = []
         print("✅ 已整合到长期记忆")
 
 
@@ -42,3 +64,4 @@ if __name__ == '__main__':
     m.store_working("用户问天气")
     m.recall("AI")
     m.consolidate()
+    m.recall("用户想知道今天天气怎么样")
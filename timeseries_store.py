@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+列式时序存储 - 替代追加写的价格CSV / 整体重写的 history.json
+- 按 序列/交易对/日期(UTC) 分区的定长二进制记录文件: <root>/<series>/<SYMBOL>/<YYYYMMDD>.bin
+- 每条记录: int64 时间(毫秒) + N 个 float64 字段
+- 追加 O(1)；读取用 mmap + 二分查找做时间范围查询，不解析文本
+- 可选 numpy: range_array() 直接返回 memmap 结构化数组切片
+- 降采样: 逐笔 -> K线，小周期K线 -> 大周期K线
+
+用法:
+    store = TimeSeriesStore("~/.openclaw/workspace/trading_data/tsdb")
+    ticks = store.series("ticks", ["price", "volume"])
+    ticks.append("BTCUSDT", time_ms, 65000.0, 0.1)
+    rows = ticks.range("BTCUSDT", start_ms, end_ms)
+
+    candles = store.candles("1m")
+    candles.upsert("BTCUSDT", open_time, o, h, l, c, v)
+"""
+
+import os
+import json
+import mmap
+import struct
+import threading
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from market_data import INTERVAL_MS
+
+DAY_MS = 86_400_000
+_DAY_KEYS = {}  # 天序号 -> 分区名缓存
+
+
+def _day_key(time_ms):
+    day = time_ms // DAY_MS
+    key = _DAY_KEYS.get(day)
+    if key is None:
+        key = _DAY_KEYS[day] = datetime.fromtimestamp(day * 86400, tz=timezone.utc).strftime("%Y%m%d")
+    return key
+
+
+class Series:
+    """一个定长记录序列 (time + fields)"""
+
+    def __init__(self, root, name, fields):
+        self.root = os.path.join(root, name)
+        self.name = name
+        self.fields = list(fields)
+        self.record = struct.Struct("<q" + "d" * len(self.fields))
+        self._files = {}       # symbol -> (day, file)
+        self._last_time = {}   # symbol -> 最后写入时间
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._check_schema()
+
+    def _check_schema(self):
+        schema_file = os.path.join(self.root, "_schema.json")
+        if os.path.exists(schema_file):
+            with open(schema_file) as f:
+                existing = json.load(f)["fields"]
+            if existing != self.fields:
+                raise ValueError(f"序列 {self.name} 字段不一致: 已有 {existing}, 传入 {self.fields}")
+        else:
+            with open(schema_file, "w") as f:
+                json.dump({"fields": self.fields, "record_size": self.record.size}, f)
+
+    @property
+    def dtype(self):
+        return np.dtype([("time", "<i8")] + [(f, "<f8") for f in self.fields])
+
+    def _path(self, symbol, day):
+        return os.path.join(self.root, symbol.upper(), f"{day}.bin")
+
+    def symbols(self):
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def days(self, symbol):
+        path = os.path.join(self.root, symbol.upper())
+        if not os.path.isdir(path):
+            return []
+        return sorted(f[:-4] for f in os.listdir(path) if f.endswith(".bin"))
+
+    def _days_between(self, symbol, start_ms, end_ms):
+        """[start_ms, end_ms] 内已有的分区；按实际文件取，start_ms=0 也不会逐天遍历到 1970 年"""
+        first, last = _day_key(max(start_ms, 0)), _day_key(end_ms)
+        return [day for day in self.days(symbol) if first <= day <= last]
+
+    # ----- 写入 -----
+    def _file_for(self, symbol, day):
+        cached = self._files.get(symbol)
+        if cached and cached[0] == day:
+            return cached[1]
+        if cached:
+            cached[1].close()
+        path = self._path(symbol, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        f = open(path, "r+b" if os.path.exists(path) else "w+b")
+        f.seek(0, os.SEEK_END)
+        self._files[symbol] = (day, f)
+        return f
+
+    def append(self, symbol, time_ms, *values, flush=True):
+        """追加一条记录 (同一交易对时间需递增)"""
+        symbol = symbol.upper()
+        time_ms = int(time_ms)
+        with self._lock:
+            f = self._file_for(symbol, _day_key(time_ms))
+            f.write(self.record.pack(time_ms, *map(float, values)))
+            if flush:
+                f.flush()
+            self._last_time[symbol] = time_ms
+
+    def append_many(self, symbol, rows):
+        """批量追加 [(time_ms, v1, v2, ...), ...]"""
+        for row in rows:
+            self.append(symbol, row[0], *row[1:], flush=False)
+        self.flush()
+
+    def replace_last(self, symbol, time_ms, *values):
+        """覆盖该交易对最后一条记录 (用于更新未收盘K线)"""
+        symbol = symbol.upper()
+        with self._lock:
+            f = self._file_for(symbol, _day_key(time_ms))
+            f.seek(-self.record.size, os.SEEK_END)
+            f.write(self.record.pack(int(time_ms), *map(float, values)))
+            f.flush()
+
+    def last_time(self, symbol):
+        symbol = symbol.upper()
+        if symbol not in self._last_time:
+            rows = self.last(symbol, 1)
+            self._last_time[symbol] = rows[0][0] if rows else None
+        return self._last_time[symbol]
+
+    def flush(self):
+        with self._lock:
+            for _, f in self._files.values():
+                f.flush()
+
+    def close(self):
+        with self._lock:
+            for _, f in self._files.values():
+                f.close()
+            self._files.clear()
+
+    # ----- 读取 -----
+    def _map(self, path):
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        n = size // self.record.size
+        if n == 0:
+            return None, 0
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), n * self.record.size, access=mmap.ACCESS_READ), n
+
+    def _bisect(self, mm, n, time_ms):
+        """第一条 time >= time_ms 的记录下标"""
+        lo, hi = 0, n
+        size = self.record.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from("<q", mm, mid * size)[0] < time_ms:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, symbol, start_ms, end_ms):
+        """[start_ms, end_ms] 内的记录 [(time, v1, v2, ...), ...]"""
+        self.flush()
+        rows = []
+        for day in self._days_between(symbol, start_ms, end_ms):
+            mm, n = self._map(self._path(symbol, day))
+            if mm is None:
+                continue
+            with mm:
+                lo = self._bisect(mm, n, start_ms)
+                hi = self._bisect(mm, n, end_ms + 1)
+                rows.extend(self.record.iter_unpack(mm[lo * self.record.size:hi * self.record.size]))
+        return rows
+
+    def range_array(self, symbol, start_ms, end_ms):
+        """同 range()，返回 numpy 结构化数组 (需要 numpy)"""
+        self.flush()
+        parts = []
+        for day in self._days_between(symbol, start_ms, end_ms):
+            path = self._path(symbol, day)
+            if not os.path.exists(path) or os.path.getsize(path) < self.record.size:
+                continue
+            n = os.path.getsize(path) // self.record.size
+            arr = np.memmap(path, dtype=self.dtype, mode="r", shape=(n,))
+            lo, hi = np.searchsorted(arr["time"], [start_ms, end_ms + 1])
+            parts.append(np.array(arr[lo:hi]))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=self.dtype)
+
+    def last(self, symbol, n=1):
+        """最近 n 条记录，从最新分区往前读"""
+        self.flush()
+        rows = []
+        for day in reversed(self.days(symbol)):
+            mm, count = self._map(self._path(symbol, day))
+            if mm is None:
+                continue
+            with mm:
+                take = min(n - len(rows), count)
+                start = (count - take) * self.record.size
+                rows[:0] = list(self.record.iter_unpack(mm[start:count * self.record.size]))
+            if len(rows) >= n:
+                break
+        return rows
+
+
+class CandleSeries(Series):
+    """K线序列: open_time + open/high/low/close/volume"""
+
+    FIELDS = ["open", "high", "low", "close", "volume"]
+
+    def __init__(self, root, interval):
+        super().__init__(root, f"candles_{interval}", self.FIELDS)
+        self.interval = interval
+
+    def upsert(self, symbol, open_time, o, h, l, c, v):
+        """同一根K线覆盖，新K线追加"""
+        last = self.last_time(symbol)
+        if last is not None and int(open_time) == last:
+            self.replace_last(symbol, open_time, o, h, l, c, v)
+        elif last is None or int(open_time) > last:
+            self.append(symbol, open_time, o, h, l, c, v)
+
+    def klines(self, symbol, start_ms, end_ms):
+        """REST K线格式 [open_time, o, h, l, c, v, close_time]"""
+        step = INTERVAL_MS[self.interval]
+        return [[int(r[0]), r[1], r[2], r[3], r[4], r[5], int(r[0]) + step - 1]
+                for r in self.range(symbol, start_ms, end_ms)]
+
+
+# ========== 降采样 ==========
+def downsample_ticks(rows, interval, price_index=1, volume_index=None):
+    """逐笔 [(time, price, ...)] -> K线 [(open_time, o, h, l, c, v)]"""
+    step = INTERVAL_MS[interval]
+    out = []
+    for row in rows:
+        t = row[0] // step * step
+        p = row[price_index]
+        v = row[volume_index] if volume_index is not None else 0.0
+        if out and out[-1][0] == t:
+            c = out[-1]
+            c[2] = max(c[2], p)
+            c[3] = min(c[3], p)
+            c[4] = p
+            c[5] += v
+        else:
+            out.append([t, p, p, p, p, v])
+    return [tuple(c) for c in out]
+
+def downsample_candles(rows, interval):
+    """小周期K线 [(open_time, o, h, l, c, v)] -> 大周期K线"""
+    step = INTERVAL_MS[interval]
+    out = []
+    for t0, o, h, l, c, v in rows:
+        t = t0 // step * step
+        if out and out[-1][0] == t:
+            a = out[-1]
+            a[2] = max(a[2], h)
+            a[3] = min(a[3], l)
+            a[4] = c
+            a[5] += v
+        else:
+            out.append([t, o, h, l, c, v])
+    return [tuple(a) for a in out]
+
+
+class TimeSeriesStore:
+    """按名称管理多个序列"""
+
+    def __init__(self, root):
+        self.root = os.path.expanduser(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._series = {}
+
+    def series(self, name, fields):
+        if name not in self._series:
+            self._series[name] = Series(self.root, name, fields)
+        return self._series[name]
+
+    def candles(self, interval="1m"):
+        name = f"candles_{interval}"
+        if name not in self._series:
+            self._series[name] = CandleSeries(self.root, interval)
+        return self._series[name]
+
+    def close(self):
+        for s in self._series.values():
+            s.close()
+
+
+if __name__ == "__main__":
+    import time
+    import tempfile
+
+    print("=== 时序存储基准 ===")
+    root = tempfile.mkdtemp(prefix="tsdb_")
+    store = TimeSeriesStore(root)
+    ticks = store.series("ticks", ["price", "volume"])
+
+    n = 90 * 24 * 60  # 90天1分钟数据
+    t0 = int(datetime(2026, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    start = time.perf_counter()
+    ticks.append_many("BTCUSDT", ((t0 + i * 60_000, 60000 + i % 500, 1.0) for i in range(n)))
+    print(f"  写入 {n} 条: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    day_rows = ticks.range("BTCUSDT", t0 + 45 * DAY_MS, t0 + 46 * DAY_MS - 1)
+    print(f"  查询1天 ({len(day_rows)} 条): {(time.perf_counter() - start) * 1000:.2f}ms")
+
+    start = time.perf_counter()
+    all_rows = ticks.range("BTCUSDT", t0, t0 + 90 * DAY_MS)
+    hourly = downsample_ticks(all_rows, "1h", volume_index=2)
+    print(f"  全量 {len(all_rows)} 条 -> {len(hourly)} 根1h K线: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    last = ticks.last("BTCUSDT", 100)
+    print(f"  最近100条: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+    if NUMPY_AVAILABLE:
+        start = time.perf_counter()
+        arr = ticks.range_array("BTCUSDT", t0, t0 + 90 * DAY_MS)
+        print(f"  numpy 全量 {len(arr)} 条: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+    candles = store.candles("1m")
+    candles.upsert("BTCUSDT", t0, 1, 2, 0.5, 1.5, 10)
+    candles.upsert("BTCUSDT", t0, 1, 3, 0.5, 2.5, 12)
+    candles.upsert("BTCUSDT", t0 + 60_000, 2.5, 3, 2, 2.8, 5)
+    print(f"  K线upsert: {candles.klines('BTCUSDT', t0, t0 + 120_000)}")
+    store.close()
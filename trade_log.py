@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+交易日志子系统 - 写入 / 跟随 / 取尾部
+- LogWriter:   后台线程批量写入，文件句柄常驻，按日期换文件、被外部轮转(inode变化)时自动重开
+- LogFollower: 记住字节偏移和 inode，每次只读新增字节，维护最近N行
+- tail_lines:  从文件末尾向前按块读取最后N行，耗时与文件大小无关
+"""
+
+import os
+import queue
+import atexit
+import threading
+from collections import deque
+
+BLOCK_SIZE = 8192
+
+
+# ========== 取尾部 ==========
+def _read_tail(f, end, n):
+    """从 end 向前读到至少 n 个完整行之前的换行符，返回 (起始偏移, 字节块)"""
+    pos = end
+    chunks = []
+    newlines = 0
+    while pos > 0 and newlines <= n:
+        step = min(BLOCK_SIZE, pos)
+        pos -= step
+        f.seek(pos)
+        chunk = f.read(step)
+        chunks.append(chunk)
+        newlines += chunk.count(b"\n")
+    data = b"".join(reversed(chunks))
+    if pos > 0:
+        # 丢掉第一个换行之前不完整的那一行
+        cut = data.index(b"\n") + 1
+        pos += cut
+        data = data[cut:]
+    return pos, data
+
+def tail_lines(path, n=20, encoding="utf-8"):
+    """读取文件最后 n 行 (保留行尾换行符，与 readlines()[-n:] 一致)"""
+    if n <= 0:
+        return []
+    try:
+        with open(path, "rb") as f:
+            end = f.seek(0, os.SEEK_END)
+            _, data = _read_tail(f, end, n)
+    except FileNotFoundError:
+        return []
+    lines = data.decode(encoding, errors="replace").splitlines(keepends=True)
+    return lines[-n:]
+
+
+# ========== 跟随读取 ==========
+class LogFollower:
+    """类似 tail -F: 保存偏移量，只读取新增字节
+
+    文件被截断、替换(inode变化)或被删除后重建时，从新文件尾部重新加载
+    """
+
+    def __init__(self, path, keep=20, encoding="utf-8"):
+        self.path = path
+        self.encoding = encoding
+        self.lines = deque(maxlen=keep)
+        self._inode = None
+        self._offset = 0
+        self._partial = b""
+
+    def poll(self):
+        """读取新增内容，返回本次新增的完整行列表"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+
+        with open(self.path, "rb") as f:
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                self._inode = st.st_ino
+                self._partial = b""
+                self.lines.clear()
+                start, data = _read_tail(f, st.st_size, self.lines.maxlen or 0)
+                self._offset = start + len(data)
+            elif st.st_size == self._offset:
+                return []
+            else:
+                f.seek(self._offset)
+                data = f.read(st.st_size - self._offset)
+                self._offset += len(data)
+
+        data = self._partial + data
+        complete, sep, self._partial = data.rpartition(b"\n")
+        if not sep:
+            self._partial = complete
+            return []
+        new_lines = (complete + sep).decode(self.encoding, errors="replace").splitlines(keepends=True)
+        self.lines.extend(new_lines)
+        return new_lines
+
+    def tail(self):
+        """当前保留的最近N行"""
+        self.poll()
+        return list(self.lines)
+
+
+# ========== 异步写入 ==========
+class LogWriter:
+    """后台批量写日志，调用方只做一次入队
+
+    path 可以是字符串或返回路径的函数 (例如按日期命名的日志)，在调用 write 时求值，
+    保证跨零点的日志写进各自日期的文件
+    """
+
+    def __init__(self, path, flush_interval=0.5, encoding="utf-8"):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.encoding = encoding
+        self._queue = queue.Queue()
+        self._file = None
+        self._file_path = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, line):
+        """写入一行 (自动补换行符)"""
+        if self._closed:
+            return
+        path = self.path() if callable(self.path) else self.path
+        if not line.endswith("\n"):
+            line += "\n"
+        self._queue.put((path, line))
+
+    def flush(self):
+        """阻塞直到已入队的日志全部落盘"""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _open(self, path):
+        """打开目标文件；路径变化或文件被外部轮转/删除时重开"""
+        if self._file and self._file_path == path:
+            try:
+                if os.stat(path).st_ino == os.fstat(self._file.fileno()).st_ino:
+                    return self._file
+            except FileNotFoundError:
+                pass
+        if self._file:
+            self._file.close()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding=self.encoding)
+        self._file_path = path
+        return self._file
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [item]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            try:
+                current, lines = None, []
+                for entry in batch:
+                    if entry is None:
+                        stop = True
+                        continue
+                    path, line = entry
+                    if path != current and lines:
+                        self._open(current).writelines(lines)
+                        lines = []
+                    current = path
+                    lines.append(line)
+                if lines:
+                    self._open(current).writelines(lines)
+                if self._file:
+                    self._file.flush()
+            except OSError as e:
+                print(f"[LogWriter] 写日志失败: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if stop:
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                return
+
+
+if __name__ == "__main__":
+    import time
+    import tempfile
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "trades.log")
+
+    print("=== 写入 ===")
+    writer = LogWriter(path)
+    start = time.perf_counter()
+    for i in range(200000):
+        writer.write(f"[2026-01-01 00:00:00] [INFO] line {i} " + "x" * 60)
+    writer.flush()
+    print(f"20万行: {time.perf_counter() - start:.2f}s, 文件 {os.path.getsize(path) / 1e6:.1f}MB")
+
+    print("=== 尾部 ===")
+    start = time.perf_counter()
+    last = tail_lines(path, 20)
+    print(f"tail_lines: {(time.perf_counter() - start) * 1000:.2f}ms, 末行: {last[-1].strip()[:40]}")
+    start = time.perf_counter()
+    with open(path) as f:
+        assert f.readlines()[-20:] == last
+    print(f"readlines:  {(time.perf_counter() - start) * 1000:.2f}ms")
+
+    print("=== 跟随 ===")
+    follower = LogFollower(path, keep=20)
+    follower.poll()
+    writer.write("new line A")
+    writer.flush()
+    print("新增:", [l.strip() for l in follower.poll()])
+    os.rename(path, path + ".1")          # 外部轮转
+    writer.write("after rotate")
+    writer.flush()
+    print("轮转后:", [l.strip() for l in follower.tail()])
+    writer.close()
@@ -7,12 +7,13 @@
 import time
 import json
 import base64
-import csv
 import os
 import sys
 from datetime import datetime, timedelta
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
-import urllib.request
+from exchange_client import ExchangeClient, ed25519_signer
+from timeseries_store import TimeSeriesStore
+from trade_log import LogWriter
 
 # ========== 配置 ==========
 CONFIG = {
@@ -32,80 +33,36 @@ full_key = base64.b64decode(CONFIG["private_key_b64"])
 seed = full_key[16:48]
 PRIVATE_KEY = Ed25519PrivateKey.from_private_bytes(seed)
 
+# 日志后台批量写入，按日期写入 trades_YYYYMMDD.log
+LOG_WRITER = LogWriter(lambda: os.path.join(CONFIG["data_dir"], f"trades_{datetime.now().strftime('%Y%m%d')}.log"))
+
 # ========== 工具函数 ==========
 def log(msg, level="INFO"):
     """记录日志"""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_line = f"[{timestamp}] [{level}] {msg}"
     print(log_line)
-    
-    log_file = os.path.join(CONFIG["data_dir"], f"trades_{datetime.now().strftime('%Y%m%d')}.log")
-    with open(log_file, "a") as f:
-        f.write(log_line + "\n")
+    LOG_WRITER.write(log_line)
+
+# 共享交易所客户端 (缓存时钟偏移 + keep-alive连接池)
+CLIENT = ExchangeClient(CONFIG["api_key"], ed25519_signer(PRIVATE_KEY),
+                        time_url="https://api.binance.com/api/v3/time")
 
 def make_request(endpoint, params=None, base_url="https://fapi.binance.com"):
     """发送带签名的API请求"""
-    try:
-        # 获取服务器时间
-        with urllib.request.urlopen("https://api.binance.com/api/v3/time", timeout=10) as resp:
-            server_time = json.loads(resp.read().decode())['serverTime']
-    except:
-        server_time = int(time.time() * 1000)
-    
-    if params is None:
-        params = {}
-    params['timestamp'] = server_time
-    
-    payload = '&'.join([f"{k}={v}" for k, v in params.items()])
-    signature = PRIVATE_KEY.sign(payload.encode('utf-8'))
-    sig_b64 = base64.b64encode(signature).decode('utf-8')
-    
-    url = f"{base_url}{endpoint}?{payload}&signature={sig_b64}"
-    req = urllib.request.Request(url, headers={'X-MBX-APIKEY': CONFIG["api_key"]})
-    
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return json.loads(resp.read().decode())
-    except urllib.error.HTTPError as e:
-        err = json.loads(e.read().decode())
-        return {"code": err.get('code'), "msg": err.get('msg')}
-    except Exception as e:
-        return {"error": str(e)}
+    return CLIENT.get(endpoint, params, base_url=base_url)
 
 def make_post_request(endpoint, params, base_url="https://fapi.binance.com"):
     """发送POST请求"""
-    try:
-        with urllib.request.urlopen("https://api.binance.com/api/v3/time", timeout=10) as resp:
-            server_time = json.loads(resp.read().decode())['serverTime']
-    except:
-        server_time = int(time.time() * 1000)
-    
-    params['timestamp'] = server_time
-    payload = '&'.join([f"{k}={v}" for k, v in params.items()])
-    
-    signature = PRIVATE_KEY.sign(payload.encode('utf-8'))
-    sig_b64 = base64.b64encode(signature).decode('utf-8')
-    
-    url = f"{base_url}{endpoint}"
-    data = f"{payload}&signature={sig_b64}"
-    
-    req = urllib.request.Request(url, data=data.encode('utf-8'), headers={
-        'X-MBX-APIKEY': CONFIG["api_key"],
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }, method='POST')
-    
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return json.loads(resp.read().decode())
-    except urllib.error.HTTPError as e:
-        err = json.loads(e.read().decode())
-        return {"code": err.get('code'), "msg": err.get('msg')}
-    except Exception as e:
-        return {"error": str(e)}
+    return CLIENT.post(endpoint, params, base_url=base_url)
+
+# 价格记录 (定长二进制时序存储，替代追加写的 prices_*.csv)
+PRICE_STORE = TimeSeriesStore(os.path.join(CONFIG["data_dir"], "tsdb"))
 
 # ========== 交易逻辑 ==========
 class TradingBot:
     def __init__(self):
+        self.prices = PRICE_STORE.series("prices", ["price", "position_amt", "total_pnl"])
         self.price_history = []
         self.position = None
         self.daily_pnl = 0
@@ -214,17 +171,14 @@ class TradingBot:
         if len(self.price_history) > 100:
             self.price_history = self.price_history[-100:]
         
-        # 写入CSV
-        csv_file = os.path.join(CONFIG["data_dir"], f"prices_{CONFIG['symbol']}.csv")
-        with open(csv_file, "a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                price,
-                self.position['side'] if self.position else "NONE",
-                self.position['amt'] if self.position else 0,
-                self.total_pnl
-            ])
+        # 写入时序存储 (持仓方向用数量正负表示)
+        self.prices.append(
+            CONFIG["symbol"],
+            int(time.time() * 1000),
+            price,
+            float(self.position['amt']) if self.position else 0,
+            self.total_pnl
+        )
     
     def check_and_report(self):
         """检查并汇报"""
@@ -396,5 +350,6 @@ class TradingBot:
 
 # ========== 启动 ==========
 if __name__ == "__main__":
+    CLIENT.start_time_sync()
     bot = TradingBot()
     bot.run()
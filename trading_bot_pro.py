@@ -5,7 +5,6 @@ V2.0 - 多维度信号 + 智能风控 + 波动率适应
 """
 
 import time
-import json
 import base64
 import csv
 import os
@@ -13,7 +12,10 @@ import sys
 import statistics
 from datetime import datetime, timedelta
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
-import urllib.request
+from exchange_client import ExchangeClient, ed25519_signer
+from indicator_engine import IndicatorEngine
+from market_data import MarketDataFeed, WEBSOCKETS_AVAILABLE
+from trade_log import LogWriter
 
 # ========== 激进进攻配置 ==========
 CONFIG = {
@@ -22,6 +24,7 @@ CONFIG = {
     "symbols": ["BTCUSDT", "ETHUSDT", "SOLUSDT"],  # 多币种监控
     "primary_symbol": "BTCUSDT",  # 主交易对
     "check_interval": 30,  # 30秒高频监控
+    "use_websocket": True,  # WebSocket行情推送，断流时回退REST
     "target_profit": 0.50,
     "initial_balance": 50,
     "max_daily_loss": 15,  # 允许亏损15 USDT (30%)
@@ -58,91 +61,31 @@ full_key = base64.b64decode(CONFIG["private_key_b64"])
 seed = full_key[16:48]
 PRIVATE_KEY = Ed25519PrivateKey.from_private_bytes(seed)
 
+# 日志后台批量写入，按日期写入 trades_YYYYMMDD.log
+LOG_WRITER = LogWriter(lambda: os.path.join(CONFIG["data_dir"], f"trades_{datetime.now().strftime('%Y%m%d')}.log"))
+
 # ========== 专业工具函数 ==========
 def log(msg, level="INFO"):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_line = f"[{timestamp}] [{level}] {msg}"
     print(log_line)
-    log_file = os.path.join(CONFIG["data_dir"], f"trades_{datetime.now().strftime('%Y%m%d')}.log")
-    with open(log_file, "a") as f:
-        f.write(log_line + "\n")
+    LOG_WRITER.write(log_line)
+
+# 共享交易所客户端 (缓存时钟偏移 + keep-alive连接池)
+CLIENT = ExchangeClient(CONFIG["api_key"], ed25519_signer(PRIVATE_KEY),
+                        time_url="https://api.binance.com/api/v3/time", logger=log)
 
 def get_server_time():
-    """获取币安服务器时间"""
-    try:
-        req = urllib.request.Request("https://api.binance.com/api/v3/time")
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            return json.loads(resp.read().decode())['serverTime']
-    except:
-        return int(time.time() * 1000)
+    """获取币安服务器时间 (本地时钟 + 缓存的偏移量)"""
+    return CLIENT.server_time()
 
 def make_request(endpoint, params=None, base_url="https://fapi.binance.com"):
     """发送GET请求"""
-    server_time = get_server_time()
-    
-    if params is None:
-        params = {}
-    params['timestamp'] = server_time
-    
-    # 构建query string
-    query_string = '&'.join([f"{k}={v}" for k, v in params.items()])
-    
-    # Ed25519签名
-    signature = PRIVATE_KEY.sign(query_string.encode('utf-8'))
-    sig_b64 = base64.b64encode(signature).decode('utf-8')
-    
-    url = f"{base_url}{endpoint}?{query_string}&signature={sig_b64}"
-    
-    req = urllib.request.Request(url, headers={'X-MBX-APIKEY': CONFIG["api_key"]})
-    
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return json.loads(resp.read().decode())
-    except urllib.error.HTTPError as e:
-        err_body = e.read().decode()
-        try:
-            err_json = json.loads(err_body)
-            log(f"API错误: {err_json.get('code')} - {err_json.get('msg')}", "ERROR")
-            return err_json
-        except:
-            return {"error": err_body[:200]}
-    except Exception as e:
-        log(f"请求错误: {e}", "ERROR")
-        return {"error": str(e)}
+    return CLIENT.get(endpoint, params, base_url=base_url)
 
 def make_post_request(endpoint, params, base_url="https://fapi.binance.com"):
     """发送POST请求"""
-    server_time = get_server_time()
-    
-    params['timestamp'] = server_time
-    query_string = '&'.join([f"{k}={v}" for k, v in params.items()])
-    
-    # Ed25519签名
-    signature = PRIVATE_KEY.sign(query_string.encode('utf-8'))
-    sig_b64 = base64.b64encode(signature).decode('utf-8')
-    
-    url = f"{base_url}{endpoint}"
-    data = f"{query_string}&signature={sig_b64}"
-    
-    req = urllib.request.Request(url, data=data.encode('utf-8'), headers={
-        'X-MBX-APIKEY': CONFIG["api_key"],
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }, method='POST')
-    
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return json.loads(resp.read().decode())
-    except urllib.error.HTTPError as e:
-        err_body = e.read().decode()
-        try:
-            err_json = json.loads(err_body)
-            log(f"API错误: {err_json.get('code')} - {err_json.get('msg')}", "ERROR")
-            return err_json
-        except:
-            return {"error": err_body[:200]}
-    except Exception as e:
-        log(f"请求错误: {e}", "ERROR")
-        return {"error": str(e)}
+    return CLIENT.post(endpoint, params, base_url=base_url)
 
 # ========== 专业技术指标 ==========
 class TechnicalAnalysis:
@@ -271,6 +214,12 @@ class ProTradingBot:
         self.last_trade_time = 0
         self.cooldown_until = 0
         self.total_trades = 0
+        # 增量指标: 每根新K线O(1)更新，不再每次重算整段历史
+        self.indicators = IndicatorEngine(
+            sma_periods=(20, 50), ema_periods=(), rsi_period=14,
+            atr_period=14, adx_period=14, bb_period=20, bb_std=2, volume_period=20
+        )
+        self.feed = None  # WebSocket行情 (run()中启动)
         
     def fetch_klines(self, symbol, interval="1m", limit=100):
         """获取K线数据"""
@@ -284,41 +233,58 @@ class ProTradingBot:
             return result
         return []
     
+    def start_market_feed(self):
+        """启动WebSocket行情订阅"""
+        if not CONFIG.get("use_websocket") or not WEBSOCKETS_AVAILABLE:
+            log("⚠️ WebSocket行情未启用，使用REST轮询", "WARN")
+            return
+        self.feed = MarketDataFeed(CONFIG["symbols"], "1m", buffer_size=500,
+                                   rest_client=CLIENT, logger=log)
+        self.feed.start()
+        if self.feed.wait_ready(15):
+            log(f"📡 WebSocket行情已连接: {', '.join(CONFIG['symbols'])}")
+        else:
+            log("⚠️ WebSocket行情连接超时，暂用REST轮询", "WARN")
+    
     def update_market_data(self):
         """更新市场数据"""
+        use_feed = self.feed is not None and not self.feed.is_stale(CONFIG["check_interval"])
         for symbol in CONFIG["symbols"]:
-            klines = self.fetch_klines(symbol, "1m", 100)
+            if use_feed:
+                klines = self.feed.get_klines(symbol, 100)
+            else:
+                klines = self.fetch_klines(symbol, "1m", 100)
             if klines:
                 self.price_data[symbol]["prices"] = [float(k[4]) for k in klines]  # 收盘价
                 self.price_data[symbol]["highs"] = [float(k[2]) for k in klines]  # 最高价
                 self.price_data[symbol]["lows"] = [float(k[3]) for k in klines]   # 最低价
                 self.price_data[symbol]["volumes"] = [float(k[5]) for k in klines]  # 成交量
+                # 只提交新收盘的K线，最后一根未收盘K线作为临时状态
+                self.indicators.update_klines(symbol, klines, last_is_open=True)
     
     def analyze_symbol(self, symbol):
         """专业技术分析"""
         data = self.price_data[symbol]
         prices = data["prices"]
-        highs = data["highs"]
-        lows = data["lows"]
         volumes = data["volumes"]
         
         # 降低数据要求，20根K线即可分析
         if len(prices) < 20:
             return None
         
-        ta = TechnicalAnalysis()
+        ind = self.indicators.get(symbol)
         
         # 计算指标
         current_price = prices[-1]
-        sma_20 = ta.calculate_sma(prices, 20)
-        sma_50 = ta.calculate_sma(prices, 50)
-        rsi = ta.calculate_rsi(prices, 14)
-        atr = ta.calculate_atr(highs, lows, prices, 14)
-        adx = ta.calculate_adx(highs, lows, prices, 14)
-        bb_upper, bb_middle, bb_lower = ta.calculate_bollinger_bands(prices, 20, 2)
+        sma_20 = ind.sma_value(20)
+        sma_50 = ind.sma_value(50)
+        rsi = ind.rsi()
+        atr = ind.atr()
+        adx = ind.adx()
+        bb_upper, bb_middle, bb_lower = ind.bollinger_bands()
         
         # 成交量分析
-        vol_sma = ta.calculate_sma(volumes, 20) if len(volumes) >= 20 else sum(volumes) / len(volumes)
+        vol_sma = ind.volume_sma()
         current_vol = volumes[-1]
         volume_spike = current_vol > vol_sma * 1.5 if vol_sma else False
         
@@ -687,6 +653,8 @@ class ProTradingBot:
         log("⚠️ 警告: 激进策略，高风险高收益！")
         log("="*60)
         
+        self.start_market_feed()
+        
         while True:
             try:
                 # 冷却检查
@@ -754,5 +722,6 @@ class ProTradingBot:
 
 # ========== 启动 ==========
 if __name__ == "__main__":
+    CLIENT.start_time_sync()
     bot = ProTradingBot()
     bot.run()
@@ -5,18 +5,21 @@
 """
 
 import os
+import sys
 import json
 import csv
 import base64
-import hmac
-import hashlib
 import time
 from datetime import datetime, timedelta
-from flask import Flask, render_template, jsonify
+import hashlib
+from flask import Flask, render_template, request, Response, stream_with_context
 from flask_cors import CORS
-import urllib.request
 import threading
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from exchange_client import ExchangeClient, hmac_signer
+from trade_log import LogFollower
+
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
 
@@ -40,6 +43,9 @@ if os.path.exists(config_file):
     except Exception as e:
         print(f"[WARN] 读取配置文件失败: {e}")
 
+# 共享交易所客户端 (缓存时钟偏移 + keep-alive连接池)
+CLIENT = ExchangeClient(CONFIG["api_key"], hmac_signer(CONFIG["api_secret"]))
+
 # 缓存数据
 cache = {
     "account": None,
@@ -47,9 +53,19 @@ cache = {
     "price": None,
     "price_history": [],
     "trades": [],
+    "history_seq": 0,
     "last_update": 0
 }
 
+# 只读快照: 请求路径只读这里，不触发交易所调用
+snapshot = {"version": 0, "etag": None, "body": None, "data": None}
+snapshot_cond = threading.Condition()
+_updater_started = False
+_updater_lock = threading.Lock()
+
+# 日志跟随器: 按路径缓存，每次只读取新增内容
+log_followers = {}
+
 # ========== API函数 ==========
 def make_request(endpoint, params=None, base_url="https://fapi.binance.com", use_sign=True):
     """发送带签名的API请求 (HMAC SHA256)"""
@@ -58,51 +74,24 @@ def make_request(endpoint, params=None, base_url="https://fapi.binance.com", use
     if use_sign and (not CONFIG["api_key"] or not CONFIG["api_secret"]):
         return {"error": "API key or secret not configured"}
     
-    try:
-        with urllib.request.urlopen("https://fapi.binance.com/fapi/v1/time", timeout=10) as resp:
-            server_time = json.loads(resp.read().decode())['serverTime']
-    except:
-        server_time = int(time.time() * 1000)
-    
-    if params is None:
-        params = {}
-    
-    if use_sign:
-        params['timestamp'] = server_time
-        
-        # HMAC SHA256 签名
-        payload = '&'.join([f"{k}={v}" for k, v in params.items()])
-        signature = hmac.new(
-            CONFIG["api_secret"].encode('utf-8'),
-            payload.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        
-        url = f"{base_url}{endpoint}?{payload}&signature={signature}"
-        headers = {'X-MBX-APIKEY': CONFIG["api_key"]}
-    else:
-        # 公共 API 不需要签名
-        if params:
-            url = f"{base_url}{endpoint}?" + '&'.join([f"{k}={v}" for k, v in params.items()])
-        else:
-            url = f"{base_url}{endpoint}"
-        headers = {}
-    
-    req = urllib.request.Request(url, headers=headers)
-    
-    try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return json.loads(resp.read().decode())
-    except urllib.error.HTTPError as e:
-        try:
-            err = json.loads(e.read().decode())
-            return {"code": err.get('code'), "msg": err.get('msg'), "error": True}
-        except:
-            return {"code": e.code, "msg": str(e.reason), "error": True}
-    except Exception as e:
-        return {"error": str(e)}
+    return CLIENT.request("GET", endpoint, params, signed=use_sign, base_url=base_url)
 
 # ========== 数据更新 ==========
+def read_trades(keep=20):
+    """最近的交易日志，优先当天 trades_YYYYMMDD.log，其次其他监控日志"""
+    today = datetime.now().strftime('%Y%m%d')
+    candidates = [f"trades_{today}.log", 'LIVE_MONITOR.log', 'FIXED_MONITOR.log', 'ACTIVE_TRADING.log']
+    for log_name in candidates:
+        log_file = os.path.join(CONFIG["data_dir"], log_name)
+        if os.path.exists(log_file):
+            if log_file not in log_followers:
+                # 换日后旧日志不再需要跟随
+                for path in [p for p in log_followers if os.path.basename(p).startswith("trades_")]:
+                    del log_followers[path]
+                log_followers[log_file] = LogFollower(log_file, keep=keep)
+            return log_followers[log_file].tail()
+    return cache["trades"]
+
 def update_data():
     """更新缓存数据"""
     try:
@@ -125,7 +114,9 @@ def update_data():
         result = make_request("/fapi/v1/ticker/price", {"symbol": CONFIG["symbol"]}, use_sign=False)
         if 'price' in result:
             cache["price"] = float(result['price'])
+            cache["history_seq"] += 1
             cache["price_history"].append({
+                "seq": cache["history_seq"],
                 "time": datetime.now().strftime("%H:%M:%S"),
                 "price": cache["price"]
             })
@@ -133,51 +124,23 @@ def update_data():
             if len(cache["price_history"]) > 100:
                 cache["price_history"] = cache["price_history"][-100:]
         
-        # 读取交易日志
-        today = datetime.now().strftime('%Y%m%d')
-        log_file = os.path.join(CONFIG["data_dir"], f"trades_{today}.log")
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                lines = f.readlines()
-                cache["trades"] = lines[-20:]  # 最近20条日志
-        else:
-            # 尝试读取其他日志文件
-            for log_name in ['LIVE_MONITOR.log', 'FIXED_MONITOR.log', 'ACTIVE_TRADING.log']:
-                alt_log = os.path.join(CONFIG["data_dir"], log_name)
-                if os.path.exists(alt_log):
-                    with open(alt_log, 'r') as f:
-                        lines = f.readlines()
-                        cache["trades"] = lines[-20:]
-                    break
+        # 读取交易日志 (只读新增字节)
+        cache["trades"] = read_trades()
         
         cache["last_update"] = time.time()
         
     except Exception as e:
         print(f"[ERROR] 更新数据失败: {e}")
 
-def background_updater():
-    """后台数据更新线程"""
-    while True:
-        update_data()
-        time.sleep(CONFIG["refresh_interval"])
-
-# ========== 路由 ==========
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/api/status')
-def get_status():
-    """获取当前状态"""
-    update_data()  # 强制更新
-    
+def build_status():
+    """由缓存生成 /api/status 数据"""
     data = {
-        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "timestamp": datetime.fromtimestamp(cache["last_update"] or time.time()).strftime('%Y-%m-%d %H:%M:%S'),
         "account": None,
         "position": cache["position"],
         "price": cache["price"],
-        "price_history": cache["price_history"],
-        "trades": cache["trades"]
+        "price_history": list(cache["price_history"]),
+        "trades": list(cache["trades"])
     }
     
     if cache["account"] and 'totalWalletBalance' in cache["account"]:
@@ -194,13 +157,105 @@ def get_status():
             "available": float(cache["account"]['availableBalance']),
             "unrealized": float(cache["account"]['totalUnrealizedProfit'])
         }
+    return data
+
+def publish_snapshot():
+    """生成新快照，内容有变化时版本号+1并唤醒推送连接"""
+    data = build_status()
+    content = {k: v for k, v in data.items() if k != "timestamp"}
+    etag = hashlib.md5(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+    with snapshot_cond:
+        if etag == snapshot["etag"]:
+            return
+        snapshot["version"] += 1
+        snapshot["etag"] = etag
+        snapshot["data"] = data
+        snapshot["body"] = json.dumps(data, default=str)
+        snapshot_cond.notify_all()
+
+def background_updater():
+    """后台数据更新线程 (唯一调用交易所的地方)；首次数据已由 ensure_updater 同步加载，先等一个周期"""
+    while True:
+        time.sleep(CONFIG["refresh_interval"])
+        update_data()
+        publish_snapshot()
+
+def ensure_updater():
+    """确保后台更新线程已启动，首次请求时同步加载一次"""
+    global _updater_started
+    with _updater_lock:
+        if _updater_started:
+            return
+        _updater_started = True
+        update_data()
+        publish_snapshot()
+        threading.Thread(target=background_updater, daemon=True).start()
+
+def _etag_response(body, etag):
+    if request.if_none_match and etag in request.if_none_match:
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+    return Response(body, mimetype="application/json", headers={
+        "ETag": f'"{etag}"',
+        "Cache-Control": "no-cache"
+    })
+
+# ========== 路由 ==========
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/api/status')
+def get_status():
+    """获取当前状态 (直接返回快照)"""
+    ensure_updater()
+    with snapshot_cond:
+        body, etag = snapshot["body"], snapshot["etag"]
+    return _etag_response(body, etag)
+
+@app.route('/api/stream')
+def stream_status():
+    """Server-Sent Events: 快照版本变化时推送完整状态"""
+    ensure_updater()
+    try:
+        last_version = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        last_version = 0
+    
+    def events():
+        version = last_version
+        yield "retry: 3000\n\n"
+        while True:
+            with snapshot_cond:
+                snapshot_cond.wait_for(lambda: snapshot["version"] != version, timeout=15)
+                if snapshot["version"] == version:
+                    body = None
+                else:
+                    version, body = snapshot["version"], snapshot["body"]
+            if body is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"id: {version}\nevent: status\ndata: {body}\n\n"
     
-    return jsonify(data)
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 @app.route('/api/history')
 def get_history():
-    """获取价格历史"""
-    return jsonify(cache["price_history"])
+    """获取价格历史
+
+    ?since=<seq> 只返回该序号之后的价格点 (增量)，否则返回完整列表
+    """
+    ensure_updater()
+    with snapshot_cond:
+        history = list(snapshot["data"]["price_history"]) if snapshot["data"] else []
+    last_seq = history[-1]["seq"] if history else 0
+    since = request.args.get("since", type=int)
+    if since is None:
+        return _etag_response(json.dumps(history), f"h{last_seq}")
+    points = [p for p in history if p["seq"] > since]
+    return _etag_response(json.dumps({"seq": last_seq, "points": points}), f"h{since}-{last_seq}")
 
 # ========== 启动 ==========
 if __name__ == '__main__':
@@ -208,17 +263,14 @@ if __name__ == '__main__':
     print("🚀 交易监控仪表盘启动中...")
     print("="*50)
     
-    # 启动后台更新线程
-    updater_thread = threading.Thread(target=background_updater, daemon=True)
-    updater_thread.start()
-    
-    # 初始数据加载
-    update_data()
+    # 后台校时 + 初始数据加载 + 启动后台更新线程
+    CLIENT.start_time_sync()
+    ensure_updater()
     
     print("📊 监控地址: http://localhost:8080")
     print("📈 API地址: http://localhost:8080/api/status")
     print("⏱️  刷新间隔: 5秒")
     print("="*50)
     
-    # 启动Flask
-    app.run(host='0.0.0.0', port=18080, debug=False, use_reloader=False)
+    # 启动Flask (多线程: SSE长连接不阻塞其他请求)
+    app.run(host='0.0.0.0', port=18080, debug=False, use_reloader=False, threaded=True)
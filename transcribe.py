@@ -2,14 +2,16 @@
 """
 语音转录工具 - 使用 OpenAI Whisper 转录语音消息为文字
 支持 .ogg 格式，针对中文语音识别优化
+模型常驻在 whisper_service 中，先运行 python3 whisper_service.py serve 可让多次调用共用已加载的模型
 """
 
 import sys
 import os
-import whisper
 import tempfile
 import subprocess
 
+from whisper_service import transcribe as service_transcribe
+
 # 默认模型，small 支持中文且速度适中
 DEFAULT_MODEL = "small"
 
@@ -41,19 +43,9 @@ def transcribe_audio(file_path, model_size=DEFAULT_MODEL, language="zh"):
         print("警告: ffmpeg 未安装。正在尝试安装...")
         install_ffmpeg()
     
-    # 加载模型
-    print(f"正在加载 Whisper 模型: {model_size}...")
-    model = whisper.load_model(model_size)
-    
-    # 转录音频
-    print(f"正在转录音频: {file_path}")
-    result = model.transcribe(
-        file_path,
-        language=language,
-        task="transcribe"
-    )
-    
-    return result["text"].strip()
+    # 转录音频 (模型常驻，不再每次加载)
+    print(f"正在转录音频: {file_path} (模型: {model_size})")
+    return service_transcribe(file_path, model_size, language)
 
 def install_ffmpeg():
     """尝试安装 ffmpeg"""
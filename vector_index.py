@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+本地向量索引 - 记忆语义召回
+- 默认用哈希 n-gram 向量 (中文单字/双字/三字 + 英文词和字符三元组)，纯 CPU、离线、无模型文件
+- 装了 sentence-transformers 时可以换成本地 CPU 嵌入模型
+- 向量矩阵按 float32 或 int8 (逐行缩放) 追加写入文件，查询时 np.memmap 映射，分块矩阵乘求 top-k
+- 混合打分: alpha * 余弦相似度 + (1 - alpha) * 归一化 BM25，同义改写和精确关键词都能召回
+- 删除/覆盖只追加标记；失效行占比超过 COMPACT_DEAD_RATIO 时 maybe_compact() 重写有效行回收空间
+- directory=None 时只在内存中工作
+"""
+
+import os
+import json
+import math
+import zlib
+import threading
+from array import array
+
+import numpy as np
+
+from sop_search import tokenize
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+SEARCH_BLOCK_ROWS = 4096
+COMPACT_DEAD_RATIO = 0.3     # 失效行占比超过该值时压缩
+COMPACT_MIN_DEAD = 1000      # 失效行太少时不值得重写
+_DATA_FILES = ("vectors.bin", "scales.bin", "items.jsonl")
+
+
+# ========== 向量化 ==========
+def _features(text):
+    """哈希向量的特征: 检索分词 + 中文三字 + 英文字符三元组"""
+    features = tokenize(text)
+    lowered = (text or "").lower()
+    run = []
+    for ch in lowered + " ":
+        if "㐀" <= ch <= "鿿":
+            run.append(ch)
+            continue
+        if len(run) >= 3:
+            features.extend("".join(run[i:i + 3]) for i in range(len(run) - 2))
+        run = []
+    for word in lowered.split():
+        if word.isascii() and len(word) > 3:
+            padded = f"<{word}>"
+            features.extend("#" + padded[i:i + 3] for i in range(len(padded) - 2))
+    return features
+
+
+class HashedNgramEmbedder:
+    """特征哈希到 dim 维 (带符号，减少碰撞偏差)，对数词频后 L2 归一化"""
+
+    name = "hashed-ngram"
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def embed(self, texts):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for feature in _features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                slot = (h >> 1) % self.dim
+                counts[slot] = counts.get(slot, 0.0) + (1.0 if h & 1 else -1.0)
+            if counts:
+                slots = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+                values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+                out[row, slots] = np.sign(values) * np.log1p(np.abs(values))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    """本地 CPU 嵌入模型 (需要 pip install sentence-transformers 并提前下载模型)"""
+
+    def __init__(self, model_name="paraphrase-multilingual-MiniLM-L12-v2"):
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            raise ImportError("sentence-transformers 未安装")
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def embed(self, texts):
+        return self.model.encode(list(texts), batch_size=64, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+
+# ========== 索引 ==========
+class VectorIndex:
+    """
+    index = VectorIndex("data/memory_vectors", dtype="int8")
+    index.add_many([("note:1", "文本", {"tier": "long_term"}), ...])
+    index.search("查询", k=5) -> [{"key", "text", "meta", "score", "vector_score", "bm25"}, ...]
+    """
+
+    def __init__(self, directory=None, embedder=None, dtype="float32", alpha=0.6):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"不支持的 dtype: {dtype}")
+        self.directory = directory
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.dim = self.embedder.dim
+        self.dtype = dtype
+        self.alpha = alpha
+        self._lock = threading.RLock()
+        self._reset_rows()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+        else:
+            # 内存模式: 预留容量，满了翻倍
+            self._vectors = np.zeros((64, self.dim), dtype=np.float32 if dtype == "float32" else np.int8)
+            self._mem_scales = np.zeros(64, dtype=np.float32)
+
+    def _reset_rows(self):
+        self.keys = []           # 行号 -> key
+        self.texts = []
+        self.metas = []
+        self.rows = {}           # key -> 行号 (只含有效行)
+        self._alive = bytearray()        # 行号 -> 是否有效
+        self._doc_len = array("f")       # 行号 -> BM25 文档长度
+        # BM25: term -> ([行号], [词频])，查询时转成数组
+        self.postings = {}
+        self._posting_arrays = {}
+
+        self._matrix = None      # 内存模式或 memmap
+        self._scales = None
+        self._mapped_rows = 0
+
+    # ========== 持久化 ==========
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _finish_compact(self):
+        """压缩写完 (有 compact.done 标记) 就把新文件换上去，否则丢弃写了一半的新文件"""
+        done = os.path.exists(self._path("compact.done"))
+        for name in _DATA_FILES:
+            tmp = self._path(name + ".compact")
+            if os.path.exists(tmp):
+                if done:
+                    os.replace(tmp, self._path(name))
+                else:
+                    os.remove(tmp)
+        if done:
+            os.remove(self._path("compact.done"))
+
+    def _load(self):
+        self._finish_compact()
+        info_path = self._path("index.json")
+        info = {"dim": self.dim, "dtype": self.dtype, "embedder": self.embedder.name}
+        if os.path.exists(info_path):
+            with open(info_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored != info:
+                raise ValueError(f"向量索引参数不一致: 已有 {stored}，当前 {info}")
+        else:
+            with open(info_path, "w", encoding="utf-8") as f:
+                json.dump(info, f)
+            for name in ("vectors.bin", "scales.bin", "items.jsonl"):
+                open(self._path(name), "wb").close()
+
+        itemsize = self.dim * (4 if self.dtype == "float32" else 1)
+        n_vectors = os.path.getsize(self._path("vectors.bin")) // itemsize
+        if self.dtype == "int8":
+            n_vectors = min(n_vectors, os.path.getsize(self._path("scales.bin")) // 4)
+        # 逐行重放条目；写了一半的尾行或没有对应向量的条目之后的内容截掉
+        valid = 0
+        with open(self._path("items.jsonl"), "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if entry.get("op") == "delete":
+                    self._delete_row(entry["key"])
+                elif len(self.keys) < n_vectors:
+                    self._append_row(entry["key"], entry["text"], entry.get("meta") or {})
+                else:
+                    break
+                valid += len(line)
+        with open(self._path("items.jsonl"), "r+b") as f:
+            f.truncate(valid)
+        self._truncate(len(self.keys))
+        self.maybe_compact()
+
+    def _truncate(self, n):
+        itemsize = self.dim * (4 if self.dtype == "float32" else 1)
+        with open(self._path("vectors.bin"), "r+b") as f:
+            f.truncate(n * itemsize)
+        if self.dtype == "int8":
+            with open(self._path("scales.bin"), "r+b") as f:
+                f.truncate(n * 4)
+
+    def _mapped(self):
+        """当前全部向量 (文件模式下行数增长时重新映射)"""
+        n = len(self.keys)
+        if not self.directory:
+            return self._vectors[:n], (self._mem_scales[:n] if self.dtype == "int8" else None)
+        if self._matrix is None or self._mapped_rows != n:
+            if n == 0:
+                self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+                self._scales = np.zeros(0, dtype=np.float32)
+            else:
+                dtype = np.float32 if self.dtype == "float32" else np.int8
+                self._matrix = np.memmap(self._path("vectors.bin"), dtype=dtype, mode="r", shape=(n, self.dim))
+                if self.dtype == "int8":
+                    self._scales = np.memmap(self._path("scales.bin"), dtype=np.float32, mode="r", shape=(n,))
+            self._mapped_rows = n
+        return self._matrix, (self._scales if self.dtype == "int8" else None)
+
+    # ========== 写入 ==========
+    def _append_row(self, key, text, meta):
+        if key in self.rows:
+            self._delete_row(key)
+        row = len(self.keys)
+        self.keys.append(key)
+        self.texts.append(text)
+        self.metas.append(meta)
+        self.rows[key] = row
+        self._alive.append(1)
+        terms = tokenize(text)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            rows, tfs = self.postings.setdefault(term, ([], []))
+            rows.append(row)
+            tfs.append(tf)
+            self._posting_arrays.pop(term, None)
+        self._doc_len.append(len(terms))
+
+    def _delete_row(self, key):
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self._alive[row] = 0
+        return row is not None
+
+    def _quantize(self, vectors):
+        if self.dtype == "float32":
+            return vectors.astype(np.float32), None
+        peak = np.maximum(np.abs(vectors).max(axis=1), 1e-12)
+        q = np.round(vectors / peak[:, None] * 127).astype(np.int8)
+        return q, (peak / 127).astype(np.float32)
+
+    def add(self, key, text, meta=None):
+        self.add_many([(key, text, meta)])
+
+    def add_many(self, items):
+        """批量添加 [(key, text, meta)]，同 key 覆盖旧条目"""
+        items = [(key, text, meta or {}) for key, text, meta in items]
+        if not items:
+            return
+        vectors, scales = self._quantize(self.embedder.embed([text for _, text, _ in items]))
+        with self._lock:
+            if self.directory:
+                # 先写向量再写条目；条目是提交点
+                with open(self._path("vectors.bin"), "ab") as f:
+                    f.write(vectors.tobytes())
+                if scales is not None:
+                    with open(self._path("scales.bin"), "ab") as f:
+                        f.write(scales.tobytes())
+                with open(self._path("items.jsonl"), "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps({"key": k, "text": t, "meta": m}, ensure_ascii=False) + "\n"
+                                    for k, t, m in items))
+            else:
+                n, need = len(self.keys), len(self.keys) + len(items)
+                if need > len(self._vectors):
+                    capacity = max(need, len(self._vectors) * 2)
+                    grown = np.zeros((capacity, self.dim), dtype=self._vectors.dtype)
+                    grown[:n] = self._vectors[:n]
+                    self._vectors = grown
+                    grown_scales = np.zeros(capacity, dtype=np.float32)
+                    grown_scales[:n] = self._mem_scales[:n]
+                    self._mem_scales = grown_scales
+                self._vectors[n:need] = vectors
+                if scales is not None:
+                    self._mem_scales[n:need] = scales
+            for key, text, meta in items:
+                self._append_row(key, text, meta)
+
+    def remove(self, key):
+        with self._lock:
+            if self._delete_row(key) and self.directory:
+                with open(self._path("items.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"op": "delete", "key": key}, ensure_ascii=False) + "\n")
+
+    # ========== 压缩 ==========
+    def maybe_compact(self, dead_ratio=COMPACT_DEAD_RATIO, min_dead=COMPACT_MIN_DEAD):
+        """失效行 (删除/被覆盖) 足够多时压缩，返回回收的行数"""
+        with self._lock:
+            dead = len(self.keys) - len(self.rows)
+            if dead < min_dead or dead < len(self.keys) * dead_ratio:
+                return 0
+            return self.compact()
+
+    def compact(self):
+        """只保留有效行重写向量和条目文件 (行号随之重排)，返回回收的行数"""
+        with self._lock:
+            dead = len(self.keys) - len(self.rows)
+            if not dead:
+                return 0
+            live = np.flatnonzero(np.frombuffer(bytes(self._alive), dtype=bool))
+            matrix, scales = self._mapped()
+            vectors = np.array(matrix[live])
+            scales = np.array(scales[live]) if scales is not None else None
+            items = [(self.keys[row], self.texts[row], self.metas[row]) for row in live]
+            if self.directory:
+                # 新文件全部写完再落标记；标记之后中断的替换由下次 _load 补完
+                with open(self._path("vectors.bin.compact"), "wb") as f:
+                    f.write(vectors.tobytes())
+                with open(self._path("scales.bin.compact"), "wb") as f:
+                    if scales is not None:
+                        f.write(scales.tobytes())
+                with open(self._path("items.jsonl.compact"), "w", encoding="utf-8") as f:
+                    f.write("".join(json.dumps({"key": k, "text": t, "meta": m}, ensure_ascii=False) + "\n"
+                                    for k, t, m in items))
+                open(self._path("compact.done"), "wb").close()
+                self._finish_compact()
+            else:
+                capacity = max(64, len(items))
+                self._vectors = np.zeros((capacity, self.dim), dtype=vectors.dtype)
+                self._vectors[:len(items)] = vectors
+                self._mem_scales = np.zeros(capacity, dtype=np.float32)
+                if scales is not None:
+                    self._mem_scales[:len(items)] = scales
+            self._reset_rows()
+            for key, text, meta in items:
+                self._append_row(key, text, meta)
+            return dead
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    # ========== 查询 ==========
+    def _vector_scores(self, query_vec):
+        matrix, scales = self._mapped()
+        out = np.empty(len(matrix), dtype=np.float32)
+        # int8: 哈希向量的查询很稀疏，只取非零列再转 float32；float32 直接整块相乘 (受内存带宽限制)
+        nz = np.flatnonzero(query_vec)
+        sparse = scales is not None and len(nz) < self.dim // 4
+        q = query_vec[nz] if sparse else query_vec
+        for start in range(0, len(matrix), SEARCH_BLOCK_ROWS):
+            block = matrix[start:start + SEARCH_BLOCK_ROWS]
+            block = np.take(block, nz, axis=1) if sparse else block
+            out[start:start + len(block)] = block.astype(np.float32, copy=False) @ q
+        if scales is not None:
+            out *= scales
+        return out
+
+    def _bm25_scores(self, query, alive):
+        n = len(self.keys)
+        scores = np.zeros(n, dtype=np.float32)
+        live = len(self.rows)
+        if not live:
+            return scores
+        doc_len = np.frombuffer(self._doc_len, dtype=np.float32, count=n)
+        avg = float(doc_len[alive].mean()) or 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avg)
+        for term in set(tokenize(query, query=True)):
+            if term not in self.postings:
+                continue
+            arrays = self._posting_arrays.get(term)
+            if arrays is None:
+                rows, tfs = self.postings[term]
+                arrays = (np.asarray(rows, dtype=np.int64), np.asarray(tfs, dtype=np.float32))
+                self._posting_arrays[term] = arrays
+            rows, tfs = arrays
+            df = int(alive[rows].sum())
+            if not df:
+                continue
+            idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tfs * (BM25_K1 + 1) / (tfs + norm[rows])
+        return scores
+
+    def search(self, query, k=5, alpha=None, min_score=0.0, where=None):
+        """
+        混合检索 top-k
+        alpha=1 只用向量，alpha=0 只用 BM25；where(meta) 返回 False 的条目被过滤
+        """
+        alpha = self.alpha if alpha is None else alpha
+        with self._lock:
+            if not self.rows:
+                return []
+            alive = np.frombuffer(bytes(self._alive), dtype=bool)
+            query_vec = self.embedder.embed([query])[0]
+            vec = self._vector_scores(query_vec) if alpha > 0 else np.zeros(len(self.keys), dtype=np.float32)
+            bm25 = self._bm25_scores(query, alive) if alpha < 1 else np.zeros(len(self.keys), dtype=np.float32)
+            peak = float(bm25.max()) if len(bm25) else 0.0
+            combined = alpha * vec + (1 - alpha) * (bm25 / peak if peak > 0 else bm25)
+            combined[~alive] = -np.inf
+            if where is not None:
+                for row in np.flatnonzero(alive):
+                    if not where(self.metas[row]):
+                        combined[row] = -np.inf
+
+            k = min(k, len(self.rows))
+            top = np.argpartition(-combined, k - 1)[:k] if k < len(combined) else np.arange(len(combined))
+            top = top[np.argsort(-combined[top], kind="stable")]
+            results = []
+            for row in top:
+                score = float(combined[row])
+                if score == -np.inf or score < min_score:
+                    continue
+                results.append({
+                    "key": self.keys[row],
+                    "text": self.texts[row],
+                    "meta": self.metas[row],
+                    "score": round(score, 4),
+                    "vector_score": round(float(vec[row]), 4),
+                    "bm25": round(float(bm25[row]), 4)
+                })
+            return results
+
+
+if __name__ == "__main__":
+    import time
+    import random
+    import shutil
+    import tempfile
+
+    print("=== 召回 ===")
+    index = VectorIndex()
+    index.add_many([
+        ("m1", "用户每天早上喜欢喝美式咖啡", None),
+        ("m2", "部署脚本在服务器上用 systemd 管理，重启命令是 systemctl restart bot", None),
+        ("m3", "小红书笔记发布时间最好在晚上八点到十点之间", None),
+        ("m4", "BTC 止损比例设为 3%，仓位不超过总资金的两成", None),
+        ("m5", "张三的生日是五月二十号，记得提前买礼物", None),
+    ])
+    for query in ["咖啡偏好", "怎么重启交易机器人服务", "小红书什么时候发笔记", "止损设置多少", "张三生日"]:
+        top = index.search(query, k=1)[0]
+        print(f"{query} -> {top['key']} ({top['score']:.3f}) {top['text'][:20]}")
+
+    print("=== 规模 ===")
+    directory = tempfile.mkdtemp()
+    words = ["行情", "部署", "飞书", "小红书", "语音", "回测", "告警", "咖啡", "生日", "止损", "仓位", "日报",
+             "Python", "SQLite", "agent", "server", "deploy", "memory", "prompt", "cache"]
+    rnd = random.Random(0)
+    texts = [" ".join(rnd.sample(words, 6)) + f" 事项{i}" for i in range(100000)]
+    for dtype in ("float32", "int8"):
+        path = os.path.join(directory, dtype)
+        index = VectorIndex(path, dtype=dtype)
+        start = time.perf_counter()
+        for i in range(0, len(texts), 5000):
+            index.add_many([(f"k{j}", texts[j], None) for j in range(i, min(i + 5000, len(texts)))])
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        reopened = VectorIndex(path, dtype=dtype)
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(20):
+            reopened.search("小红书 部署 告警", k=5)
+        size = os.path.getsize(os.path.join(path, "vectors.bin")) / 1024 / 1024
+        print(f"{dtype}: 10 万条 写入 {build:.1f}s, 加载 {load:.1f}s, 向量文件 {size:.0f}MB, "
+              f"top-5 查询 {(time.perf_counter() - start) / 20 * 1000:.1f}ms")
+        # 删掉一半 (如工作记忆过期) 后压缩
+        for j in range(0, len(texts), 2):
+            reopened.remove(f"k{j}")
+        start = time.perf_counter()
+        reclaimed = reopened.maybe_compact()
+        compact = time.perf_counter() - start
+        start = time.perf_counter()
+        VectorIndex(path, dtype=dtype)
+        size = os.path.getsize(os.path.join(path, "vectors.bin")) / 1024 / 1024
+        print(f"{dtype}: 删除一半后压缩 {compact:.1f}s (回收 {reclaimed} 行), "
+              f"加载 {time.perf_counter() - start:.1f}s, 向量文件 {size:.0f}MB")
+    shutil.rmtree(directory)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+NumPy 向量化指标后端 - 批量扫描 / 回测用
+输入为二维数组 (币种 x K线) 或一维数组，一次计算出整段历史的指标序列。
+
+口径与 trading_bot_pro.TechnicalAnalysis 一致: 第 t 列的值等于把前 t+1 根K线
+传给对应批量函数的结果 (数据不足时 SMA/EMA/布林带为 NaN，RSI 为 50，ATR/ADX 为 0)。
+wilder=True 时 RSI/ATR/EMA 使用 safe_trading_bot_v2 的 Wilder 平滑口径，数据不足为 NaN。
+"""
+
+import numpy as np
+
+try:
+    from scipy.signal import lfilter
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+
+# ========== 内部工具 ==========
+def _as_2d(values):
+    arr = np.asarray(values, dtype=np.float64)
+    return (arr[np.newaxis, :], True) if arr.ndim == 1 else (arr, False)
+
+def _restore(arr, squeeze):
+    return arr[0] if squeeze else arr
+
+def _rolling_sum(x, period):
+    """沿最后一维的滚动和，前 period-1 列为 NaN
+
+    减去每行首个值后再累加，降低大数相减的精度损失
+    """
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] < period:
+        return out
+    ref = x[:, :1]
+    csum = np.cumsum(x - ref, axis=1)
+    window = csum[:, period - 1:].copy()
+    window[:, 1:] -= csum[:, :-period]
+    out[:, period - 1:] = window + ref * period
+    return out
+
+def _recursive(x, alpha, init):
+    """y[t] = y[t-1] + alpha * (x[t] - y[t-1])，y[-1] = init，逐列跨币种向量化"""
+    if SCIPY_AVAILABLE:
+        zi = ((1 - alpha) * init)[:, np.newaxis]
+        y, _ = lfilter([alpha], [1, -(1 - alpha)], x, axis=1, zi=zi)
+        return y
+    y = np.empty_like(x)
+    prev = init.astype(np.float64)
+    for t in range(x.shape[1]):
+        prev = prev + alpha * (x[:, t] - prev)
+        y[:, t] = prev
+    return y
+
+def _true_range(highs, lows, closes):
+    """TR序列，长度比K线少1"""
+    prev_close = closes[:, :-1]
+    return np.maximum.reduce([
+        highs[:, 1:] - lows[:, 1:],
+        np.abs(highs[:, 1:] - prev_close),
+        np.abs(lows[:, 1:] - prev_close),
+    ])
+
+def _shift_right(x, fill):
+    """把差分序列右移一位，对齐到K线下标"""
+    out = np.full((x.shape[0], x.shape[1] + 1), fill)
+    out[:, 1:] = x
+    return out
+
+def _wilder(x, period):
+    """Wilder平滑: 前 period 个取均值作种子，之后 alpha = 1/period"""
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] < period:
+        return out
+    seed = x[:, :period].mean(axis=1)
+    out[:, period - 1] = seed
+    if x.shape[1] > period:
+        out[:, period:] = _recursive(x[:, period:], 1.0 / period, seed)
+    return out
+
+
+# ========== 指标 ==========
+def sma(values, period):
+    """简单移动平均"""
+    x, squeeze = _as_2d(values)
+    return _restore(_rolling_sum(x, period) / period, squeeze)
+
+def ema(values, period, wilder=False):
+    """指数移动平均
+
+    wilder=False: 以第一个价格为种子 (trading_bot_pro)
+    wilder=True:  以前 period 个价格的均值为种子 (safe_trading_bot_v2)
+    """
+    x, squeeze = _as_2d(values)
+    alpha = 2 / (period + 1)
+    out = np.full(x.shape, np.nan)
+    n = x.shape[1]
+    if n >= period:
+        if wilder:
+            seed = x[:, :period].mean(axis=1)
+            out[:, period - 1] = seed
+            if n > period:
+                out[:, period:] = _recursive(x[:, period:], alpha, seed)
+        else:
+            full = np.empty_like(x)
+            full[:, 0] = x[:, 0]
+            if n > 1:
+                full[:, 1:] = _recursive(x[:, 1:], alpha, x[:, 0])
+            out[:, period - 1:] = full[:, period - 1:]
+    return _restore(out, squeeze)
+
+def rsi(closes, period=14, wilder=False):
+    """RSI相对强弱指数"""
+    x, squeeze = _as_2d(closes)
+    diff = np.diff(x, axis=1)
+    gains = np.where(diff > 0, diff, 0.0)
+    losses = np.where(diff > 0, 0.0, np.abs(diff))
+
+    if wilder:
+        avg_gain = _wilder(gains, period)
+        avg_loss = _wilder(losses, period)
+        # safe_trading_bot_v2 需要 period+1 个差分才出第一个值
+        if avg_gain.shape[1] >= period:
+            avg_gain[:, period - 1] = np.nan
+        fill = np.nan
+    else:
+        avg_gain = _rolling_sum(gains, period) / period
+        avg_loss = _rolling_sum(losses, period) / period
+        fill = 50.0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        values = 100 - 100 / (1 + rs)
+    values = np.where(avg_loss <= 0, 100.0, values)
+    values = np.where(np.isnan(avg_gain), fill, values)
+    return _restore(_shift_right(values, fill), squeeze)
+
+def atr(highs, lows, closes, period=14, wilder=False):
+    """平均真实波幅"""
+    h, squeeze = _as_2d(highs)
+    l, _ = _as_2d(lows)
+    c, _ = _as_2d(closes)
+    tr = _true_range(h, l, c)
+    if wilder:
+        values, fill = _wilder(tr, period), np.nan
+    else:
+        values, fill = _rolling_sum(tr, period) / period, 0.0
+        values = np.where(np.isnan(values), fill, values)
+    return _restore(_shift_right(values, fill), squeeze)
+
+def adx(highs, lows, closes, period=14):
+    """简化版ADX (窗口DX，trading_bot_pro 口径)"""
+    h, squeeze = _as_2d(highs)
+    l, _ = _as_2d(lows)
+    c, _ = _as_2d(closes)
+    tr = _true_range(h, l, c)
+    plus_dm = np.maximum(h[:, 1:] - h[:, :-1], 0.0)
+    minus_dm = np.maximum(l[:, :-1] - l[:, 1:], 0.0)
+
+    avg_tr = _rolling_sum(tr, period) / period
+    with np.errstate(divide="ignore", invalid="ignore"):
+        plus_di = 100 * (_rolling_sum(plus_dm, period) / period) / avg_tr
+        minus_di = 100 * (_rolling_sum(minus_dm, period) / period) / avg_tr
+        dx = 100 * np.abs(plus_di - minus_di) / (plus_di + minus_di)
+    dx = np.where((avg_tr > 0) & (plus_di + minus_di > 0), dx, 0.0)
+
+    out = _shift_right(dx, 0.0)
+    out[:, :period * 2 - 1] = 0.0
+    return _restore(out, squeeze)
+
+def bollinger_bands(closes, period=20, std_dev=2):
+    """布林带 (upper, middle, lower)"""
+    x, squeeze = _as_2d(closes)
+    middle = np.full(x.shape, np.nan)
+    std = np.full(x.shape, np.nan)
+    if x.shape[1] >= period:
+        windows = np.lib.stride_tricks.sliding_window_view(x, period, axis=1)
+        middle[:, period - 1:] = windows.mean(axis=-1)
+        std[:, period - 1:] = windows.std(axis=-1)
+    upper = middle + std_dev * std
+    lower = middle - std_dev * std
+    return _restore(upper, squeeze), _restore(middle, squeeze), _restore(lower, squeeze)
+
+
+def compute_all(highs, lows, closes, volumes=None, config=None):
+    """一次算出 ProTradingBot.analyze_symbol 需要的全部指标序列"""
+    config = config or {}
+    rsi_period = config.get("rsi_period", 14)
+    atr_period = config.get("atr_period", 14)
+    volume_period = config.get("volume_ma_period", 20)
+
+    upper, middle, lower = bollinger_bands(closes, 20, 2)
+    result = {
+        "sma_20": sma(closes, 20),
+        "sma_50": sma(closes, 50),
+        "rsi": rsi(closes, rsi_period),
+        "atr": atr(highs, lows, closes, atr_period),
+        "adx": adx(highs, lows, closes, 14),
+        "bb_upper": upper,
+        "bb_middle": middle,
+        "bb_lower": lower,
+    }
+    if volumes is not None:
+        result["volume_sma"] = sma(volumes, volume_period)
+    return result
+
+
+if __name__ == "__main__":
+    import time
+    from trading_bot_pro import TechnicalAnalysis as ProTA
+    from safe_trading_bot_v2 import TechnicalAnalysis as SafeTA
+
+    print("=== 向量化指标 vs 批量函数 ===")
+    rng = np.random.default_rng(7)
+    closes = 60000 * np.cumprod(1 + rng.normal(0, 0.002, size=(3, 300)), axis=1)
+    highs = closes * (1 + np.abs(rng.normal(0, 0.001, size=closes.shape)))
+    lows = closes * (1 - np.abs(rng.normal(0, 0.001, size=closes.shape)))
+
+    vec = compute_all(highs, lows, closes)
+    vec["ema20"] = ema(closes, 20)
+    vec["wilder_ema20"] = ema(closes, 20, wilder=True)
+    vec["wilder_rsi"] = rsi(closes, 14, wilder=True)
+    vec["wilder_atr"] = atr(highs, lows, closes, 14, wilder=True)
+
+    def none_to_nan(v):
+        return np.nan if v is None else v
+
+    mismatches = 0
+    for s in range(closes.shape[0]):
+        c, h, l = list(closes[s]), list(highs[s]), list(lows[s])
+        for t in range(closes.shape[1]):
+            cs, hs, ls = c[:t + 1], h[:t + 1], l[:t + 1]
+            bb = ProTA.calculate_bollinger_bands(cs, 20, 2)
+            safe_ema = SafeTA.calculate_ema(cs, 20)
+            expected = {
+                "sma_20": ProTA.calculate_sma(cs, 20),
+                "sma_50": ProTA.calculate_sma(cs, 50),
+                "rsi": ProTA.calculate_rsi(cs, 14),
+                "atr": ProTA.calculate_atr(hs, ls, cs, 14),
+                "adx": ProTA.calculate_adx(hs, ls, cs, 14),
+                "bb_upper": bb[0], "bb_middle": bb[1], "bb_lower": bb[2],
+                "ema20": ProTA.calculate_ema(cs, 20),
+                "wilder_ema20": safe_ema[-1] if safe_ema else None,
+                "wilder_rsi": SafeTA.calculate_rsi(cs, 14),
+                "wilder_atr": SafeTA.calculate_atr(hs, ls, cs, 14),
+            }
+            for name, want in expected.items():
+                got = vec[name][s, t]
+                if not np.isclose(got, none_to_nan(want), rtol=1e-9, atol=1e-9, equal_nan=True):
+                    mismatches += 1
+                    if mismatches <= 10:
+                        print(f"  ❌ 币种{s} 第{t}根 {name}: 向量化={got} 批量={want}")
+    print(f"✅ 对比完成, 不一致: {mismatches}")
+
+    # 性能: 50个币种 x 3个月1分钟K线
+    n_symbols, n_candles = 50, 60 * 24 * 90
+    closes = 100 * np.cumprod(1 + rng.normal(0, 0.001, size=(n_symbols, n_candles)), axis=1)
+    highs = closes * 1.001
+    lows = closes * 0.999
+    start = time.perf_counter()
+    compute_all(highs, lows, closes, closes)
+    elapsed = time.perf_counter() - start
+    print(f"⏱️  {n_symbols}个币种 x {n_candles}根K线: {elapsed:.2f}s "
+          f"(scipy: {'是' if SCIPY_AVAILABLE else '否'})")
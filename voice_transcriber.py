@@ -2,11 +2,17 @@
 """
 语音消息转录工具 - 简化接口
 自动下载模型，支持中文语音识别
+模型由 whisper_service 常驻加载，结果按音频内容缓存
 """
 
 import os
 import sys
-import whisper
+
+from whisper_service import WHISPER_AVAILABLE, transcribe
+
+if not WHISPER_AVAILABLE:
+    # 调用方 (飞书机器人) 捕获 ImportError 后关闭语音功能
+    raise ImportError("whisper 未安装: pip install openai-whisper")
 
 # 默认模型路径
 MODEL_CACHE_DIR = os.path.expanduser("~/.openclaw/whisper_models")
@@ -30,13 +36,8 @@ def transcribe_voice(file_path, model_name="small"):
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"音频文件不存在: {file_path}")
     
-    # 加载模型（首次会自动下载）
-    model = whisper.load_model(model_name)
-    
-    # 转录，指定中文
-    result = model.transcribe(file_path, language="zh", task="transcribe")
-    
-    return result["text"].strip()
+    # 转录，指定中文 (模型首次使用时自动下载并常驻)
+    return transcribe(file_path, model_name, "zh")
 
 def quick_transcribe(file_path):
     """
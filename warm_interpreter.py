@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+预热 Python 解释器池 - code_run 的执行后端
+- 常驻 worker 进程，启动时预先导入常用模块，省掉每次冷启动 + import 的开销
+- 每个任务使用全新的全局命名空间，结束后恢复 cwd / 环境变量 / sys.path / builtins，
+  卸载任务新导入的非库模块 (改过的辅助模块下次重新加载)；预加载模块被改动时回收 worker
+- 输出按到达顺序转发，任务结束靠哨兵字节通知 (selector 等待，不轮询)
+- 超时杀掉整个进程组并补一个新 worker；内存上限用 RLIMIT_AS 限制
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import codecs
+import secrets
+import selectors
+import threading
+import subprocess
+
+DEFAULT_PRELOAD = ["json", "os", "re", "sys", "time", "math", "random", "datetime", "collections",
+                   "itertools", "functools", "pathlib", "subprocess", "csv", "hashlib", "base64",
+                   "urllib.request", "requests"]
+
+_SENTINEL_ENV = "WARM_INTERPRETER_SENTINEL"
+
+
+def _sentinel(token):
+    # 以控制字符开头，正常输出里几乎不可能出现
+    return b"\x00\x1eCODE_RUN_DONE:" + token.encode() + b":"
+
+
+# ========== Worker 进程 ==========
+def _library_prefixes():
+    """标准库 / site-packages 所在目录，这些目录下的模块任务之间可以保留"""
+    import site
+    import sysconfig
+    paths = {sys.prefix, sys.base_prefix, sys.exec_prefix}
+    for key in ("stdlib", "platstdlib", "purelib", "platlib"):
+        try:
+            paths.add(sysconfig.get_path(key))
+        except KeyError:
+            pass
+    try:
+        paths.update(site.getsitepackages())
+        paths.add(site.getusersitepackages())
+    except AttributeError:
+        pass
+    return tuple(os.path.join(os.path.abspath(p), "") for p in paths if p)
+
+
+def worker_main():
+    """worker 入口: 从控制通道逐行读取任务 JSON，执行后写出哨兵 + 结果"""
+    import builtins
+    import importlib
+    import linecache
+    import tempfile
+    import traceback
+
+    # 协议用的函数先留私有引用，用户代码改 json.dumps / os.write 不影响结果行
+    dumps, loads, write = json.dumps, json.loads, os.write
+    library = _library_prefixes()
+
+    sentinel = _sentinel(os.environ.pop(_SENTINEL_ENV))
+    memory_mb = int(os.environ.pop("WARM_INTERPRETER_MEMORY_MB", "0"))
+    preload = [m for m in os.environ.pop("WARM_INTERPRETER_PRELOAD", "").split(",") if m]
+
+    if memory_mb:
+        try:
+            import resource
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ImportError, ValueError, OSError):
+            pass
+
+    for name in preload:
+        try:
+            __import__(name)
+        except Exception:
+            pass
+
+    # 控制通道改用 stdin 的副本，用户代码看到的 stdin 是空设备
+    control = os.fdopen(os.dup(0), "rb")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+
+    base_env = dict(os.environ)
+    base_path = list(sys.path)
+    base_cwd = os.getcwd()
+    script_path = os.path.join(tempfile.gettempdir(), "code_run.ai.py")
+    argv = [script_path]
+    builtin_ns = vars(builtins)
+    base_builtins = dict(builtin_ns)
+    watched = [sys.modules[name] for name in preload if name in sys.modules] + [json, os, sys]
+
+    def done(payload):
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        write(1, sentinel + dumps(payload).encode() + b"\n")
+
+    def restore_modules(base_modules, snapshots):
+        """卸载任务新导入的非库模块；模块被替换或预加载模块被改动时返回 True (需要回收)"""
+        for name in list(sys.modules):
+            if name in base_modules:
+                if sys.modules[name] is not base_modules[name]:
+                    return True
+                continue
+            path = getattr(sys.modules[name], "__file__", None)
+            if not path or os.path.abspath(path).startswith(library):
+                continue
+            if not path.endswith((".py", ".pyc")):
+                return True     # 扩展模块不能重复加载
+            del sys.modules[name]
+        for name in [n for n in base_modules if n not in sys.modules]:
+            sys.modules[name] = base_modules[name]
+        importlib.invalidate_caches()
+        for mod, attrs in snapshots:
+            current = vars(mod)
+            if len(current) != len(attrs) or any(current.get(k) is not v for k, v in attrs.items()):
+                return True
+        return False
+
+    done({"ready": True})
+    for line in control:
+        task = loads(line)
+        exit_code, recycle = 0, False
+        argv[:] = [script_path]
+        sys.argv = argv
+        base_modules = dict(sys.modules)
+        snapshots = [(mod, dict(vars(mod))) for mod in watched]
+        try:
+            os.chdir(task.get("cwd") or base_cwd)
+            linecache.cache[script_path] = (len(task["code"]), None,
+                                            task["code"].splitlines(True), script_path)
+            namespace = {"__name__": "__main__", "__file__": script_path, "__builtins__": builtins}
+            exec(compile(task["code"], script_path, "exec"), namespace)
+        except SystemExit as e:
+            if e.code is None:
+                exit_code = 0
+            elif isinstance(e.code, int):
+                exit_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except MemoryError:
+            traceback.print_exc()
+            exit_code, recycle = 1, True
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            namespace = None
+            linecache.cache.pop(script_path, None)
+            os.environ.clear()
+            os.environ.update(base_env)
+            sys.path[:] = base_path
+            sys.argv = argv
+            for name in [n for n in builtin_ns if n not in base_builtins]:
+                del builtin_ns[name]
+            for name, value in base_builtins.items():
+                if builtin_ns.get(name) is not value:
+                    builtin_ns[name] = value
+            try:
+                os.chdir(base_cwd)
+            except OSError:
+                recycle = True
+            if restore_modules(base_modules, snapshots):
+                recycle = True
+        done({"exit_code": exit_code, "recycle": recycle})
+
+
+# ========== 父进程侧 ==========
+class _Worker:
+    def __init__(self, memory_mb, preload):
+        token = secrets.token_hex(8)
+        self.sentinel = _sentinel(token)
+        env = dict(os.environ)
+        env[_SENTINEL_ENV] = token
+        env["WARM_INTERPRETER_MEMORY_MB"] = str(memory_mb or 0)
+        env["WARM_INTERPRETER_PRELOAD"] = ",".join(preload)
+        self.proc = subprocess.Popen(
+            [sys.executable, "-X", "utf8", "-u", os.path.abspath(__file__), "--worker"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            bufsize=0, env=env, start_new_session=True
+        )
+        self.tasks = 0
+        self.buffer = b""
+        self.ready = False
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def kill(self):
+        try:
+            os.killpg(self.proc.pid, 9)
+        except (ProcessLookupError, PermissionError, AttributeError):
+            self.proc.kill()
+        self.proc.wait()
+
+    def read_until_sentinel(self, deadline, on_output=None):
+        """读取输出直到哨兵出现；返回 (输出字节, 结果dict)，超时/进程退出时结果为 None"""
+        output = []
+        with selectors.DefaultSelector() as sel:
+            sel.register(self.proc.stdout, selectors.EVENT_READ)
+            while True:
+                idx = self.buffer.find(self.sentinel)
+                if idx >= 0:
+                    head = self.buffer[:idx]
+                    end = self.buffer.find(b"\n", idx)
+                    if end >= 0:
+                        if head and on_output:
+                            on_output(head)
+                        output.append(head)
+                        payload = json.loads(self.buffer[idx + len(self.sentinel):end])
+                        self.buffer = self.buffer[end + 1:]
+                        return b"".join(output), payload
+                else:
+                    # 保留可能是半个哨兵的尾部，其余立即转发
+                    keep = len(self.sentinel) - 1
+                    if len(self.buffer) > keep:
+                        head, self.buffer = self.buffer[:-keep], self.buffer[-keep:]
+                        if on_output:
+                            on_output(head)
+                        output.append(head)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return b"".join(output), None
+                if not sel.select(remaining):
+                    continue
+                chunk = os.read(self.proc.stdout.fileno(), 65536)
+                if not chunk:
+                    output.append(self.buffer)
+                    self.buffer = b""
+                    return b"".join(output), None
+                self.buffer += chunk
+
+
+class WarmInterpreterPool:
+    """
+    预热解释器池
+
+    pool = WarmInterpreterPool(size=2)
+    pool.run("print(1 + 1)", cwd="/tmp", timeout=60)
+    -> {"status": "success", "stdout": "2\\n", "exit_code": 0}
+    """
+
+    def __init__(self, size=2, memory_mb=2048, max_tasks=50, preload=None, echo=True):
+        self.size = size
+        self.memory_mb = memory_mb
+        self.max_tasks = max_tasks
+        self.preload = DEFAULT_PRELOAD if preload is None else preload
+        self.echo = echo
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._spawned = 0
+        for _ in range(size):
+            self._spawn_async()
+
+    def _spawn_async(self):
+        with self._lock:
+            self._spawned += 1
+
+        def spawn():
+            worker = None
+            try:
+                worker = _Worker(self.memory_mb, self.preload)
+                _, payload = worker.read_until_sentinel(time.monotonic() + 60)
+                if payload and payload.get("ready"):
+                    worker.ready = True
+                    self._idle.put(worker)
+                    return
+            except Exception as e:
+                print(f"[WarmInterpreterPool] 启动解释器失败: {e}")
+            if worker:
+                worker.kill()
+            with self._lock:
+                self._spawned -= 1
+
+        threading.Thread(target=spawn, daemon=True).start()
+
+    def _retire(self, worker):
+        """丢弃 worker 并补一个新的"""
+        if worker.alive():
+            worker.kill()
+        with self._lock:
+            self._spawned -= 1
+        self._spawn_async()
+
+    def _acquire(self):
+        while True:
+            try:
+                # 有空闲 worker 时直接取，不进入带超时的等待
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                try:
+                    worker = self._idle.get(timeout=0.1) if self._spawned else None
+                except queue.Empty:
+                    worker = None
+            if worker is None:
+                if self._spawned < self.size:
+                    self._spawn_async()
+                continue
+            if worker.alive():
+                return worker
+            self._retire(worker)
+
+    def run(self, code, cwd=None, timeout=60):
+        worker = self._acquire()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        def echo(data):
+            if self.echo:
+                print(decoder.decode(data), end="", flush=True)
+
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            worker.proc.stdin.write(json.dumps({"code": code, "cwd": cwd}).encode() + b"\n")
+            worker.proc.stdin.flush()
+            raw, payload = worker.read_until_sentinel(deadline, on_output=echo)
+            if payload is not None:
+                exit_code, recycle = int(payload["exit_code"]), payload.get("recycle")
+        except Exception as e:
+            # 写不进去、结果行损坏等协议错误: 这个 worker 不能再用
+            self._retire(worker)
+            return {"status": "error", "msg": f"解释器进程异常: {e}"}
+        stdout_str = raw.decode("utf-8", errors="replace")
+
+        if payload is None:
+            timed_out = worker.alive()
+            self._retire(worker)
+            if timed_out:
+                stdout_str += "\n[Timeout Error] 超时强制终止"
+                exit_code = -9
+            else:
+                exit_code = worker.proc.returncode
+                stdout_str += f"\n[Worker Exit] 解释器进程退出 ({exit_code})"
+            return {"status": "error", "stdout": stdout_str[:8000], "exit_code": exit_code}
+
+        worker.tasks += 1
+        if recycle or worker.tasks >= self.max_tasks:
+            self._retire(worker)
+        else:
+            self._idle.put(worker)
+        return {
+            "status": "success" if exit_code == 0 else "error",
+            "stdout": stdout_str[:8000],
+            "exit_code": exit_code
+        }
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        worker_main()
+        sys.exit(0)
+
+    import tempfile
+    pool = WarmInterpreterPool(size=2, echo=False)
+    cwd = tempfile.gettempdir()
+
+    print("=== 正确性 ===")
+    print(pool.run("import os; print('cwd', os.getcwd()); x = 1", cwd=cwd))
+    print(pool.run("print('x' in globals())", cwd=cwd))
+    print(pool.run("import sys; sys.exit(3)", cwd=cwd))
+    print(pool.run("1/0", cwd=cwd)["stdout"].strip().splitlines()[-1])
+    print(pool.run("import time; time.sleep(5)", cwd=cwd, timeout=0.5))
+    print(pool.run("print('after timeout', end='')", cwd=cwd))
+    print(pool.run("x = bytearray(4 * 1024 ** 3)", cwd=cwd)["stdout"].strip().splitlines()[-1])
+    for _ in range(pool.size + 1):
+        pool.run("import json, builtins; json.dumps = lambda *a, **k: 'x'; builtins.print = None", cwd=cwd)
+    print("改 json.dumps 后:", pool.run("import json; print(json.dumps([1]))", cwd=cwd))
+    helper = os.path.join(cwd, "warm_helper_demo.py")
+    for v in (1, 2):
+        with open(helper, "w") as f:
+            f.write(f"V = {v}\n")
+        print(f"辅助模块 V={v}:", pool.run(f"import sys; sys.path.insert(0, {cwd!r}); import warm_helper_demo; print(warm_helper_demo.V)", cwd=cwd)["stdout"].strip())
+    os.remove(helper)
+
+    print("=== 每次调用开销 ===")
+    while pool._idle.qsize() < pool.size:
+        time.sleep(0.05)
+    n = 40
+    start = time.perf_counter()
+    for _ in range(n):
+        pool.run("import json; print(json.dumps({'a': 1}))", cwd=cwd)
+    print(f"预热池: {(time.perf_counter() - start) / n * 1000:.1f}ms/次")
+    start = time.perf_counter()
+    for _ in range(5):
+        subprocess.run([sys.executable, "-X", "utf8", "-u", "-c", "import json, requests; print(json.dumps({'a': 1}))"],
+                       capture_output=True)
+    print(f"冷启动: {(time.perf_counter() - start) / 5 * 1000:.1f}ms/次")
+    pool.close()
@@ -1,70 +1,221 @@
 #!/usr/bin/env python3
 """
 微信AI助手 - Agent处理脚本
-读取消息队列，调用AI处理，写入回复队列
+从消息队列取消息，调用AI处理，写入关联到原消息的回复
 
 配合 wechat_ai_queue.py 使用
+- 多个工作线程并行处理不同会话，同一发送者的消息按顺序处理 (同一时间只有一批在途)
+- 同一发送者短时间内连发的多条消息合并成一次 AI 调用
+- 每个发送者限速 (令牌桶)，超出时消息延后，延后期间到达的消息会合并进下一批
+- 消息处理完才 ack；进程中途崩溃时租约过期后消息会重投 (至少一次)
+
+运行：
+python3 wechat_agent_process.py          # 启动处理程序
+python3 wechat_agent_process.py bench    # 模拟 AI 延迟，对比不同线程数的吞吐
 """
 
 import json
 import os
+import threading
 import time
 
+from message_queue import MessageQueue
+
 QUEUE_DIR = os.path.expanduser("~/.openclaw/workspace/wechat_queue")
-IN_QUEUE = os.path.join(QUEUE_DIR, "in.jsonl")
-OUT_QUEUE = os.path.join(QUEUE_DIR, "out.jsonl")
-
-def read_queue():
-    """读取输入队列"""
-    if not os.path.exists(IN_QUEUE):
-        return []
-    
-    with open(IN_QUEUE, 'r') as f:
-        lines = f.readlines()
-    
-    # 清空输入队列
-    with open(IN_QUEUE, 'w') as f:
-        pass
-    
-    return [json.loads(line) for line in lines]
-
-def write_reply(reply):
-    """写入回复队列"""
-    with open(OUT_QUEUE, 'a') as f:
-        f.write(json.dumps({
-            'time': time.time(),
-            'reply': reply
-        }) + '\n')
+QUEUE_DB = os.path.join(QUEUE_DIR, "queue.db")
+LEGACY_IN_QUEUE = os.path.join(QUEUE_DIR, "in.jsonl")
+REPLY_TTL = 120      # 没人取的回复过期丢弃
+WORKERS = 8          # 并行处理的会话数
+LEASE_SECONDS = 180  # 一次 AI 调用的最长处理时间，超时未 ack 的消息重投
+MERGE_WINDOW = 1.0   # 第一条消息到达后等待多久，把期间连发的消息合并处理
+MAX_MERGE = 20       # 一次最多合并的消息数
+RATE_LIMIT = 6       # 每个发送者每分钟最多几次 AI 调用
+RATE_BURST = 3
+
+def migrate_legacy_queue(queue):
+    """把旧版 in.jsonl 里残留的消息导入新队列 (只做一次)"""
+    if not os.path.exists(LEGACY_IN_QUEUE) or os.path.getsize(LEGACY_IN_QUEUE) == 0:
+        return 0
+    count = 0
+    with open(LEGACY_IN_QUEUE, 'r') as f:
+        for line in f:
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            queue.put('in', msg, sender=msg.get('sender'))
+            count += 1
+    os.replace(LEGACY_IN_QUEUE, LEGACY_IN_QUEUE + '.migrated')
+    return count
 
 def process_message(msg_data):
     """处理消息 - 这里可以调用AI"""
     message = msg_data.get('message', '')
     sender = msg_data.get('sender', '微信用户')
-    
+
     print(f"\n处理消息 from {sender}: {message[:30]}...")
-    
+
     # TODO: 调用OpenClaw Agent处理
     # 这里可以接入任意AI API
-    
+
     reply = f"收到: {message[:20]}... (这是自动回复)"
     return reply
 
+def merge_messages(batch):
+    """把同一发送者的一批消息合并成一次调用的输入"""
+    payloads = [m['payload'] for m in batch]
+    merged = dict(payloads[-1])
+    merged['message'] = '\n'.join(p.get('message', '') for p in payloads if p.get('message'))
+    merged['count'] = len(payloads)
+    return merged
+
+
+class RateLimiter:
+    """每个发送者一个令牌桶"""
+
+    def __init__(self, per_minute=RATE_LIMIT, burst=RATE_BURST):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """拿到令牌返回 0，否则返回还需等待的秒数"""
+        with self._lock:
+            now = time.time()
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+
+class AgentWorkerPool:
+    """
+    pool = AgentWorkerPool(queue, handler=process_message, workers=8)
+    pool.start(); ...; pool.stop()
+    """
+
+    def __init__(self, queue, handler=process_message, workers=WORKERS,
+                 merge_window=MERGE_WINDOW, limiter=None):
+        self.queue = queue
+        self.handler = handler
+        self.workers = workers
+        self.merge_window = merge_window
+        self.limiter = limiter or RateLimiter()
+        self.stats = {'batches': 0, 'messages': 0, 'errors': 0, 'deferred': 0}
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"agent-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self.queue.get_batch('in', max_items=MAX_MERGE, timeout=1)
+            if batch:
+                self._handle(batch)
+
+    def _handle(self, batch):
+        sender = batch[0]['sender']
+        # 合并窗口: 第一条到达后 merge_window 秒内连发的消息一起处理
+        wait = batch[0]['created_at'] + self.merge_window - time.time()
+        if wait > 0 and len(batch) < MAX_MERGE:
+            time.sleep(wait)
+            batch += self.queue.claim_sender('in', sender, MAX_MERGE - len(batch))
+
+        delay = self.limiter.acquire(sender)
+        if delay:
+            # 超出速率: 整批延后，延后期间该发送者的新消息不会被别的线程取走，下次一起合并
+            for msg in batch:
+                self.queue.nack(msg['id'], delay=delay)
+            self._count('deferred')
+            return
+
+        try:
+            reply = self.handler(merge_messages(batch))
+        except Exception as e:
+            print(f"❌ 处理失败 (稍后重试): {e}")
+            retry = min(2 ** batch[0]['attempts'], 60)
+            for msg in batch:
+                self.queue.nack(msg['id'], delay=retry)
+            self._count('errors')
+            return
+
+        to = batch[-1]['payload'].get('to')
+        self.queue.reply(batch, {'time': time.time(), 'reply': reply, 'to': to, 'sender': sender}, ttl=REPLY_TTL)
+        self._count('batches')
+        self._count('messages', len(batch))
+        print(f"✅ 已回复 {sender} ({len(batch)} 条合并): {reply[:30]}...")
+
 def main():
     print("=" * 50)
     print("微信AI助手 - Agent处理程序")
     print("=" * 50)
-    print(f"\n监控队列: {IN_QUEUE}")
+
+    queue = MessageQueue(QUEUE_DB, lease_seconds=LEASE_SECONDS)
+    migrated = migrate_legacy_queue(queue)
+    if migrated:
+        print(f"\n导入旧队列消息: {migrated} 条")
+    print(f"\n监控队列: {QUEUE_DB}")
+    print(f"工作线程: {WORKERS}")
     print("按 Ctrl+C 退出\n")
-    
-    while True:
-        messages = read_queue()
-        
-        for msg in messages:
-            reply = process_message(msg)
-            write_reply(reply)
-            print(f"✅ 已回复: {reply[:30]}...")
-        
-        time.sleep(2)
+
+    pool = AgentWorkerPool(queue)
+    pool.start()
+    try:
+        while True:
+            time.sleep(60)
+            print(f"📊 {pool.stats}, 待处理 {queue.pending('in')} 条")
+    except KeyboardInterrupt:
+        pool.stop(timeout=5)
+
+def benchmark():
+    """10 个会话各发 10 条，模拟 AI 调用耗时 0.2 秒"""
+    import shutil
+    import tempfile
+
+    def slow_ai(msg_data):
+        time.sleep(0.2)
+        return f"收到 {msg_data['count']} 条"
+
+    for workers in (1, 4, 16):
+        directory = tempfile.mkdtemp()
+        queue = MessageQueue(os.path.join(directory, "queue.db"), lease_seconds=LEASE_SECONDS)
+        ids = []
+        for i in range(10):
+            for sender in range(10):
+                ids.append(queue.put('in', {'message': f"{i}", 'sender': f"u{sender}"}, sender=f"u{sender}"))
+        pool = AgentWorkerPool(queue, handler=slow_ai, workers=workers, merge_window=0,
+                               limiter=RateLimiter(per_minute=600, burst=100))
+        start = time.time()
+        pool.start()
+        while queue.pending('in'):
+            time.sleep(0.01)
+        elapsed = time.time() - start
+        pool.stop()
+        print(f"{workers:2d} 线程: 100 条消息 {elapsed:.2f}s, AI 调用 {pool.stats['batches']} 次")
+        shutil.rmtree(directory)
 
 if __name__ == '__main__':
-    main()
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark()
+    else:
+        main()
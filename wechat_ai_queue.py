@@ -2,66 +2,57 @@
 """
 微信AI助手 - 消息队列版本
 原理：
-1. 微信收到消息 -> 写入本地消息队列文件
-2. OpenClaw Agent通过读取队列处理消息
-3. Agent将回复写入回复队列
-4. 微信读取回复队列发送回复
+1. 微信收到消息 -> 写入本地消息队列 (in 主题)，得到消息 ID
+2. OpenClaw Agent从队列取消息处理 (wechat_agent_process.py，多会话并行)
+3. Agent将回复写入 out 主题，关联到原消息 ID，带上回复对象
+4. 回复线程取到回复立即发送；消息回调不等待，一个慢会话不影响其他会话
 
-这个版本不需要复杂配置，直接用文件系统通信
+这个版本不需要复杂配置，队列是本地 SQLite 文件 (见 message_queue.py)
 """
 
 import itchat
 from itchat.content import *
-import json
 import os
+import threading
 import time
 
+from message_queue import MessageQueue, QueueFull
+
 # 配置
 QUEUE_DIR = os.path.expanduser("~/.openclaw/workspace/wechat_queue")
-IN_QUEUE = os.path.join(QUEUE_DIR, "in.jsonl")
-OUT_QUEUE = os.path.join(QUEUE_DIR, "out.jsonl")
-
-# 确保队列目录存在
-os.makedirs(QUEUE_DIR, exist_ok=True)
+QUEUE_DB = os.path.join(QUEUE_DIR, "queue.db")
+MAX_PENDING = 200       # 待处理消息上限，超过后新消息直接提示繁忙
 
-# 创建队列文件(如果不存在)
-for f in [IN_QUEUE, OUT_QUEUE]:
-    if not os.path.exists(f):
-        with open(f, 'w') as fp:
-            pass
+queue = MessageQueue(QUEUE_DB, max_pending=MAX_PENDING)
 
 myUserName = None
 
 # 发送消息到队列
-def queue_in(message, sender):
-    """收到微信消息，写入输入队列"""
-    with open(IN_QUEUE, 'a') as f:
-        f.write(json.dumps({
-            'time': time.time(),
-            'sender': sender,
-            'message': message
-        }) + '\n')
+def queue_in(message, sender, to_user):
+    """收到微信消息，写入输入队列，返回消息 ID (按会话 to_user 保序)"""
+    return queue.put('in', {
+        'time': time.time(),
+        'sender': sender,
+        'to': to_user,
+        'message': message
+    }, sender=to_user, timeout=1)
 
 # 从队列读取回复
-def queue_out():
-    """从输出队列读取回复"""
-    if not os.path.exists(OUT_QUEUE):
-        return None
-    
-    with open(OUT_QUEUE, 'r') as f:
-        lines = f.readlines()
-    
-    if not lines:
-        return None
-    
-    # 读取最后一行
-    last = json.loads(lines[-1])
-    
-    # 清空队列
-    with open(OUT_QUEUE, 'w') as f:
-        pass
-    
-    return last.get('reply')
+def reply_loop():
+    """回复线程: 取到回复立即发给对应会话，发送成功才 ack"""
+    while True:
+        msg = queue.get('out', timeout=5)
+        if msg is None:
+            continue
+        reply = msg['payload']
+        try:
+            itchat.send(reply['reply'], reply['to'])
+        except Exception as e:
+            print(f"❌ 发送失败 (稍后重试): {e}")
+            queue.nack(msg['id'], delay=2)
+            continue
+        queue.ack(msg['id'])
+        print(f"✅ 回复 {reply.get('sender', '')}: {reply['reply'][:30]}...")
 
 # 处理微信消息
 @itchat.msg_register([TEXT, PICTURE, RECORDING, VIDEO])
@@ -78,19 +69,11 @@ def handle_msg(msg):
     
     print(f"\n📱 收到: {sender}: {msg_text[:30]}...")
     
-    # 写入输入队列
-    queue_in(msg_text, sender)
-    
-    # 等待Agent处理 (最多30秒)
-    for _ in range(30):
-        time.sleep(1)
-        reply = queue_out()
-        if reply:
-            itchat.send(reply, msg['FromUserName'])
-            print(f"✅ 回复: {reply[:30]}...")
-            return
-    
-    print("⏰ 超时无回复")
+    # 写入输入队列，回复由 reply_loop 发送
+    try:
+        queue_in(msg_text, sender, msg['FromUserName'])
+    except QueueFull:
+        print("🚦 队列已满，稍后再试")
 
 def main():
     global myUserName
@@ -106,8 +89,10 @@ def main():
     print(f"✅ 登录成功!")
     
     print(f"\n📂 消息队列:")
-    print(f"   输入: {IN_QUEUE}")
-    print(f"   输出: {OUT_QUEUE}")
+    print(f"   {QUEUE_DB}")
+    print(f"   待处理: {queue.pending('in')} 条")
+    
+    threading.Thread(target=reply_loop, name="wechat-reply", daemon=True).start()
     
     print("\n" + "=" * 50)
     print("已启动! 发送消息测试")
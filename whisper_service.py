@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+常驻语音转录服务 - Whisper 模型只加载一次
+- 工作进程池: 每个进程启动时加载模型并常驻，CPU 核按进程平分 (torch 线程数)
+- ffmpeg 流式解码: 边解码边做 VAD 切段，切好的段立即送去转录，不用等整段解码完
+- VAD: 按 30ms 帧能量找停顿，在停顿处切成 ≤30 秒的段 (Whisper 的窗口)，纯静音段直接跳过
+- 批处理: 并发请求的音频段按 (模型, 语言) 攒批，一次 whisper.decode 解一批
+- 结果缓存: 按音频内容哈希 + 模型 + 语言缓存，同一段语音只转录一次
+- 跨进程共用: serve 模式监听 Unix socket，transcribe() 优先连服务，连不上就在本进程启动服务
+
+运行：
+python3 whisper_service.py serve                    # 启动常驻服务
+python3 whisper_service.py <音频文件> [模型] [语言]   # 转录 (有服务时走服务)
+python3 whisper_service.py bench [音频文件...]       # tiny/base/small 的单条延迟和吞吐
+WHISPER_MODEL_DIR=<目录> python3 whisper_service.py serve   # 离线: 从目录加载 <模型名>.pt
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import sqlite3
+import hashlib
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    import whisper
+    WHISPER_AVAILABLE = True
+except ImportError:
+    WHISPER_AVAILABLE = False
+
+SAMPLE_RATE = 16000
+DEFAULT_MODEL = "small"
+DEFAULT_LANGUAGE = "zh"
+SOCKET_PATH = os.path.expanduser("~/.openclaw/whisper.sock")
+CACHE_DB = os.path.expanduser("~/.openclaw/whisper_cache.db")
+MODEL_DIR = os.environ.get("WHISPER_MODEL_DIR")   # 离线部署: 目录下放 <模型名>.pt，不再联网下载
+
+# VAD 切段
+FRAME_MS = 30
+SPEECH_DB = -40          # 帧能量高于此值 (dBFS) 视为有声
+MIN_SILENCE = 0.5        # 停顿至少多长才能在此切开
+MIN_CHUNK = 10.0         # 段长达到后遇到停顿就切
+MAX_CHUNK = 30.0         # 段长上限 (Whisper 窗口)，没有停顿也强制切
+
+# 批处理
+BATCH_SIZE = 8
+BATCH_WINDOW = 0.05      # 攒批最多等待的秒数
+NO_SPEECH_PROB = 0.6     # 高于此值的段当作静音丢弃 (避免 Whisper 对噪声编造文字)
+
+
+# ========== 解码 + VAD ==========
+def stream_pcm(path, block_seconds=1.0):
+    """ffmpeg 解码成 16kHz 单声道，按块产出 float32 数组"""
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0", "-i", path,
+           "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    block = int(SAMPLE_RATE * block_seconds) * 2
+    rest = b""
+    try:
+        while True:
+            data = proc.stdout.read(block)
+            if not data:
+                break
+            data = rest + data
+            usable = len(data) // 2 * 2
+            rest = data[usable:]
+            yield np.frombuffer(data[:usable], np.int16).astype(np.float32) / 32768.0
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read().decode(errors="replace")
+        proc.stderr.close()
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg 解码失败: {stderr.strip()[:200]}")
+
+
+class VADSegmenter:
+    """
+    seg = VADSegmenter()
+    for block in stream_pcm(path):
+        for chunk in seg.feed(block): ...
+    for chunk in seg.flush(): ...
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, min_chunk=MIN_CHUNK, max_chunk=MAX_CHUNK, min_silence=MIN_SILENCE):
+        self.frame = sample_rate * FRAME_MS // 1000
+        self.min_frames = int(min_chunk * 1000 / FRAME_MS)
+        self.max_frames = int(max_chunk * 1000 / FRAME_MS)
+        self.silence_frames = int(min_silence * 1000 / FRAME_MS)
+        self._buf = np.zeros(0, np.float32)
+
+    def _voiced(self, samples):
+        n = len(samples) // self.frame
+        frames = samples[:n * self.frame].reshape(n, self.frame)
+        db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        return db > SPEECH_DB
+
+    def _cut_point(self, voiced):
+        """最后一个足够长的停顿的中点 (帧号)，在 min_frames 之后；没有返回 None"""
+        run = 0
+        best = None
+        for i in range(len(voiced) - 1, self.min_frames - 1, -1):
+            if voiced[i]:
+                if run >= self.silence_frames:
+                    best = i + 1 + run // 2
+                    break
+                run = 0
+            else:
+                run += 1
+        return best
+
+    def _emit(self, samples):
+        """整段都没有声音的不送去转录"""
+        return [samples] if len(samples) and self._voiced(samples).any() else []
+
+    def feed(self, samples):
+        self._buf = np.concatenate([self._buf, samples])
+        chunks = []
+        while True:
+            voiced = self._voiced(self._buf)
+            if len(voiced) < self.min_frames:
+                break
+            cut = self._cut_point(voiced[:self.max_frames])
+            if cut is None:
+                if len(voiced) < self.max_frames:
+                    break
+                cut = self.max_frames
+            chunks += self._emit(self._buf[:cut * self.frame])
+            self._buf = self._buf[cut * self.frame:]
+        return chunks
+
+    def flush(self):
+        chunks = self._emit(self._buf)
+        self._buf = np.zeros(0, np.float32)
+        return chunks
+
+
+# ========== 工作进程 ==========
+_MODELS = {}
+
+
+def _worker_init(models, threads):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    for name in models:
+        _load_model(name)
+
+
+def _open_model(name):
+    """MODEL_DIR 下有 <name>.pt 时直接加载该文件，否则由 whisper 按名字下载/读取默认缓存"""
+    if MODEL_DIR:
+        path = os.path.join(os.path.expanduser(MODEL_DIR), f"{name}.pt")
+        if os.path.isfile(path):
+            return whisper.load_model(path)
+    return whisper.load_model(name)
+
+
+def _load_model(name):
+    if name not in _MODELS:
+        _MODELS[name] = _open_model(name)
+    return _MODELS[name]
+
+
+def _decode_batch(model_name, language, chunks):
+    """一批音频段 -> 一次 whisper.decode"""
+    import torch
+    model = _load_model(model_name)
+    mel = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(chunk)), n_mels=model.dims.n_mels)
+        for chunk in chunks
+    ]).to(model.device)
+    options = whisper.DecodingOptions(
+        language=language, task="transcribe", without_timestamps=True, fp16=model.device.type == "cuda"
+    )
+    results = whisper.decode(model, mel, options)
+    return ["" if r.no_speech_prob > NO_SPEECH_PROB else r.text.strip() for r in results]
+
+
+def _warmup():
+    return True
+
+
+# ========== 服务 ==========
+class TranscriptionService:
+    """
+    service = TranscriptionService(models=("small",), workers=2)
+    service.transcribe("voice.ogg") -> "转录文本"
+    """
+
+    def __init__(self, models=(DEFAULT_MODEL,), workers=None, batch_size=BATCH_SIZE,
+                 batch_window=BATCH_WINDOW, cache_path=CACHE_DB):
+        if not WHISPER_AVAILABLE:
+            raise RuntimeError("Whisper 未安装: pip install openai-whisper")
+        cpus = os.cpu_count() or 1
+        self.workers = workers or min(4, max(1, cpus // 2))
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_init,
+            initargs=(tuple(models), max(1, cpus // self.workers))
+        )
+        # 预热: 拉起工作进程并加载模型，第一条请求不用等加载
+        for f in [self.pool.submit(_warmup) for _ in range(self.workers)]:
+            f.result()
+        self._queue = queue.Queue()
+        # 进行中的批次上限: 工作进程都忙时让请求在队列里攒成更大的批
+        self._slots = threading.Semaphore(self.workers * 2)
+        self._cache_lock = threading.Lock()
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._cache = sqlite3.connect(cache_path, check_same_thread=False)
+        self._cache.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts (hash TEXT, model TEXT, language TEXT, text TEXT, "
+            "created_at REAL, PRIMARY KEY (hash, model, language))"
+        )
+        self.stats = {"requests": 0, "cache_hits": 0, "chunks": 0, "batches": 0}
+        threading.Thread(target=self._batch_loop, name="whisper-batcher", daemon=True).start()
+
+    # ---------- 缓存 ----------
+    def _cached(self, digest, model, language):
+        with self._cache_lock:
+            row = self._cache.execute(
+                "SELECT text FROM transcripts WHERE hash=? AND model=? AND language=?", (digest, model, language)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _store(self, digest, model, language, text):
+        with self._cache_lock:
+            self._cache.execute(
+                "INSERT OR REPLACE INTO transcripts VALUES (?, ?, ?, ?, ?)", (digest, model, language, text, time.time())
+            )
+            self._cache.commit()
+
+    # ---------- 攒批 ----------
+    def _submit_chunk(self, model, language, samples):
+        future = Future()
+        self._queue.put(((model, language), samples, future))
+        self.stats["chunks"] += 1
+        return future
+
+    def _batch_loop(self):
+        pending = {}    # (模型, 语言) -> [(samples, future)]
+        while True:
+            timeout = self.batch_window if pending else None
+            try:
+                key, samples, future = self._queue.get(timeout=timeout)
+                pending.setdefault(key, []).append((samples, future))
+                deadline = time.time() + self.batch_window
+                # 攒批: 窗口内继续收，满一批就提前发
+                while len(pending[key]) < self.batch_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    key2, samples, future = self._queue.get(timeout=remaining)
+                    pending.setdefault(key2, []).append((samples, future))
+            except queue.Empty:
+                pass
+            for key in list(pending):
+                items = pending.pop(key)
+                for i in range(0, len(items), self.batch_size):
+                    self._dispatch(key, items[i:i + self.batch_size])
+
+    def _dispatch(self, key, items):
+        self._slots.acquire()
+        self.stats["batches"] += 1
+        batch = self.pool.submit(_decode_batch, key[0], key[1], [samples for samples, _ in items])
+
+        def done(f):
+            self._slots.release()
+            try:
+                texts = f.result()
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                return
+            for (_, future), text in zip(items, texts):
+                future.set_result(text)
+
+        batch.add_done_callback(done)
+
+    # ---------- 接口 ----------
+    def _join(self, texts, language):
+        sep = "" if language in ("zh", "ja") else " "
+        return sep.join(t for t in texts if t).strip()
+
+    def transcribe(self, path, model=DEFAULT_MODEL, language=DEFAULT_LANGUAGE):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"音频文件不存在: {path}")
+        self.stats["requests"] += 1
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        digest = digest.hexdigest()
+        text = self._cached(digest, model, language)
+        if text is not None:
+            self.stats["cache_hits"] += 1
+            return text
+        # 边解码边切段，切好的段立即进入批处理队列
+        segmenter = VADSegmenter()
+        futures = []
+        for block in stream_pcm(path):
+            futures += [self._submit_chunk(model, language, c) for c in segmenter.feed(block)]
+        futures += [self._submit_chunk(model, language, c) for c in segmenter.flush()]
+        text = self._join([f.result() for f in futures], language)
+        self._store(digest, model, language, text)
+        return text
+
+    def transcribe_array(self, samples, model=DEFAULT_MODEL, language=DEFAULT_LANGUAGE):
+        """直接转录 16kHz float32 数组 (不走 ffmpeg)"""
+        self.stats["requests"] += 1
+        samples = np.asarray(samples, np.float32)
+        digest = hashlib.sha256(samples.tobytes()).hexdigest()
+        text = self._cached(digest, model, language)
+        if text is not None:
+            self.stats["cache_hits"] += 1
+            return text
+        segmenter = VADSegmenter()
+        chunks = segmenter.feed(samples) + segmenter.flush()
+        futures = [self._submit_chunk(model, language, c) for c in chunks]
+        text = self._join([f.result() for f in futures], language)
+        self._store(digest, model, language, text)
+        return text
+
+    def close(self):
+        self.pool.shutdown()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service(models=(DEFAULT_MODEL,)):
+    """本进程内的常驻服务 (首次调用时启动)"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TranscriptionService(models=models)
+        return _service
+
+
+# ========== Unix socket ==========
+def serve(socket_path=SOCKET_PATH, models=(DEFAULT_MODEL,)):
+    """常驻服务: 每行一个 JSON 请求 {"path", "model", "language"}，回一行 {"text"} 或 {"error"}"""
+    import socketserver
+
+    service = get_service(models)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    req = json.loads(line)
+                    text = service.transcribe(req["path"], req.get("model", DEFAULT_MODEL),
+                                              req.get("language", DEFAULT_LANGUAGE))
+                    resp = {"text": text}
+                except Exception as e:
+                    resp = {"error": str(e)}
+                self.wfile.write((json.dumps(resp, ensure_ascii=False) + "\n").encode())
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+    print(f"🎤 转录服务已启动: {socket_path} (模型 {', '.join(models)}, {service.workers} 个工作进程)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+        service.close()
+
+
+def transcribe(path, model=DEFAULT_MODEL, language=DEFAULT_LANGUAGE, timeout=300):
+    """转录音频文件: 有常驻服务时走 socket，否则在本进程启动服务"""
+    path = os.path.abspath(path)
+    if hasattr(socket, "AF_UNIX") and os.path.exists(SOCKET_PATH):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(timeout)
+                sock.connect(SOCKET_PATH)
+                sock.sendall((json.dumps({"path": path, "model": model, "language": language}) + "\n").encode())
+                resp = json.loads(sock.makefile("rb").readline())
+            if "error" in resp:
+                raise RuntimeError(resp["error"])
+            return resp["text"]
+        except (ConnectionRefusedError, FileNotFoundError):
+            pass    # socket 文件残留但服务没在跑
+    return get_service((model,)).transcribe(path, model, language)
+
+
+# ========== 基准 ==========
+def _synthetic_clip(seconds, seed):
+    """带停顿的合成音频 (2 秒有声 + 0.6 秒静音交替)"""
+    rnd = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    voiced = (t % 2.6) < 2.0
+    tone = 0.2 * np.sin(2 * np.pi * (180 + 40 * np.sin(2 * np.pi * 0.5 * t)) * t)
+    return ((tone + 0.02 * rnd.standard_normal(len(t))) * voiced).astype(np.float32)
+
+
+def benchmark(paths=()):
+    import shutil
+    import tempfile
+
+    clips = []
+    for p in paths:
+        clips.append(np.concatenate(list(stream_pcm(p))))
+    if not clips:
+        clips = [_synthetic_clip(s, i) for i, s in enumerate((8, 15, 45, 8, 20, 60, 10, 30))]
+    total_audio = sum(len(c) for c in clips) / SAMPLE_RATE
+    print(f"{len(clips)} 段音频，共 {total_audio:.0f} 秒")
+
+    for name in ("tiny", "base", "small"):
+        # 旧方式: 每条消息都 load_model + transcribe
+        start = time.time()
+        model = _open_model(name)
+        load = time.time() - start
+        start = time.time()
+        model.transcribe(clips[0], language=DEFAULT_LANGUAGE, fp16=False)
+        old = load + time.time() - start
+        del model
+
+        start = time.time()
+        cache_dir = tempfile.mkdtemp()
+        service = TranscriptionService(models=(name,), cache_path=os.path.join(cache_dir, "cache.db"))
+        startup = time.time() - start
+
+        start = time.time()
+        service.transcribe_array(clips[0] + 1e-6, name)   # 微扰避开后面并发测试写入的缓存
+        single = time.time() - start
+
+        # 并发吞吐: 所有片段同时提交，跨请求攒批
+        from concurrent.futures import ThreadPoolExecutor
+        start = time.time()
+        with ThreadPoolExecutor(len(clips)) as ex:
+            list(ex.map(lambda c: service.transcribe_array(c, name), clips))
+        elapsed = time.time() - start
+
+        start = time.time()
+        service.transcribe_array(clips[0], name)
+        cached = time.time() - start
+        service.close()
+        shutil.rmtree(cache_dir)
+        print(f"{name:5s}: 旧方式单条 {old:.2f}s (加载 {load:.2f}s) | 服务启动 {startup:.2f}s, 单条 {single:.2f}s, "
+              f"缓存命中 {cached * 1000:.1f}ms | 并发 {len(clips)} 条 {elapsed:.2f}s, "
+              f"{total_audio / elapsed:.1f}x 实时, {service.stats['batches']} 批")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+    elif sys.argv[1] == "serve":
+        serve(models=tuple(sys.argv[2:]) or (DEFAULT_MODEL,))
+    elif sys.argv[1] == "bench":
+        benchmark(sys.argv[2:])
+    else:
+        model = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_MODEL
+        language = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_LANGUAGE
+        print(transcribe(sys.argv[1], model, language))
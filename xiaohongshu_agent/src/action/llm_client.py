@@ -4,9 +4,13 @@ LLM 客户端 - MiniMax API
 """
 
 import os
-import json
+import sys
 import logging
-import requests
+from pathlib import Path
+
+# 共享流式客户端在仓库根目录
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+from llm_stream import StreamingLLMClient
 
 logger = logging.getLogger("xhs_agent.llm")
 
@@ -19,18 +23,24 @@ class LLMClient:
         self.api_key = config.get('api_key') or os.getenv('MINIMAX_API_KEY')
         self.base_url = config.get('base_url', 'https://api.minimax.chat/v1')
         self.model = config.get('model', 'MiniMax-M2.1')
+        self.timeout = config.get('timeout', 30)
+        self.client = None  # 首次调用时创建，之后复用连接
+        self.last_metrics = None
+    
+    def _get_client(self):
+        if self.client is None:
+            self.client = StreamingLLMClient(self.base_url, headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }, read_timeout=self.timeout)
+        return self.client
     
-    def generate(self, prompt: str, max_tokens: int = 500, temperature: float = 0.7) -> str:
-        """生成文本"""
+    def generate(self, prompt: str, max_tokens: int = 500, temperature: float = 0.7, on_text=None) -> str:
+        """生成文本 (流式，on_text 可逐段接收输出)"""
         if not self.api_key:
             logger.warning("未配置 API Key")
             return ""
         
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
         data = {
             "model": self.model,
             "messages": [{"role": "user", "content": prompt}],
@@ -39,19 +49,15 @@ class LLMClient:
         }
         
         try:
-            response = requests.post(
-                f"{self.base_url}/text/chatcompletion_v2",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            
-            result = response.json()
+            result = self._get_client().stream_openai("/text/chatcompletion_v2", data, on_text=on_text)
+            self.last_metrics = result['metrics']
+            logger.debug(f"LLM 首token {result['metrics']['ttft_ms']}ms, "
+                         f"{result['metrics']['tokens_per_sec']} tok/s")
             
-            if result.get('choices'):
-                return result['choices'][0]['message']['content']
+            if result['content']:
+                return result['content']
             else:
-                logger.error(f"LLM返回错误: {result}")
+                logger.error(f"LLM返回为空: {result['stop_reason']}")
                 return ""
                 
         except Exception as e:
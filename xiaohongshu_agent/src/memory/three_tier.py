@@ -3,12 +3,17 @@
 ThreeTierMemory - 三层记忆系统
 """
 
+import sys
 import json
 import time
 import sqlite3
 import logging
 from pathlib import Path
 
+# 共享向量索引在仓库根目录
+sys.path.insert(0, str(Path(__file__).resolve().parents[3]))
+from vector_index import VectorIndex
+
 logger = logging.getLogger("xhs_agent.memory")
 
 
@@ -24,6 +29,11 @@ class ThreeTierMemory:
         self.db = sqlite3.connect(db_path, check_same_thread=False)
         self._init_tables()
         
+        # 工作记忆的向量索引 (int8 memmap)，用于语义召回
+        vector_dir = config.get('vector_dir') or str(Path(db_path).parent / 'memory_vectors')
+        self.vectors = VectorIndex(vector_dir, dtype='int8')
+        self._sync_vectors()
+        
         # 短期记忆
         self.short_term = {}
     
@@ -63,6 +73,17 @@ class ThreeTierMemory:
         
         self.db.commit()
     
+    def _sync_vectors(self):
+        """把尚未入索引的工作记忆补进向量索引"""
+        rows = self.db.execute("SELECT id, content, topic, expires_at FROM working_memory").fetchall()
+        missing = [
+            (f"working:{r[0]}", f"{r[2]} {r[1]}", {"id": r[0], "topic": r[2], "expires_at": r[3]})
+            for r in rows if f"working:{r[0]}" not in self.vectors
+        ]
+        if missing:
+            self.vectors.add_many(missing)
+            logger.info(f"向量索引补录 {len(missing)} 条工作记忆")
+    
     def remember(self, content: str, topic: str = "", importance: float = 0.5):
         """记忆内容"""
         # 短期
@@ -70,11 +91,24 @@ class ThreeTierMemory:
         
         # 工作记忆
         if importance > 0.6:
-            self.db.execute(
+            expires_at = time.time() + 7 * 86400
+            cur = self.db.execute(
                 "INSERT INTO working_memory (content, topic, importance, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
-                (content, topic, importance, time.time(), time.time() + 7 * 86400)
+                (content, topic, importance, time.time(), expires_at)
             )
             self.db.commit()
+            self.vectors.add(f"working:{cur.lastrowid}", f"{topic} {content}",
+                             {"id": cur.lastrowid, "topic": topic, "expires_at": expires_at})
+    
+    def recall(self, query: str, k: int = 5, min_score: float = 0.15) -> list:
+        """语义召回未过期的工作记忆，只返回最相关的 k 条"""
+        now = time.time()
+        hits = self.vectors.search(query, k=k, min_score=min_score,
+                                   where=lambda meta: meta.get("expires_at", 0) > now)
+        return [
+            {"content": h["text"][len(h["meta"]["topic"]) + 1:], "topic": h["meta"]["topic"], "score": h["score"]}
+            for h in hits
+        ]
     
     def recall_recent_topics(self, days: int = 7) -> list:
         """检索近期话题"""
@@ -112,11 +146,17 @@ class ThreeTierMemory:
     
     def compress_to_long_term(self):
         """压缩到长期记忆"""
+        now = time.time()
+        expired = self.db.execute("SELECT id FROM working_memory WHERE expires_at < ?", (now,)).fetchall()
         self.db.execute(
             "DELETE FROM working_memory WHERE expires_at < ?",
-            (time.time(),)
+            (now,)
         )
         self.db.commit()
+        for (row_id,) in expired:
+            self.vectors.remove(f"working:{row_id}")
+        # 过期条目只在向量索引里留删除标记，累积多了重写一次
+        self.vectors.maybe_compact()
     
     def close(self):
         """关闭"""